@@ -0,0 +1,193 @@
+# 仕様
+#1. Text2CypherCache などのキャッシュの永続化先（第2ティア）として使うストレージバックエンド
+#2. バックエンドは get / set / delete / clear / hottest / record_hits / get_stats を持つオブジェクトなら差し替え可能
+#3. SQLiteCacheBackend は WAL モードで複数プロセスから安全に読み書きできる
+#4. ディスク上でも LRU（last_access）と TTL で削除する
+#5. メモリのティアで返したヒットも record_hits でまとめて反映する（hottest と削除の順番が実際の使用に合うように）
+#6. 既定のファイルはカレントディレクトリではなく、このモジュールの隣（DEFAULT_CACHE_PATH）
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_rag_cache.sqlite")
+
+
+def _to_json(value: Any) -> Any:
+    # pydantic モデルなどは dict に変換して保存
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    return str(value)
+
+
+class SQLiteCacheBackend:
+    def __init__(
+        self,
+        path: str,
+        namespace: str = 'text2cypher',
+        maxsize: int = 10000,
+        ttl: Optional[float] = None,
+        timeout: float = 30.0,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # sqlite3 の接続はスレッドごとに持つ
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_access ON cache_entries(namespace, last_access)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expiry_cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float('-inf')
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None or row[1] < self._expiry_cutoff():
+            self.misses += 1
+            return None
+        conn.execute(
+            "UPDATE cache_entries SET last_access = ?, hits = hits + 1 WHERE namespace = ? AND key = ?",
+            (time.time(), self.namespace, key),
+        )
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        conn = self._connect()
+        now = time.time()
+        value = json.dumps(entry, default=_to_json)
+        # BEGIN IMMEDIATE で書き込みロックを取り、挿入と削除を1トランザクションにする
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                INSERT INTO cache_entries (namespace, key, value, created_at, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT(namespace, key) DO UPDATE SET
+                    value = excluded.value, created_at = excluded.created_at, last_access = excluded.last_access
+                """,
+                (self.namespace, key, value, entry.get('timestamp', now), now),
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self.ttl is not None:
+            cursor = conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?",
+                (self.namespace, self._expiry_cutoff()),
+            )
+            self.expirations += max(cursor.rowcount, 0)
+        (size,) = conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        overflow = size - self.maxsize
+        if overflow > 0:
+            # 最も長くアクセスされていないエントリから削除
+            cursor = conn.execute(
+                """
+                DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache_entries WHERE namespace = ? ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (self.namespace, self.namespace, overflow),
+            )
+            self.evictions += max(cursor.rowcount, 0)
+
+    def record_hits(self, hits: Dict[str, Tuple[int, float]]) -> None:
+        """Add hits served by a memory tier in front of this backend: key -> (count, last access time)."""
+        if not hits:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                UPDATE cache_entries SET hits = hits + ?, last_access = MAX(last_access, ?)
+                WHERE namespace = ? AND key = ?
+                """,
+                [(count, last_access, self.namespace, key) for key, (count, last_access) in hits.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str) -> None:
+        self._connect().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def hottest(self, n: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Return up to n unexpired entries, most frequently / recently used first."""
+        rows = self._connect().execute(
+            """
+            SELECT key, value FROM cache_entries
+            WHERE namespace = ? AND created_at >= ?
+            ORDER BY hits DESC, last_access DESC LIMIT ?
+            """,
+            (self.namespace, self._expiry_cutoff(), n),
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def __len__(self) -> int:
+        (size,) = self._connect().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return size
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'namespace': self.namespace,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,168 @@
+# 仕様
+#1. キャッシュのキーだけを管理し、どのキーを削除するかを決める削除ポリシー
+#2. access（ヒット時・既存のキーの更新時）/ insert（新規）/ evict（削除対象を選んで取り除く）/ remove（明示的な削除）
+#3. LRU: 最も長く使われていないキーを削除
+#4. LFU: 最も使用回数の少ないキーを削除（同じ回数なら古い方）
+#5. ARC: 1回だけ使われたキー（T1）と2回以上使われたキー（T2）の比率を、ゴーストリストで適応的に調整
+#        → 1回きりの質問が大量に来ても、よく使われる質問が押し出されにくい
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional
+
+
+class LRUPolicy:
+    name = 'lru'
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.keys: OrderedDict[str, None] = OrderedDict()
+
+    def access(self, key: str) -> None:
+        self.keys.move_to_end(key)
+
+    def insert(self, key: str) -> None:
+        self.keys[key] = None
+
+    def evict(self, incoming_key: Optional[str] = None) -> Optional[str]:
+        if not self.keys:
+            return None
+        key, _ = self.keys.popitem(last=False)
+        return key
+
+    def remove(self, key: str) -> None:
+        self.keys.pop(key, None)
+
+    def clear(self) -> None:
+        self.keys.clear()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class LFUPolicy:
+    name = 'lfu'
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.freq: Dict[str, int] = {}
+        # 使用回数ごとのキー（同じ回数の中では古い順）
+        self.buckets: Dict[int, OrderedDict[str, None]] = defaultdict(OrderedDict)
+        self.min_freq = 0
+
+    def access(self, key: str) -> None:
+        freq = self.freq[key]
+        del self.buckets[freq][key]
+        if not self.buckets[freq]:
+            del self.buckets[freq]
+            if self.min_freq == freq:
+                self.min_freq = freq + 1
+        self.freq[key] = freq + 1
+        self.buckets[freq + 1][key] = None
+
+    def insert(self, key: str) -> None:
+        self.freq[key] = 1
+        self.buckets[1][key] = None
+        self.min_freq = 1
+
+    def evict(self, incoming_key: Optional[str] = None) -> Optional[str]:
+        if not self.freq:
+            return None
+        if self.min_freq not in self.buckets:
+            self.min_freq = min(self.buckets)
+        key, _ = self.buckets[self.min_freq].popitem(last=False)
+        if not self.buckets[self.min_freq]:
+            del self.buckets[self.min_freq]
+        del self.freq[key]
+        return key
+
+    def remove(self, key: str) -> None:
+        freq = self.freq.pop(key, None)
+        if freq is None:
+            return
+        del self.buckets[freq][key]
+        if not self.buckets[freq]:
+            del self.buckets[freq]
+
+    def clear(self) -> None:
+        self.freq.clear()
+        self.buckets.clear()
+        self.min_freq = 0
+
+    def __len__(self) -> int:
+        return len(self.freq)
+
+
+class ARCPolicy:
+    name = 'arc'
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.p = 0.0  # T1 の目標サイズ
+        self.t1: OrderedDict[str, None] = OrderedDict()
+        self.t2: OrderedDict[str, None] = OrderedDict()
+        # ゴーストリスト（削除済みキーの履歴だけを保持）
+        self.b1: OrderedDict[str, None] = OrderedDict()
+        self.b2: OrderedDict[str, None] = OrderedDict()
+
+    def access(self, key: str) -> None:
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+        self.t2[key] = None
+
+    def insert(self, key: str) -> None:
+        if key in self.b1:
+            # 最近 T1 から追い出したキーが再び来た → T1 を大きくする
+            self.p = min(self.capacity, self.p + max(len(self.b2) / len(self.b1), 1))
+            del self.b1[key]
+            self.t2[key] = None
+        elif key in self.b2:
+            # 最近 T2 から追い出したキーが再び来た → T2 を大きくする
+            self.p = max(0.0, self.p - max(len(self.b1) / len(self.b2), 1))
+            del self.b2[key]
+            self.t2[key] = None
+        else:
+            self.t1[key] = None
+
+    def evict(self, incoming_key: Optional[str] = None) -> Optional[str]:
+        if not self.t1 and not self.t2:
+            return None
+        evict_t1 = len(self.t1) > self.p or (incoming_key in self.b2 and len(self.t1) == int(self.p))
+        if self.t1 and (evict_t1 or not self.t2):
+            key, _ = self.t1.popitem(last=False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last=False)
+            self.b2[key] = None
+        # ゴーストリストはそれぞれ capacity までに制限
+        while len(self.b1) > self.capacity:
+            self.b1.popitem(last=False)
+        while len(self.b2) > self.capacity:
+            self.b2.popitem(last=False)
+        return key
+
+    def remove(self, key: str) -> None:
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+
+    def clear(self) -> None:
+        self.p = 0.0
+        self.t1.clear()
+        self.t2.clear()
+        self.b1.clear()
+        self.b2.clear()
+
+    def __len__(self) -> int:
+        return len(self.t1) + len(self.t2)
+
+
+EVICTION_POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'arc': ARCPolicy,
+}
+
+
+def make_policy(policy: str, capacity: int):
+    try:
+        return EVICTION_POLICIES[policy.lower()](capacity)
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy: {policy} (choose from {sorted(EVICTION_POLICIES)})") from None
@@ -0,0 +1,222 @@
+# 仕様
+#1. Kuzu のクエリ結果は get_as_arrow で列指向（Arrow）のまま取得し、セルごとの Python オブジェクトを作らない
+#2. 結果は Arrow のテーブルとして一度に取得する（結果キャッシュにそのまま保存するため、ストリーミングではない）
+#   - 文字列への整形は行バッチ（RecordBatch）単位で行い、ネストした列の中間結果をバッチの大きさに抑える
+#3. AnswerQuestion に渡すコンテキストは、列名のヘッダー付きの区切り文字形式（"|" 区切り）にする
+#   例: s.knownName|p.awardYear
+#       Marie Curie|1903
+#4. リスト列（COLLECT の結果など）は ", " で連結、ノード / リレーション（struct 列）は内部フィールド（_ID など）を除いて "key: value" 形式
+#   - map 列はすべてのキーを "key: value" 形式で書く（to_pylist が (key, value) のリストを返すので struct とは分ける）
+#   - パス（_NODES / _RELS だけを持つ struct）は "(Label {key: value})-[Label {key: value}]->(...)" 形式
+#     （パスのノードは全ラベルのプロパティを持つので、値のないプロパティは書かない）
+#5. 引用符は付けない。文字列中の区切り文字・改行・ダブルクォートは置き換える（"|" → "/", 改行 → 空白, '"' → "'"）
+#6. compact_context はトークン予算（文字数 / 4 で概算）に収まるように結果を圧縮する
+#   - 重複した行は1行にまとめる
+#   - 全行で同じ値の列は "列名: 値" として先頭に1回だけ書く
+#   - 先頭に書いた行も予算に含める。列名の行と最低1行分の場所を残し、入らない値は途中で切るか省く
+#   - それでも予算を超える場合は先頭から収まる行だけ残し、"... and N more rows" を付ける
+#   - どう圧縮したか（行数・切り捨てたか）はメタデータとして返す
+import io
+from typing import Any, Dict, Iterator
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4
+# 固定値の列を先頭に書くときに、1行目のために残しておく文字数
+MIN_ROW_CHARS = 16
+_WRITE_OPTIONS = pcsv.WriteOptions(include_header=False, delimiter="|", quoting_style="none")
+
+
+def fetch_table(result: Any, batch_size: int = DEFAULT_BATCH_SIZE) -> pa.Table:
+    """Materialize the whole Kuzu QueryResult as an Arrow table (in chunks of batch_size rows)."""
+    return result.get_as_arrow(chunk_size=batch_size)
+
+
+def iter_row_batches(table: pa.Table, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    """Split an in-memory table into record batches of at most batch_size rows (zero-copy)."""
+    return iter(table.to_batches(max_chunksize=batch_size))
+
+
+def _format_element(value: dict) -> str:
+    """A node or relationship inside a path: its label and the properties that have a value."""
+    properties = ", ".join(f"{k}: {v}" for k, v in value.items() if not k.startswith("_") and v is not None)
+    label = value.get("_LABEL") or value.get("_label") or ""
+    return f"{label} {{{properties}}}" if properties else label
+
+
+def _format_path(nodes: list, rels: list) -> str:
+    if len(nodes) != len(rels) + 1:
+        # 可変長リレーション単体（中間ノードだけを持つ）はノードとリレーションを並べるだけ
+        return ", ".join([f"({_format_element(n)})" for n in nodes] + [f"[{_format_element(r)}]" for r in rels])
+    parts = [f"({_format_element(nodes[0])})"]
+    for previous, rel, node in zip(nodes, rels, nodes[1:]):
+        src = rel.get("_SRC", rel.get("_src"))
+        node_id = previous.get("_ID", previous.get("_id"))
+        edge = _format_element(rel)
+        parts.append(f"-[{edge}]->" if src is None or src == node_id else f"<-[{edge}]-")
+        parts.append(f"({_format_element(node)})")
+    return "".join(parts)
+
+
+def _format_struct(value: dict | None) -> str | None:
+    if value is None:
+        return None
+    keys = {k.upper(): k for k in value}
+    if keys.keys() == {"_NODES", "_RELS"}:
+        return _format_path(value[keys["_NODES"]] or [], value[keys["_RELS"]] or [])
+    return "{" + ", ".join(f"{k}: {v}" for k, v in value.items() if not k.startswith("_")) + "}"
+
+
+def _format_map(value: list[tuple] | None) -> str | None:
+    if value is None:
+        return None
+    return "{" + ", ".join(f"{k}: {v}" for k, v in value) + "}"
+
+
+def _to_text_column(array: pa.Array) -> pa.Array:
+    """Turn nested columns into plain strings so they can be written as CSV."""
+    if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+        if pa.types.is_nested(array.type.value_type):
+            return pa.array([None if v is None else str(v) for v in array.to_pylist()], pa.string())
+        return pc.binary_join(array.cast(pa.list_(pa.string())), ", ")
+    if pa.types.is_map(array.type):
+        return pa.array([_format_map(v) for v in array.to_pylist()], pa.string())
+    if pa.types.is_struct(array.type):
+        # ノードやリレーションは行数が少ないときに返るので Python で整形する
+        return pa.array([_format_struct(v) for v in array.to_pylist()], pa.string())
+    return array
+
+
+def _sanitize(array: pa.Array) -> pa.Array:
+    if not (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        return array
+    array = pc.replace_substring_regex(array, r"[\r\n]+", " ")
+    array = pc.replace_substring(array, "|", "/")
+    return pc.replace_substring(array, '"', "'")
+
+
+def _flatten_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    columns = [_sanitize(_to_text_column(column)) for column in batch.columns]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def format_context(table: pa.Table | None, batch_size: int = DEFAULT_BATCH_SIZE) -> str:
+    """Serialize a result table into a compact, header-prefixed, pipe-delimited text."""
+    if table is None or table.num_rows == 0:
+        return ""
+    sink = io.BytesIO()
+    # ヘッダーは pyarrow だと常に引用符付きになるので自前で書く
+    sink.write(("|".join(table.column_names) + "\n").encode("utf-8"))
+    writer = None
+    for batch in iter_row_batches(table, batch_size):
+        batch = _flatten_batch(batch)
+        if writer is None:
+            writer = pcsv.CSVWriter(sink, batch.schema, write_options=_WRITE_OPTIONS)
+        writer.write_batch(batch)
+    writer.close()
+    # 最後の改行だけを除く（null だけの行は空行なので、rstrip すると行が消える）
+    return sink.getvalue().decode("utf-8")[:-1]
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _to_text_table(table: pa.Table) -> pa.Table:
+    return pa.Table.from_batches([_flatten_batch(batch) for batch in iter_row_batches(table)])
+
+
+def compact_context(
+    table: pa.Table | None, max_tokens: int = DEFAULT_TOKEN_BUDGET
+) -> tuple[str, Dict[str, Any]]:
+    """Serialize a result table within a token budget. Returns (context, metadata)."""
+    metadata: Dict[str, Any] = {
+        'rows': 0,
+        'unique_rows': 0,
+        'rows_kept': 0,
+        'omitted_rows': 0,
+        'constant_columns': [],
+        'dropped_constant_columns': [],
+        'truncated': False,
+        'estimated_tokens': 0,
+        'token_budget': max_tokens,
+    }
+    if table is None or table.num_rows == 0:
+        return "", metadata
+    metadata['rows'] = table.num_rows
+
+    # 1. 重複行をまとめる（出現順は保つ）
+    table = _to_text_table(table)
+    table = table.group_by(table.column_names, use_threads=False).aggregate([])
+    metadata['unique_rows'] = table.num_rows
+
+    # 2. 全行で同じ値の列は先頭に1回だけ書く
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    lines = []
+    row_cut = False
+    if table.num_rows > 1 and table.num_columns > 1:
+        constant = [
+            name for name in table.column_names
+            if pc.count_distinct(table[name], mode="all").as_py() == 1
+        ]
+        if len(constant) < table.num_columns:
+            hoisted = [f"{name}: {table[name][0].as_py()}" for name in constant]
+            table = table.drop_columns(constant)
+            metadata['constant_columns'] = constant
+            # 列名の行・1行目（長ければ先頭の MIN_ROW_CHARS 文字）・"... and N more rows" の場所は残す
+            _, _, first_row = format_context(table.slice(0, 1)).partition("\n")
+            room = (
+                budget_chars
+                - len("|".join(table.column_names)) - 1
+                - min(len(first_row), MIN_ROW_CHARS) - 1
+                - len(f"... and {table.num_rows} more rows")
+            )
+            for name, line in zip(constant, hoisted):
+                if len(line) + 1 > room:
+                    line = line[:room - 5] + " ..." if room - 5 > len(name) + 2 else None
+                    row_cut = True
+                if line is None:
+                    metadata['dropped_constant_columns'].append(name)
+                    continue
+                lines.append(line)
+                room -= len(line) + 1
+
+    # 3. 予算に収まる行だけ残す（1行は最低でも2文字なので、それ以上はシリアライズしない）
+    used = sum(len(line) + 1 for line in lines)
+    head = table.slice(0, max(1, (budget_chars - used) // 2))
+    header, *rows = format_context(head).split("\n")
+    lines.append(header)
+    used += len(header) + 1
+    # 全行が収まらないときは "... and N more rows" の分を残しておく
+    fits = len(rows) == table.num_rows and used + sum(len(row) + 1 for row in rows) <= budget_chars
+    reserve = 0 if fits else len(f"... and {table.num_rows} more rows")
+    kept = 0
+    for row in rows:
+        if used + len(row) + 1 + reserve > budget_chars and kept > 0:
+            break
+        if used + len(row) + 1 + reserve > budget_chars:
+            # 1行目だけで予算を超える場合は行の途中で切る（切っても入らなければ件数だけ書く）
+            cut = budget_chars - used - reserve - 5
+            if cut <= 0:
+                break
+            row = row[:cut] + " ..."
+            row_cut = True
+        lines.append(row)
+        used += len(row) + 1
+        kept += 1
+
+    omitted = table.num_rows - kept
+    if omitted:
+        lines.append(f"... and {omitted} more rows")
+    context = "\n".join(lines)
+    metadata.update({
+        'rows_kept': kept,
+        'omitted_rows': omitted,
+        'truncated': omitted > 0 or row_cut,
+        'estimated_tokens': estimate_tokens(context),
+    })
+    return context, metadata
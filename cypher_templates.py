@@ -0,0 +1,278 @@
+# 仕様
+#1. よくある形の質問（ExemplarStore の例と同じ形）はテンプレートから Cypher を作り、Text2Cypher（LLM）を呼ばない
+#   - 分野（category）、年（year）、分野 + 年、出身国（country）、出身国 + 分野、所属機関（institution）、複数回受賞
+#2. スロットの値は質問から取り出し、グラフにある値（DISTINCT）と照合する
+#   - category: Prize.category の値（physiology → medicine などの言い換えも、グラフにある値なら使う）
+#   - year: 4桁の数字
+#   - country: Country.name（複数語も可）、または国籍を表す単語（Japanese → japan）
+#   - institution: Institution.name に含まれる固有の単語（Harvard, MIT など）
+#     人名と同じ単語（Max Planck, Niels Bohr など）は、所属を表す単語（at, affiliated, university など）が
+#     質問にあるときだけ機関として扱う（人についての質問を機関のテンプレートで答えない）
+#3. 質問の内容語がすべて「スロット」「テンプレートの語彙」「ストップワード」で説明できた場合だけ採用する
+#   → 説明できない単語（after, female など）が残れば None を返し、呼び出し側で Text2Cypher にフォールバック
+#4. 出力はリテラル入りの Cypher。prepared_statements でリテラルがパラメータに戻るので、同じテンプレートは同じプランを使う
+#5. get_stats でテンプレートに一致した割合（LLM を使わずに済んだ割合）を返す
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+STOPWORDS = {
+    "a", "an", "the", "which", "what", "who", "whom", "in", "of", "for", "did", "do", "does", "was", "were",
+    "is", "are", "list", "show", "give", "me", "find", "all", "name", "names", "get", "tell", "there",
+    "that", "any", "have", "has", "had", "with", "from", "by", "at", "to", "and", "or", "please",
+}
+
+WINNER_WORDS = {
+    "scholar", "scholars", "laureate", "laureates", "winner", "winners", "people", "person", "persons",
+    "scientist", "scientists", "won", "win", "wins", "prize", "prizes", "nobel", "award", "awards",
+    "awarded", "receive", "received", "recipient", "recipients",
+}
+
+CATEGORY_ALIASES = {"economic": "economics", "physiology": "medicine"}
+
+DEMONYMS = {
+    "american": "usa", "british": "united kingdom", "english": "united kingdom", "dutch": "netherlands",
+    "french": "france", "german": "germany", "japanese": "japan", "swedish": "sweden", "swiss": "switzerland",
+    "italian": "italy", "russian": "russia", "chinese": "china", "indian": "india", "canadian": "canada",
+    "danish": "denmark", "norwegian": "norway", "polish": "poland", "austrian": "austria", "israeli": "israel",
+    "australian": "australia", "spanish": "spain", "hungarian": "hungary", "belgian": "belgium",
+    "scottish": "scotland", "irish": "ireland", "finnish": "finland", "mexican": "mexico", "egyptian": "egypt",
+    "korean": "south korea", "pakistani": "pakistan", "turkish": "turkey", "argentine": "argentina",
+    "argentinian": "argentina", "brazilian": "brazil", "portuguese": "portugal",
+}
+
+# 機関名によく出てくる一般的な単語（これだけでは機関を特定できない）
+GENERIC_INSTITUTION_WORDS = {
+    "university", "universit", "universitat", "of", "the", "and", "for", "institute", "institut", "school",
+    "college", "research", "center", "centre", "laboratory", "laboratories", "medical", "medicine",
+    "technology", "science", "sciences", "national", "hospital", "academy", "de", "der", "fur", "now",
+    "physics", "chemistry", "economics", "cancer", "biology", "department", "company",
+}
+
+# 機関名の単語が人名でもあるときに、機関のことだと判断する単語
+AFFILIATION_CUES = {
+    "at", "affiliated", "affiliation", "affiliations", "university", "universities", "institution",
+    "institutions", "institute", "institutes", "college", "laboratory", "lab", "work", "worked", "working",
+}
+
+SLOT_QUERIES = {
+    "category": "MATCH (p:Prize) RETURN DISTINCT LOWER(p.category)",
+    "country": "MATCH (c:Country) RETURN DISTINCT c.name",
+    "institution": "MATCH (i:Institution) RETURN DISTINCT i.name",
+    "scholar": "MATCH (s:Scholar) RETURN DISTINCT s.knownName",
+}
+
+
+@dataclass(frozen=True)
+class CypherTemplate:
+    name: str
+    slots: FrozenSet[str]
+    cypher: str
+    vocabulary: FrozenSet[str] = frozenset()
+    intent: Optional[str] = None
+
+
+@dataclass
+class TemplateMatch:
+    name: str
+    cypher: str
+    params: Dict[str, Any]
+    confidence: float
+
+
+_WON = "MATCH (s:Scholar)-[:WON]->(p:Prize)"
+_BORN = "MATCH (s:Scholar)-[:BORN_IN]->(c:City)-[:IS_CITY_IN]->(co:Country) WHERE LOWER(co.name) CONTAINS {country}"
+
+DEFAULT_TEMPLATES = [
+    CypherTemplate(
+        "category_year", frozenset({"category", "year"}),
+        f"{_WON} WHERE LOWER(p.category) CONTAINS {{category}} AND p.awardYear = {{year}} "
+        "RETURN DISTINCT s.knownName AS scholar_name",
+        frozenset({"year", "field", "category"}),
+    ),
+    CypherTemplate(
+        "category", frozenset({"category"}),
+        f"{_WON} WHERE LOWER(p.category) CONTAINS {{category}} "
+        "RETURN DISTINCT s.knownName AS scholar_name, p.awardYear AS year",
+        frozenset({"field", "category"}),
+    ),
+    CypherTemplate(
+        "year", frozenset({"year"}),
+        f"{_WON} WHERE p.awardYear = {{year}} RETURN DISTINCT s.knownName AS scholar_name, p.category AS category",
+        frozenset({"year"}),
+    ),
+    CypherTemplate(
+        "country_category", frozenset({"country", "category"}),
+        f"{_BORN} MATCH (s)-[:WON]->(p:Prize) WHERE LOWER(p.category) CONTAINS {{category}} "
+        "RETURN DISTINCT s.knownName AS scholar_name, p.awardYear AS year",
+        frozenset({"born", "country", "native", "field", "category"}),
+    ),
+    CypherTemplate(
+        "country", frozenset({"country"}),
+        f"{_BORN} MATCH (s)-[:WON]->(p:Prize) "
+        "RETURN DISTINCT s.knownName AS scholar_name, p.category AS category, p.awardYear AS year",
+        frozenset({"born", "country", "native"}),
+    ),
+    CypherTemplate(
+        "institution", frozenset({"institution"}),
+        "MATCH (s:Scholar)-[:AFFILIATED_WITH]->(i:Institution) WHERE LOWER(i.name) CONTAINS {institution} "
+        "MATCH (s)-[:WON]->(p:Prize) "
+        "RETURN DISTINCT s.knownName AS scholar_name, p.category AS category, p.awardYear AS year",
+        frozenset({"affiliated", "affiliation", "university", "institution", "institute", "work", "worked", "working"}),
+    ),
+    CypherTemplate(
+        "multiple_prizes", frozenset(),
+        f"{_WON} WITH s, COUNT(DISTINCT p) AS prize_count WHERE prize_count > 1 "
+        "MATCH (s)-[:WON]->(p2:Prize) RETURN s.knownName AS scholar_name, "
+        "COLLECT(DISTINCT p2.category) AS categories, COLLECT(DISTINCT p2.awardYear) AS years",
+        frozenset({"multiple", "more", "than", "one", "once", "twice", "several", "two", "times"}),
+        intent=r"\b(multiple|more than (one|once)|twice|several|two or more)\b",
+    ),
+]
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    return str(value)
+
+
+def _tokens(question: str) -> List[str]:
+    return [t[:-2] if t.endswith("'s") else t for t in re.findall(r"[A-Za-z][A-Za-z'\-]*|\d+", question)]
+
+
+class CypherTemplateEngine:
+    def __init__(self, templates: Optional[List[CypherTemplate]] = None, min_confidence: float = 1.0):
+        self.templates = templates or DEFAULT_TEMPLATES
+        self.min_confidence = min_confidence
+        self.values_version: Optional[str] = None
+        self.categories: Set[str] = set()
+        self.countries: Dict[Tuple[str, ...], str] = {}
+        self.institution_words: Set[str] = set()
+        # 人名の連続した単語の組（"max planck", "planck" など）
+        self.person_names: Set[Tuple[str, ...]] = set()
+        self._lock = threading.Lock()
+        # 並行して来た最初の質問で何度も読み込まないように
+        self._load_lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.by_template: Dict[str, int] = {}
+
+    def load_values(self, version: str, fetch_column: Callable[[str], List[Any]]) -> None:
+        """(Re)load slot values from the graph when the database version changed."""
+        if version == self.values_version:
+            return
+        with self._load_lock:
+            if version != self.values_version:
+                self._load_values(version, fetch_column)
+
+    def _load_values(self, version: str, fetch_column: Callable[[str], List[Any]]) -> None:
+        categories = {v.lower() for v in fetch_column(SLOT_QUERIES["category"]) if v}
+        countries = {}
+        for name in fetch_column(SLOT_QUERIES["country"]):
+            if not name:
+                continue
+            words = tuple(w.lower() for w in re.findall(r"[A-Za-z]+", re.sub(r"\(.*?\)", "", name)))
+            countries[words] = name.lower()
+            if words and words[0] == "the":
+                countries[words[1:]] = name.lower()[4:]
+        institution_words = set()
+        for name in fetch_column(SLOT_QUERIES["institution"]):
+            institution_words.update(
+                w for w in re.findall(r"[a-z]+", (name or "").lower())
+                if len(w) > 2 and w not in GENERIC_INSTITUTION_WORDS
+            )
+        person_names = set()
+        for name in fetch_column(SLOT_QUERIES["scholar"]):
+            words = tuple(re.findall(r"[a-z]+", (name or "").lower()))
+            person_names.update(words[i:j] for i in range(len(words)) for j in range(i + 1, len(words) + 1))
+        with self._lock:
+            self.categories, self.countries, self.institution_words = categories, countries, institution_words
+            self.person_names = person_names
+            self.values_version = version
+
+    def extract_slots(self, question: str) -> Tuple[Dict[str, Any], Set[int]]:
+        """Return (slot values, indexes of the tokens used by slots)."""
+        tokens = _tokens(question)
+        lower = [t.lower() for t in tokens]
+        slots: Dict[str, Any] = {}
+        used: Set[int] = set()
+
+        def take(name: str, value: Any, indexes) -> None:
+            # 同じ値が2回出てきた場合（Physiology or Medicine）も説明済みにする
+            if slots.setdefault(name, value) == value:
+                used.update(indexes)
+
+        for i, word in enumerate(lower):
+            if re.fullmatch(r"(18|19|20)\d\d", word):
+                take("year", int(word), [i])
+            category = CATEGORY_ALIASES.get(word, word)
+            if category in self.categories:
+                take("category", category, [i])
+            if word in DEMONYMS and DEMONYMS[word] in self.countries.values():
+                take("country", DEMONYMS[word], [i])
+        # 国名（長いものから）
+        for n in range(4, 0, -1):
+            for i in range(len(lower) - n + 1):
+                span = range(i, i + n)
+                if used.intersection(span) or not tokens[i][0].isupper():
+                    continue
+                name = self.countries.get(tuple(lower[i:i + n]))
+                if name is not None:
+                    take("country", name, span)
+        # 機関名に含まれる固有の単語（大文字で始まる連続した単語）
+        affiliation = any(word in AFFILIATION_CUES for word in lower)
+        i = 0
+        while i < len(tokens):
+            j = i
+            while (
+                j < len(tokens) and j not in used and tokens[j][0].isupper()
+                and lower[j] in self.institution_words and lower[j] not in WINNER_WORDS
+            ):
+                j += 1
+            if j > i:
+                # 人名と同じ単語なら、所属を表す単語がない限り機関のスロットには入れない
+                if affiliation or tuple(lower[i:j]) not in self.person_names:
+                    take("institution", " ".join(lower[i:j]), range(i, j))
+                i = j
+            else:
+                i += 1
+        return slots, used
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        slots, used = self.extract_slots(question)
+        lower = [t.lower() for t in _tokens(question)]
+        result = None
+        for template in self.templates:
+            if set(slots) != template.slots:
+                continue
+            if template.intent and not re.search(template.intent, question.lower()):
+                continue
+            vocabulary = WINNER_WORDS | template.vocabulary
+            content = [i for i, w in enumerate(lower) if w not in STOPWORDS]
+            covered = [i for i in content if i in used or lower[i] in vocabulary]
+            confidence = len(covered) / len(content) if content else 0.0
+            # 受賞に関する質問であること（テンプレートはすべて受賞者を返す）
+            if confidence >= self.min_confidence and any(w in WINNER_WORDS for w in lower):
+                params = {name: slots[name] for name in template.slots}
+                cypher = template.cypher.format(**{k: _literal(v) for k, v in params.items()})
+                result = TemplateMatch(template.name, cypher, params, confidence)
+                break
+        with self._lock:
+            self.lookups += 1
+            if result is not None:
+                self.hits += 1
+                self.by_template[result.name] = self.by_template.get(result.name, 0) + 1
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'misses': self.lookups - self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0,
+                'by_template': dict(self.by_template),
+                'values_version': self.values_version,
+            }
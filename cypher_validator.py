@@ -0,0 +1,144 @@
+# 仕様
+#1. 生成された Cypher を実行する前に、スキーマ（KuzuDatabaseManager.get_schema_dict の形式）と照らし合わせて確認する
+#   - ノードのラベル、リレーションのラベルが存在するか
+#   - リレーションの向きが正しいか（例: (:Prize)-[:WON]->(:Scholar) は逆向き）
+#     → Kuzu は逆向きでもエラーにならず空の結果を返すので、実行しても気付けない
+#   - 変数.プロパティ と {プロパティ: 値} のプロパティが、そのラベルに存在するか
+#2. Kuzu と同じくラベル・プロパティ名は大文字小文字を区別しない
+#3. 文字列リテラルの中身は見ない（prepared_statements.parameterize でパラメータに置き換えてから解析する）
+#4. WITH で別名を付けた変数など、ラベルの分からない変数はチェックしない（誤検知より見逃しを優先）
+#5. 問題が見つかったら CypherValidationError（RuntimeError）を投げる → 自己修正ループでそのまま扱える
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from prepared_statements import parameterize
+
+_LABELS = r"(?::\s*`?\w+`?\s*)+"
+_PATTERN = re.compile(
+    r"(?P<node>\(\s*(?P<nvar>[A-Za-z_]\w*)?\s*(?P<nlabels>" + _LABELS + r")?(?P<nprops>\{[^{}]*\})?\s*\))"
+    r"|(?P<rel>(?P<larrow><)?-\[\s*(?P<rvar>[A-Za-z_]\w*)?\s*"
+    r"(?::\s*(?P<rlabels>`?\w+`?(?:\s*\|\s*:?\s*`?\w+`?)*))?\s*(?:\*[\d.\s]*)?\s*"
+    r"(?P<rprops>\{[^{}]*\})?\s*\]-(?P<rarrow>>)?)"
+)
+_PROPERTY_ACCESS = re.compile(r"(?<![\w.$])([A-Za-z_]\w*)\.(`?\w+`?)")
+_MAP_KEY = re.compile(r"(\w+)\s*:")
+
+
+class CypherValidationError(RuntimeError):
+    pass
+
+
+def _names(text: Optional[str]) -> List[str]:
+    return re.findall(r"\w+", text or "")
+
+
+class CypherValidator:
+    def __init__(self, schema: Dict[str, List[Dict]]):
+        # 小文字 -> スキーマ上の表記
+        self.node_labels = {n["label"].lower(): n["label"] for n in schema.get("nodes", [])}
+        self.rel_labels = {e["label"].lower(): e["label"] for e in schema.get("edges", [])}
+        self.properties: Dict[str, Dict[str, str]] = {}
+        for item in schema.get("nodes", []) + schema.get("edges", []):
+            props = self.properties.setdefault(item["label"].lower(), {})
+            props.update({p["name"].lower(): p["name"] for p in item.get("properties", [])})
+        # (リレーション, from, to)
+        self.connections: Set[Tuple[str, str, str]] = {
+            (e["label"].lower(), e["from"].lower(), e["to"].lower()) for e in schema.get("edges", [])
+        }
+
+    def _connection_hint(self, rel: str) -> str:
+        pairs = [
+            f"(:{self.node_labels.get(a, a)})-[:{self.rel_labels[rel]}]->(:{self.node_labels.get(b, b)})"
+            for r, a, b in sorted(self.connections) if r == rel
+        ]
+        return ", ".join(pairs)
+
+    def check(self, query: str) -> List[str]:
+        """Return a list of problems found in query (empty when it looks valid)."""
+        template, _ = parameterize(query)
+        tokens = list(_PATTERN.finditer(template))
+        problems: List[str] = []
+        variables: Dict[str, Set[str]] = {}
+
+        def add_problem(problem: str) -> None:
+            if problem not in problems:
+                problems.append(problem)
+
+        # 1. ラベルの確認と、変数 -> ラベルの対応付け
+        for token in tokens:
+            if token.group("node"):
+                var, labels, known = token.group("nvar"), _names(token.group("nlabels")), self.node_labels
+                kind = "Node label"
+            else:
+                var, labels, known = token.group("rvar"), _names(token.group("rlabels")), self.rel_labels
+                kind = "Relationship type"
+            for label in labels:
+                if label.lower() not in known:
+                    add_problem(f"{kind} '{label}' does not exist (available: {', '.join(known.values())})")
+            if var and labels:
+                variables.setdefault(var, set()).update(l.lower() for l in labels if l.lower() in known)
+
+        def node_labels(token: re.Match) -> Set[str]:
+            labels = {l.lower() for l in _names(token.group("nlabels"))}
+            return labels or variables.get(token.group("nvar") or "", set())
+
+        # 2. リレーションの向き（前後のノードのラベルが分かる場合のみ）
+        for i, token in enumerate(tokens):
+            if not token.group("rel") or i == 0 or i + 1 == len(tokens):
+                continue
+            left, right = tokens[i - 1], tokens[i + 1]
+            if not (left.group("node") and right.group("node")):
+                continue
+            if template[left.end():token.start()].strip() or template[token.end():right.start()].strip():
+                continue
+            rels = {l.lower() for l in _names(token.group("rlabels"))} & set(self.rel_labels)
+            sources, targets = node_labels(left), node_labels(right)
+            if not rels or not sources or not targets:
+                continue
+            if token.group("larrow") and not token.group("rarrow"):
+                sources, targets = targets, sources
+            forward = any((r, a, b) in self.connections for r in rels for a in sources for b in targets)
+            backward = any((r, b, a) in self.connections for r in rels for a in sources for b in targets)
+            undirected = not token.group("larrow") and not token.group("rarrow")
+            if forward or (undirected and backward):
+                continue
+            for rel in rels:
+                if backward:
+                    add_problem(f"Relationship direction is reversed; use {self._connection_hint(rel)}")
+                else:
+                    add_problem(
+                        f"Relationship '{self.rel_labels[rel]}' does not connect these nodes; "
+                        f"it connects {self._connection_hint(rel)}"
+                    )
+
+        # 3. プロパティ
+        def check_property(var_labels: Set[str], prop: str) -> None:
+            prop = prop.strip("`")
+            if not var_labels or prop.startswith("_"):
+                return
+            available = {}
+            for label in var_labels:
+                available.update(self.properties.get(label, {}))
+            if prop.lower() not in available:
+                owner = "/".join(self.node_labels.get(l) or self.rel_labels.get(l, l) for l in sorted(var_labels))
+                add_problem(
+                    f"Property '{prop}' does not exist on {owner} "
+                    f"(available: {', '.join(available.values()) or 'none'})"
+                )
+
+        for token in tokens:
+            if token.group("node"):
+                labels, props = node_labels(token), token.group("nprops")
+            else:
+                labels = {l.lower() for l in _names(token.group("rlabels"))} & set(self.rel_labels)
+                props = token.group("rprops")
+            for key in _MAP_KEY.findall(props or ""):
+                check_property(labels, key)
+        for var, prop in _PROPERTY_ACCESS.findall(template):
+            check_property(variables.get(var, set()), prop)
+        return problems
+
+    def validate(self, query: str) -> None:
+        problems = self.check(query)
+        if problems:
+            raise CypherValidationError("Validation failed: " + "; ".join(problems))
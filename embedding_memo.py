@@ -0,0 +1,111 @@
+# 仕様
+#1. 文字列の埋め込みを (モデル名, 文字列) をキーにした LRU で覚えておき、同じ文字列を2回エンコードしない
+#   - ExemplarStore・意味キャッシュ（SemanticCacheTier）・RefinementMemory が同じ EmbeddingMemo を使う
+#   - encode(texts) はエンコーダーと同じ呼び方で、(件数, 次元) の float32 を返す
+#2. 未計算の文字列はまとめて1回の encode（1回の forward）で計算する
+#   - prefetch(texts) で、バッチで来た質問をパイプラインの前にまとめて計算しておける
+#3. 同じ文字列を同時にエンコードしようとした場合は1回にまとめる（SingleFlight）
+#4. shared(model_name, ...) でモデル名ごとにプロセス内で1つのメモを共有する
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from single_flight import SingleFlight
+
+
+class EmbeddingMemo:
+    # プロセス内で共有するインスタンス（モデル名ごと）
+    _shared: Dict[str, "EmbeddingMemo"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, encoder: Any, model_name: str = "", maxsize: int = 1024):
+        self.encoder = encoder
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self._vectors: OrderedDict[Tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.encode_calls = 0
+        self.evictions = 0
+
+    @classmethod
+    def shared(cls, model_name: str, encoder_factory: Callable[[], Any], maxsize: int = 1024) -> "EmbeddingMemo":
+        """Return the process-wide memo for model_name, creating its encoder only once."""
+        with cls._shared_lock:
+            if model_name not in cls._shared:
+                cls._shared[model_name] = cls(encoder_factory(), model_name, maxsize=maxsize)
+            return cls._shared[model_name]
+
+    def _get(self, text: str) -> Optional[np.ndarray]:
+        key = (self.model_name, text)
+        vector = self._vectors.get(key)
+        if vector is not None:
+            self._vectors.move_to_end(key)
+        return vector
+
+    def _put(self, texts: List[str], vectors: np.ndarray) -> None:
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._vectors[(self.model_name, text)] = vector
+                self._vectors.move_to_end((self.model_name, text))
+            while len(self._vectors) > self.maxsize:
+                self._vectors.popitem(last=False)
+                self.evictions += 1
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.encoder.encode(texts), dtype=np.float32).reshape(len(texts), -1)
+        with self._lock:
+            self.encode_calls += 1
+        self._put(texts, vectors)
+        return vectors
+
+    def encode(self, texts: str | List[str], **kwargs) -> np.ndarray:
+        """Drop-in replacement for encoder.encode that reuses memoized embeddings."""
+        if isinstance(texts, str):
+            texts = [texts]
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for text in texts:
+                found.append(self._get(text))
+            missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+            self.hits += len(texts) - sum(v is None for v in found)
+            self.misses += len(missing)
+        if len(missing) == 1:
+            # 同時に同じ質問が来ても forward は1回
+            vector, _ = self._flights.do(missing[0], lambda: self._encode_batch(missing)[0])
+            computed = {missing[0]: vector}
+        elif missing:
+            computed = dict(zip(missing, self._encode_batch(missing)))
+        else:
+            computed = {}
+        return np.vstack([v if v is not None else computed[t] for t, v in zip(texts, found)])
+
+    def prefetch(self, texts: List[str]) -> int:
+        """Encode the texts that are not memoized yet in one batch. Returns how many were encoded."""
+        with self._lock:
+            missing = list(dict.fromkeys(t for t in texts if (self.model_name, t) not in self._vectors))
+        if missing:
+            self._encode_batch(missing)
+        return len(missing)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'model': self.model_name,
+                'size': len(self._vectors),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0,
+                'encode_calls': self.encode_calls,
+                'evictions': self.evictions,
+            }
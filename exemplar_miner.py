@@ -0,0 +1,189 @@
+# 仕様
+#1. Text2Cypher（LLM）が作ったクエリのうち、実行に成功して結果が1行以上あった (質問, Cypher) を ExemplarStore に追加する
+#   - テンプレートやキャッシュから返ったクエリは対象外（GraphRAG 側で LLM を呼んだときだけ record する）
+#2. 既存の例とほぼ同じ質問（コサイン類似度が dedupe_threshold 以上）は追加しない
+#   - 質問の埋め込みは EmbeddingMemo にあるもの（ExemplarStore の検索で計算済み）を使う
+#3. 追加した例が max_mined 件を超えたら、多様性を保つように削除する
+#   - 他の例と一番似ている（冗長な）ものから順に消す（既定の例は消さない）
+#   - 1件ずつではなく evict_fraction 分をまとめて消す（インデックスの作り直しを減らす）
+#4. 追加した例は JSON Lines に保存し、次回の起動時に読み込む（埋め込みはディスクキャッシュから読むのでエンコードしない）
+#   - ディスクへの書き込み（埋め込みと JSON Lines）はロックの外でまとめて行う（record 同士をブロックしない）
+#   - インデックスの学習（IVF の k-means）もロックの外で行う（学習中も record と検索はブロックされない）
+#   - 保存先の既定はモジュールの隣の .exemplar_cache（カレントディレクトリには書かない）
+#5. GraphRAG では mine_exemplars=True を指定したときだけ有効（既定はオフ）
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from exemplar_store import DEFAULT_CACHE_DIR, ExemplarStore
+from lru_cache import normalize_question
+
+DEFAULT_MINED_PATH = os.path.join(DEFAULT_CACHE_DIR, "mined_exemplars.jsonl")
+
+
+class ExemplarMiner:
+    # プロセス内で共有するインスタンス（ExemplarStore と保存先ごと）
+    _shared: Dict[Tuple[int, Optional[str]], "ExemplarMiner"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        store: ExemplarStore,
+        path: Optional[str] = DEFAULT_MINED_PATH,
+        dedupe_threshold: float = 0.95,
+        max_mined: int = 2000,
+        evict_fraction: float = 0.1,
+    ):
+        self.store = store
+        self.path = path
+        self.dedupe_threshold = dedupe_threshold
+        self.max_mined = max_mined
+        self.evict_fraction = evict_fraction
+        # 正規化した質問 -> 保存するレコード（追加順）
+        self.mined: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # まだディスクに書いていない (正規化した質問, 埋め込み, レコード) と、JSON Lines を書き直す必要があるか
+        self._pending: List[Tuple[str, np.ndarray, Dict[str, Any]]] = []
+        self._rewrite_due = False
+        # 書き込みの順番を守るためのロック（self._lock より先に取る）
+        self._write_lock = threading.Lock()
+        self.recorded = 0
+        self.duplicates = 0
+        self.skipped_empty = 0
+        self.evicted = 0
+        if path:
+            self._load()
+
+    @classmethod
+    def shared(cls, store: ExemplarStore, path: Optional[str] = DEFAULT_MINED_PATH, **kwargs) -> "ExemplarMiner":
+        """Return the miner for store and path, loading the saved exemplars only once per process."""
+        with cls._shared_lock:
+            key = (id(store), path)
+            if key not in cls._shared:
+                cls._shared[key] = cls(store, path, **kwargs)
+            return cls._shared[key]
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not load mined exemplars from {self.path}: {e}")
+            return
+        existing = {normalize_question(ex["question"]) for ex in self.store.exemplars}
+        for record in records:
+            key = normalize_question(record["question"])
+            if key not in existing:
+                self.mined[key] = record
+        # 1回の add_exemplars（埋め込みはディスクキャッシュから読む）
+        self.store.add_exemplars(list(self.mined.values()))
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def _rewrite(self, records: List[Dict[str, Any]]) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def flush(self) -> None:
+        """Write the buffered embeddings and records (batched; runs outside the record lock)."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                # 削除があった場合は追記ではなく、その時点の全件で書き直す
+                records = list(self.mined.values()) if self._rewrite_due else None
+                self._rewrite_due = False
+            if pending:
+                self.store.cache_vectors([key for key, _, _ in pending], np.vstack([v for _, v, _ in pending]))
+            if records is not None:
+                self._rewrite(records)
+            elif pending:
+                self._append([record for _, _, record in pending])
+
+    def record(self, question: str, cypher: str, rows: int, tries: int = 1) -> bool:
+        """Promote a successful (question, Cypher) pair. Returns True when it was added."""
+        if rows <= 0:
+            with self._lock:
+                self.skipped_empty += 1
+            return False
+        key = normalize_question(question)
+        vector = self.store.memo.encode([key])
+        with self._lock:
+            if key in self.mined:
+                self.duplicates += 1
+                return False
+            best = self.store.index.search(vector, 1)[1]
+            if len(best) and best[0] >= self.dedupe_threshold:
+                self.duplicates += 1
+                return False
+            record = {"question": question, "cypher": cypher, "rows": int(rows), "tries": tries, "created_at": time.time()}
+            # インデックスへの追加（メモリ上）だけをロックの中で行う（学習はロックの外）
+            self.store.add_exemplars([record], vectors=vector, persist=False, train=False)
+            self.mined[key] = record
+            self.recorded += 1
+            self._pending.append((key, vector.reshape(-1), record))
+            if len(self.mined) > self.max_mined:
+                self._evict(len(self.mined) - int(self.max_mined * (1 - self.evict_fraction)))
+        self.store.train_index()
+        self.flush()
+        return True
+
+    def _evict(self, n: int) -> None:
+        """Greedily remove the n mined exemplars that are most similar to another exemplar."""
+        # インデックスと例のリストは同じ時点の組を使う（他のスレッドの追加は末尾なので位置は変わらない）
+        index, exemplars = self.store.snapshot()
+        positions = [i for i, ex in enumerate(exemplars) if normalize_question(ex["question"]) in self.mined]
+        vectors = index.as_float32()
+        mined_vectors = vectors[positions]
+        sims = mined_vectors @ vectors.T
+        # 自分自身との類似度は除く
+        sims[np.arange(len(positions)), positions] = -np.inf
+        alive = np.ones(len(positions), dtype=bool)
+        nearest = np.argmax(sims, axis=1)
+        best = sims[np.arange(len(positions)), nearest]
+        victims = []
+        for _ in range(min(n, len(positions))):
+            victim = int(np.argmax(np.where(alive, best, -np.inf)))
+            victims.append(victim)
+            alive[victim] = False
+            # 消した例を最近傍にしていた例だけ、最近傍を計算し直す
+            sims[:, positions[victim]] = -np.inf
+            affected = np.flatnonzero(alive & (nearest == positions[victim]))
+            if len(affected):
+                nearest[affected] = np.argmax(sims[affected], axis=1)
+                best[affected] = sims[affected, nearest[affected]]
+        for victim in victims:
+            del self.mined[normalize_question(exemplars[positions[victim]]["question"])]
+        self.store.remove_exemplars([positions[v] for v in victims])
+        self.evicted += len(victims)
+        self._rewrite_due = True
+        print(f"Evicted {len(victims)} redundant mined exemplars, {len(self.mined)} left")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'mined': len(self.mined),
+                'max_mined': self.max_mined,
+                'recorded': self.recorded,
+                'duplicates': self.duplicates,
+                'skipped_empty': self.skipped_empty,
+                'evicted': self.evicted,
+                'store_size': len(self.store.exemplars),
+            }
@@ -1,48 +1,326 @@
-from sentence_transformers import SentenceTransformer
+import hashlib
+import os
+import re
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import Any, List, Dict, Optional, Tuple
 import json
+import threading
+from embedding_memo import EmbeddingMemo
+from lru_cache import normalize_question
+from vector_index import VectorIndex, make_index
+
+DEFAULT_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# 埋め込みのディスクキャッシュ（カレントディレクトリではなくこのモジュールの隣）
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".exemplar_cache")
+
+# モデルはプロセス内でモデル名ごとに1つだけ読み込む
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def _sentence_transformer(model_name: str):
+    # sentence_transformers（torch）の import 自体が重いので、実際に埋め込みが必要になるまで遅らせる
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class LazyEncoder:
+    """Encoder that loads the SentenceTransformer model on the first encode call."""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL):
+        self.model_name = model_name
+
+    @property
+    def loaded(self) -> bool:
+        return self.model_name in _models
+
+    def encode(self, texts, **kwargs):
+        model = _models.get(self.model_name)
+        if model is None:
+            with _models_lock:
+                if self.model_name not in _models:
+                    _models[self.model_name] = _sentence_transformer(self.model_name)
+                model = _models[self.model_name]
+        return model.encode(texts, **kwargs)
+
+
+class EmbeddingDiskCache:
+    """
+    Embeddings persisted in one append-only file per model, keyed by a hash of the text.
+    Each record holds its key and its vector, so keys and vectors can never get out of step;
+    the records are memory-mapped, so a warm start reads them without loading the model.
+    """
+
+    MAGIC = b"EMBCACHE"
+    HEADER_SIZE = 16
+
+    def __init__(self, cache_dir: str, model_name: str):
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.path = os.path.join(cache_dir, f"{slug}.emb")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:32].encode()
+
+    @staticmethod
+    def _record_dtype(dim: int) -> np.dtype:
+        return np.dtype([("key", "S32"), ("vector", "<f4", (dim,))])
+
+    def _read_dim(self) -> Optional[int]:
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(self.HEADER_SIZE)
+        except OSError:
+            return None
+        if len(header) != self.HEADER_SIZE or not header.startswith(self.MAGIC):
+            return None
+        return int(np.frombuffer(header, dtype="<u4", count=1, offset=len(self.MAGIC))[0])
+
+    def _map(self) -> None:
+        # 他のプロセスが追記中の末尾（1件に満たない部分）は読まない
+        self.records = None
+        if self.dim is None:
+            return
+        size = os.path.getsize(self.path) - self.HEADER_SIZE
+        count = size // self._record_dtype(self.dim).itemsize
+        if count > 0:
+            self.records = np.memmap(
+                self.path, dtype=self._record_dtype(self.dim), mode="r", offset=self.HEADER_SIZE, shape=(count,)
+            )
+
+    def _load(self):
+        self.rows: Dict[bytes, int] = {}
+        self.dim = self._read_dim()
+        try:
+            self._map()
+        except (OSError, ValueError):
+            self.dim, self.records = None, None
+            return
+        if self.records is not None:
+            self.rows = {bytes(k): i for i, k in enumerate(self.records["key"])}
+
+    def _create(self, dim: int) -> bool:
+        """Create the file with its header unless another process already did; True if dim matches."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        header = self.MAGIC + np.array([dim], dtype="<u4").tobytes()
+        header += b"\0" * (self.HEADER_SIZE - len(header))
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+        try:
+            # link は既にファイルがあれば失敗する（追記済みのファイルを上書きしない）
+            os.link(tmp, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+        self.dim = self._read_dim()
+        return self.dim == dim
+
+    def get(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], List[int]]:
+        """Return (cached vector or None per text, indexes of the texts that are missing)."""
+        with self._lock:
+            found = [self.rows.get(self.key(t)) for t in texts]
+            vectors = [
+                np.array(self.records["vector"][i], dtype=np.float32) if i is not None else None for i in found
+            ]
+            missing = [i for i, row in enumerate(found) if row is None]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return vectors, missing
+
+    def put(self, texts: List[str], vectors: np.ndarray):
+        """Append the new vectors (O(new entries), the existing records are never rewritten)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        with self._lock:
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self.rows:
+                    new[key] = vector
+            if not new:
+                return
+            dim = vectors.shape[1]
+            if (self.dim != dim or not os.path.exists(self.path)) and not self._create(dim):
+                # 次元が違う（別のモデルのファイルなど）場合は保存しない
+                return
+            records = np.empty(len(new), dtype=self._record_dtype(dim))
+            records["key"] = list(new)
+            records["vector"] = list(new.values())
+            # O_APPEND で1回の write にまとめる（他のプロセスの追記と混ざらない）
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, records.tobytes())
+                end = os.lseek(fd, 0, os.SEEK_CUR)
+            finally:
+                os.close(fd)
+            first = (end - self.HEADER_SIZE) // records.itemsize - len(new)
+            self._map()
+            self.rows.update({key: first + i for i, key in enumerate(new)})
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self.rows), 'hits': self.hits, 'misses': self.misses}
+
 
 class ExemplarStore:
-    def __init__(self, embedding_model: str = 'sentence-transformers/all-MiniLM-L6-v2'):
-        self.encoder = SentenceTransformer(embedding_model)
+    # プロセス内で共有するインスタンス（モデル名ごと）
+    _shared: Dict[Tuple[str, Optional[str]], "ExemplarStore"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        initial_capacity: int = 64,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        encoder: Any = None,
+        index: str | VectorIndex = "auto",
+        embedding_dtype: str = "float32",
+    ):
+        # モデルは最初に埋め込みが必要になったときに読み込む
+        self.encoder = encoder if encoder is not None else LazyEncoder(embedding_model)
+        # 質問の埋め込みは意味キャッシュ・RefinementMemory と共有するメモ経由で計算する（同じ質問は1回だけ）
+        if encoder is None:
+            self.memo = EmbeddingMemo.shared(embedding_model, lambda: self.encoder)
+        else:
+            self.memo = EmbeddingMemo(encoder, embedding_model)
+        # 埋め込みはモデル名 + 質問のハッシュでディスクに保存し、次回の起動では読み込むだけにする
+        self.disk_cache = EmbeddingDiskCache(cache_dir, embedding_model) if cache_dir else None
         self.exemplars = []
-        self.embeddings = None
+        # 埋め込みは L2 正規化してインデックスの行列に追記する（件数が増えたら IVF の近似検索に切り替わる）
+        # embedding_dtype="float16" / "int8" で量子化するとメモリが 1/2 / 1/4 になる
+        if isinstance(index, str):
+            index = make_index(index, initial_capacity=initial_capacity, dtype=embedding_dtype)
+        self.index = index
+        self._lock = threading.Lock()
         self.load_default_exemplars()
 
+    @classmethod
+    def shared(
+        cls, embedding_model: str = DEFAULT_EMBEDDING_MODEL, cache_dir: Optional[str] = DEFAULT_CACHE_DIR
+    ) -> "ExemplarStore":
+        """Return the process-wide store for embedding_model, building it only once."""
+        with cls._shared_lock:
+            key = (embedding_model, cache_dir)
+            if key not in cls._shared:
+                cls._shared[key] = cls(embedding_model, cache_dir=cache_dir)
+            return cls._shared[key]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """L2-normalized float32 embeddings (dequantized if the index is quantized)."""
+        return self.index.as_float32()
+
     def add_exemplar(self, question: str, cypher: str, schema_context: str = ""):
-        exemplar = {
+        self.add_exemplars([{
             "question": question,
             "cypher": cypher,
             "schema_context": schema_context
-        }
-        self.exemplars.append(exemplar)
-        # 埋め込み更新
-        self._update_embeddings()
-    
+        }])
+
+    def snapshot(self) -> Tuple[VectorIndex, List[Dict]]:
+        """The current (index, exemplars) pair; positions in one agree with rows in the other."""
+        with self._lock:
+            return self.index, self.exemplars
+
+    def cache_vectors(self, questions: List[str], vectors: np.ndarray) -> None:
+        """Persist already-computed embeddings of normalized questions to the disk cache."""
+        if self.disk_cache is not None:
+            self.disk_cache.put(questions, vectors)
+
+    def add_exemplars(
+        self, exemplars: List[Dict], vectors: Optional[np.ndarray] = None, persist: bool = True, train: bool = True
+    ):
+        """
+        Add many exemplars with a single batched encoder pass.
+        Pass vectors when the question embeddings are already known (e.g. from the memo);
+        with persist=False the caller writes them with cache_vectors later, and with
+        train=False it calls train_index later (outside its own lock).
+        """
+        exemplars = [
+            {"question": ex["question"], "cypher": ex["cypher"], "schema_context": ex.get("schema_context", "")}
+            for ex in exemplars
+        ]
+        if not exemplars:
+            return
+        questions = [normalize_question(ex["question"]) for ex in exemplars]
+        if vectors is None:
+            # 新しい質問だけをまとめて埋め込む（既存の質問は再計算しない。検索する質問と同じく正規化する）
+            vectors = self._encode(questions)
+        else:
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(exemplars), -1)
+            if persist:
+                self.cache_vectors(questions, vectors)
+        with self._lock:
+            # 検索はロックを取らないので、インデックスが返す行には必ず例がある順番で追加する
+            self.exemplars.extend(exemplars)
+            self.index.append(vectors)
+        if train:
+            self.train_index()
+
+    def train_index(self) -> None:
+        """Run any due index training (IVF k-means) without holding the store lock."""
+        # 学習中も snapshot と検索はブロックされない（差し替えはインデックスの中でまとめて行う）
+        index, _ = self.snapshot()
+        index.maybe_train()
+
+    def _encode(self, questions: List[str]) -> np.ndarray:
+        """Embed questions, reading from the disk cache and encoding only the missing ones in one batch."""
+        if self.disk_cache is None:
+            return np.asarray(self.encoder.encode(questions), dtype=np.float32)
+        cached, missing = self.disk_cache.get(questions)
+        if missing:
+            encoded = np.asarray(self.encoder.encode([questions[i] for i in missing]), dtype=np.float32)
+            self.disk_cache.put([questions[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+        return np.vstack(cached).astype(np.float32, copy=False)
+
     def _update_embeddings(self):
-        questions = [ex["question"] for ex in self.exemplars]
-        self.embeddings = self.encoder.encode(questions)
-    
+        """Re-encode every stored question (only needed if exemplars were edited in place)."""
+        with self._lock:
+            exemplars = list(self.exemplars)
+        vectors = self._encode([normalize_question(ex["question"]) for ex in exemplars])
+        index = self.index.empty_like()
+        index.add(vectors)
+        with self._lock:
+            self.index, self.exemplars = index, exemplars
+
+    def remove_exemplars(self, indexes: List[int]):
+        """Remove exemplars by position; the index is rebuilt from the stored embeddings without encoding."""
+        drop = set(indexes)
+        if not drop:
+            return
+        with self._lock:
+            keep = [i for i in range(len(self.exemplars)) if i not in drop]
+            vectors = self.index.as_float32()[keep]
+            index = self.index.empty_like()
+            index.append(vectors)
+            # 検索中のスレッドは古いインデックスと例のリストの組をそのまま使える
+            self.index, self.exemplars = index, [self.exemplars[i] for i in keep]
+        index.maybe_train()
+
     def get_similar_exemplars(self, question: str, k:int = 3) -> List[Dict]:
-        if not self.exemplars:
+        index, exemplars = self.snapshot()
+        if not len(index):
             return []
         
-        # 入力質問の埋め込み
-        query_embedding = self.encoder.encode([question])
-
-        # コサイン類似度を計算
-        similarities = np.dot(self.embeddings, query_embedding.T).squeeze()
+        # 入力質問の埋め込み（他の段と同じく正規化した質問で引く。モデルは大文字小文字を区別しない）
+        query_embedding = self.memo.encode([normalize_question(question)])
 
-        # top kのインデックス取得
-        top_k_indices = np.argsort(similarities)[::-1][:k]
+        # コサイン類似度の上位 k 件（正規化済みなので行列 × ベクトル1回、全件のソートはしない）
+        top_k_indices, similarities = index.search(query_embedding, k)
 
         # 類似度スコア付きで返す
         results = []
-        for idx in top_k_indices:
+        for idx, similarity in zip(top_k_indices, similarities):
             results.append({
-                **self.exemplars[idx],
-                "similarity": float(similarities[idx])
+                **exemplars[idx],
+                "similarity": float(similarity)
             })
         
         return results
@@ -80,6 +358,4 @@ class ExemplarStore:
               "schema_context": "Prize nodes have awardYear property (integer), use = for exact year match"
           }
         ]
-        for exemplar in default_exemplars:
-            self.exemplars.append(exemplar)
-        self._update_embeddings()
\ No newline at end of file
+        self.add_exemplars(default_exemplars)
\ No newline at end of file
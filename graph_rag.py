@@ -34,7 +34,8 @@ def _(text_ui):
 @app.cell
 def _(KuzuDatabaseManager, mo, run_graph_rag, text_ui):
     db_name = "nobel.kuzu"
-    db_manager = KuzuDatabaseManager(db_name)
+    # 質問が変わるたびに DB を開き直さないように共有インスタンスを使う
+    db_manager = KuzuDatabaseManager.shared(db_name)
 
     question = text_ui.value
     start_time = time.perf_counter()
@@ -195,18 +196,113 @@ def _(BAMLAdapter, OPENROUTER_API_KEY, dspy):
 
 
 @app.cell
-def _(kuzu):
+def _(
+    CypherValidator,
+    KuzuConnectionPool,
+    PlanCacheStats,
+    PreparedStatementCache,
+    QueryResultCache,
+    SchemaSnapshotCache,
+    contextmanager,
+    copy,
+    database_version,
+    kuzu,
+    threading,
+):
     class KuzuDatabaseManager:
         """Manages Kuzu database connection and schema retrieval."""
 
-        def __init__(self, db_path: str = "ldbc_1.kuzu"):
+        # プロセス内で共有するインスタンス（db_path ごと）
+        _shared: dict[str, "KuzuDatabaseManager"] = {}
+        _shared_lock = threading.Lock()
+
+        def __init__(self, db_path: str = "ldbc_1.kuzu", pool_size: int = 4):
             self.db_path = db_path
             self.db = kuzu.Database(db_path, read_only=True)
+            # スキーマ取得など管理用の接続
             self.conn = kuzu.Connection(self.db)
+            # クエリ実行用の接続プール
+            self.pool = KuzuConnectionPool(lambda: kuzu.Connection(self.db), size=pool_size)
+            # プリペアドステートメントは接続ごと、統計は全接続で共有
+            self.plan_cache_stats = PlanCacheStats()
+            self.schema_cache = SchemaSnapshotCache(db_path)
+            # 結果キャッシュは DB ファイルのバージョンごと（ETL で作り直されたら自動で破棄）
+            self.result_cache = QueryResultCache()
+            # (DB バージョン, DDL フィンガープリント, バリデーター)。DB ファイルが変わったときだけ確認し直す
+            self._validator: tuple[str, str, CypherValidator] | None = None
+
+        @classmethod
+        def shared(cls, db_path: str, pool_size: int = 4) -> "KuzuDatabaseManager":
+            """Return the long-lived manager for db_path, opening the database only once per process."""
+            with cls._shared_lock:
+                if db_path not in cls._shared:
+                    cls._shared[db_path] = cls(db_path, pool_size=pool_size)
+                return cls._shared[db_path]
+
+        @property
+        def db_version(self) -> str:
+            return database_version(self.db_path)
+
+        def connection(self):
+            """Check out a pooled connection: `with db_manager.connection() as conn: ...`"""
+            return self.pool.connection()
+
+        def _statements(self, pooled) -> PreparedStatementCache:
+            statements = pooled.state.get("statements")
+            if statements is None:
+                statements = PreparedStatementCache(pooled.conn, stats=self.plan_cache_stats)
+                pooled.state["statements"] = statements
+            return statements
+
+        @contextmanager
+        def query(self, cypher: str):
+            """
+            Execute cypher on a pooled connection through its prepared-statement cache.
+            Bind/plan errors raise RuntimeError before anything runs (the compile step is the dry run).
+            The result is only valid inside the `with` block.
+            """
+            with self.pool.checkout() as pooled:
+                yield self._statements(pooled).execute(cypher)
+
+        def fetch_column(self, cypher: str) -> list:
+            """Run cypher and return the values of its first column."""
+            with self.query(cypher) as result:
+                return result.get_as_arrow().column(0).to_pylist()
+
+        def validate(self, cypher: str, db_version: str | None = None) -> None:
+            """
+            Check cypher against the cached schema without touching a connection.
+            Raises CypherValidationError; query() then compiles and executes on one connection.
+            """
+            db_version = db_version or self.db_version
+            validator = self._validator
+            if validator is None or validator[0] != db_version:
+                # スキーマのスナップショットを引くのは DB ファイルが変わったときだけ
+                snapshot = self.schema_cache.get(self.conn, self._introspect_schema)
+                if validator is None or validator[1] != snapshot.ddl_fingerprint:
+                    validator = (db_version, snapshot.ddl_fingerprint, CypherValidator(snapshot.schema))
+                else:
+                    validator = (db_version, *validator[1:])
+                self._validator = validator
+            validator[2].validate(cypher)
+            # コンパイル（EXPLAIN 相当）は query() が実行と同じ接続で行う。別の接続で prepare すると
+            # プランは再利用されず、プランキャッシュの参照も1回の実行で2回数えてしまう
 
         @property
         def get_schema_dict(self) -> dict[str, list[dict]]:
             dict_start_time = time.perf_counter()
+            # キャッシュしたスナップショットは共有しているのでコピーを返す
+            schema = copy.deepcopy(self.schema_cache.get(self.conn, self._introspect_schema).schema)
+            dict_end_time = time.perf_counter()
+            dict_time = (dict_end_time - dict_start_time) * 1000
+            print(f"Time taken to get schema as dict: {dict_time:.2f} milliseconds")
+            return schema
+
+        @property
+        def get_schema_str(self) -> str:
+            return self.schema_cache.get(self.conn, self._introspect_schema).schema_str
+
+        def _introspect_schema(self) -> dict[str, list[dict]]:
             response = self.conn.execute("CALL SHOW_TABLES() WHERE type = 'NODE' RETURN *;")
             nodes = [row[1] for row in response]  # type: ignore
             response = self.conn.execute("CALL SHOW_TABLES() WHERE type = 'REL' RETURN *;")
@@ -236,9 +332,6 @@ def _(kuzu):
                 for row in rel_properties:  # type: ignore
                     edge["properties"].append({"name": row[1], "type": row[2]})  # type: ignore
                 schema["edges"].append(edge)
-            dict_end_time = time.perf_counter()
-            dict_time = (dict_end_time - dict_start_time) * 1000
-            print(f"Time taken to get schema as dict: {dict_time:.2f} milliseconds")
             return schema
     return (KuzuDatabaseManager,)
 
@@ -273,9 +366,14 @@ def _(BaseModel, Field):
 
 
 @app.cell
-def _(
+def graph_rag_pipeline(
+    AnswerCache,
     AnswerQuestion,
     Any,
+    CypherTemplateEngine,
+    DEFAULT_CACHE_PATH,
+    DEFAULT_MINED_PATH,
+    asyncio,
     KuzuDatabaseManager,
     PruneSchema,
     Query,
@@ -283,8 +381,18 @@ def _(
     dspy,
     Text2CypherWithExemplars,  # 追加
     ExemplarStore,  # ここに追加！
+    ExemplarMiner,
+    PrunedSchemaCache,
+    RefinementMemory,
+    RuleBasedSchemaPruner,
+    SQLiteCacheBackend,
     Text2CypherCache,
-    Text2CypherWithSelfRefinementLoop
+    Text2CypherWithSelfRefinementLoop,
+    ThreadPoolExecutor,
+    compact_context,
+    fetch_table,
+    normalize_question,
+    pruned_schema_dict,
 ):
     class GraphRAG(dspy.Module):
         """
@@ -292,27 +400,78 @@ def _(
         on the Kuzu database, to generate a natural language response.
         """
 
-        def __init__(self, use_exemplars: bool = True, use_cache: bool = True, use_loop: bool = True):
+        def __init__(
+            self,
+            use_exemplars: bool = True,
+            use_cache: bool = True,
+            use_loop: bool = True,
+            cache_path: str | None = DEFAULT_CACHE_PATH,
+            answer_cache_ttl: float | None = 24 * 60 * 60,
+            context_token_budget: int = 2000,
+            use_rule_pruner: bool = True,
+            use_templates: bool = True,
+            mine_exemplars: bool = False,
+            mined_exemplars_path: str | None = DEFAULT_MINED_PATH,
+        ):
             self.prune = dspy.Predict(PruneSchema)
+            # ルールで十分に絞り込めた質問は PruneSchema（LLM）を呼ばない
+            self.schema_pruner = RuleBasedSchemaPruner() if use_rule_pruner else None
+            # よくある形の質問はテンプレートから Cypher を作る（Text2Cypher を呼ばない）
+            self.template_engine = CypherTemplateEngine() if use_templates else None
             self.use_exemplars = use_exemplars
             self.use_loop = use_loop
-            self.triples = []
+            # AnswerQuestion に渡すコンテキストの上限（トークン数の概算）
+            self.context_token_budget = context_token_budget
 
             if use_exemplars:
-                self.exemplar_store = ExemplarStore()
+                # モデルと埋め込みはプロセス内で共有（GraphRAG を作り直しても読み込み直さない）
+                self.exemplar_store = ExemplarStore.shared()
                 if use_loop:
                     self.text2cypher = dspy.ChainOfThought(Text2CypherWithSelfRefinementLoop)
                 else:
                     self.text2cypher = dspy.ChainOfThought(Text2CypherWithExemplars)                
             else:  
                 self.text2cypher = dspy.ChainOfThought(Text2Cypher)
+            # LLM が作って実行に成功したクエリを例として ExemplarStore に追加していく（保存して次回も使う）
+            # ファイルに書き込むので mine_exemplars=True を指定したときだけ
+            self.exemplar_miner = None
+            if use_exemplars and mine_exemplars:
+                self.exemplar_miner = ExemplarMiner.shared(self.exemplar_store, mined_exemplars_path)
+            # 自己修正ループの失敗の記録（質問ごと・件数とトークン数に上限あり）
+            self.refinement_memory = RefinementMemory(
+                encoder=self.exemplar_store.memo if use_exemplars else None
+            )
             
             if use_cache:
-                self.cache = Text2CypherCache()
+                # 言い換えた質問も拾えるように、ExemplarStore のエンコーダーを近似ティアで再利用
+                # （埋め込みのメモ経由なので、ExemplarStore で計算した質問の埋め込みをそのまま使う）
+                encoder = self.exemplar_store.memo if use_exemplars else None
+                # cache_path があれば再起動後・他プロセスとも共有できるように SQLite に永続化
+                backend = SQLiteCacheBackend(cache_path, namespace="text2cypher") if cache_path else None
+                # 一部の質問に偏ったトラフィックなので、1回きりの質問に押し出されにくい ARC を使う
+                self.cache = Text2CypherCache(semantic_encoder=encoder, backend=backend, warm_start=50, policy="arc")
+                self.prune_cache = PrunedSchemaCache()
+                # 回答もキャッシュ（質問・クエリ・コンテキストがすべて同じなら LLM を呼ばない）
+                answer_backend = None
+                if cache_path:
+                    answer_backend = SQLiteCacheBackend(cache_path, namespace="answer", ttl=answer_cache_ttl)
+                self.answer_cache = AnswerCache(backend=answer_backend, warm_start=50, ttl=answer_cache_ttl)
             else:
                 self.cache = None
+                self.prune_cache = None
+                self.answer_cache = None
             self.generate_answer = dspy.ChainOfThought(AnswerQuestion)
 
+        def prefetch_embeddings(self, questions: list[str]) -> None:
+            """Encode the (normalized) questions of a batch in one forward pass before the pipeline runs."""
+            if not self.use_exemplars or not questions:
+                return
+            start = time.perf_counter()
+            encoded = self.exemplar_store.memo.prefetch([normalize_question(q) for q in questions])
+            if encoded:
+                prefetch_time = (time.perf_counter() - start) * 1000
+                print(f"Time taken for encoding {encoded} questions: {prefetch_time:.2f} milliseconds")
+
         def _format_exemplars(self, exemplars: list[dict]) -> str:
             """例を読みやすい形式にフォーマット"""
             formatted = []
@@ -335,60 +494,264 @@ def _(
                 blocks.append(block)
             return "\n".join(blocks)
 
-        def get_cypher_query(self, question: str, input_schema: str) -> Query:
-            prune_start = time.perf_counter()
-            prune_result = self.prune(question=question, input_schema=input_schema)
-            prune_end = time.perf_counter()
-            prune_time = (prune_end - prune_start) * 1000
+        def _rule_prune(self, question: str, input_schema: str):
+            """Return the rule-based pruned schema, or None when the LLM pruner should be used."""
+            if self.schema_pruner is None:
+                return None
+            rule_result = self.schema_pruner.prune(question, input_schema)
+            if not rule_result.accepted:
+                print(
+                    f"Rule-based pruning confidence {rule_result.confidence:.2f} below "
+                    f"{self.schema_pruner.threshold:.2f}, falling back to PruneSchema"
+                )
+                return None
+            print(
+                f"Time taken for rule-based pruning: {rule_result.elapsed_ms:.2f} milliseconds "
+                f"(confidence {rule_result.confidence:.2f})"
+            )
+            saved = self.schema_pruner.get_stats()['estimated_saved_ms']
+            if saved is not None:
+                print(f"Estimated time saved by rule-based pruning so far: {saved:.2f} milliseconds")
+            return rule_result.schema
+
+        def _record_llm_prune(self, prune_time: float) -> None:
             print(f"Time taken for pruning schema: {prune_time:.2f} milliseconds")
-            schema = prune_result.pruned_schema
-
-            create_query_start = time.perf_counter()
-            # キャッシュをチェック
-            if hasattr(self, 'cache') and self.cache:
-                cache_result = self.cache.get(question, str(schema))
-                if cache_result:
-                    print(f"Cache hit \n Stats: {self.cache.get_stats()}")
-                    create_query_end = time.perf_counter()
-                    create_query_time = (create_query_end - create_query_start) * 1000
-                    print(f"Time taken for creating query with cache: {create_query_time:.2f} milliseconds")
-                    return cache_result['query']
-            # キャッシュヒットしない場合はクエリ生成
+            if self.schema_pruner is not None:
+                self.schema_pruner.record_llm_latency(prune_time)
+
+        def _prune_schema(self, question: str, input_schema: str):
+            def prune():
+                rule_schema = self._rule_prune(question, input_schema)
+                if rule_schema is not None:
+                    return rule_schema
+                prune_start = time.perf_counter()
+                prune_result = self.prune(question=question, input_schema=input_schema)
+                prune_end = time.perf_counter()
+                self._record_llm_prune((prune_end - prune_start) * 1000)
+                # ルールで絞り込んだ場合と同じ dict の形にそろえる
+                return pruned_schema_dict(prune_result.pruned_schema)
+
+            if self.prune_cache is None:
+                return prune()
+            # 同じ質問・同じスキーマなら前回の prune 結果を再利用（同時に来た場合も1回だけ prune）
+            cached_schema, computed = self.prune_cache.get_or_compute(question, input_schema, prune)
+            if not computed:
+                print("Pruned schema cache hit, skipping PruneSchema")
+            # キャッシュ（メモリ上だけ）には prune() がそろえた dict が入っている。他の呼び出しと共有しているので作り直して返す
+            return pruned_schema_dict(cached_schema['pruned_schema'])
+
+        async def _aprune_schema(self, question: str, input_schema: str):
+            async def prune():
+                # ルールでの絞り込みは 1ms 未満なのでイベントループ上でそのまま行う
+                rule_schema = self._rule_prune(question, input_schema)
+                if rule_schema is not None:
+                    return rule_schema
+                prune_start = time.perf_counter()
+                prune_result = await self.prune.acall(question=question, input_schema=input_schema)
+                prune_end = time.perf_counter()
+                self._record_llm_prune((prune_end - prune_start) * 1000)
+                return pruned_schema_dict(prune_result.pruned_schema)
+
+            if self.prune_cache is None:
+                return await prune()
+            cached_schema, computed = await self.prune_cache.aget_or_compute(question, input_schema, prune)
+            if not computed:
+                print("Pruned schema cache hit, skipping PruneSchema")
+            return pruned_schema_dict(cached_schema['pruned_schema'])
+
+        def _text2cypher_inputs(self, question: str, schema, similar_examples: list[dict]) -> dict:
+            inputs = {"question": question, "input_schema": schema}
             if self.use_exemplars:
-                # 類似した例を取得
-                similar_examples = self.exemplar_store.get_similar_exemplars(question, k=3)
-                exemplars_text = self._format_exemplars(similar_examples)
                 # Text2Cypherに例を渡す、ループがオンなら追加で過去の質問、クエリとエラーメッセージを渡す
+                inputs["exemplars"] = self._format_exemplars(similar_examples)
                 if self.use_loop:
-                    triples_text = self._format_triples(self.triples)
-                    text2cypher_result = self.text2cypher(
-                        question=question,
-                        input_schema=schema,
-                        exemplars = exemplars_text,
-                        triples = triples_text
+                    inputs["triples"] = self._format_triples(self.refinement_memory.relevant(question))
+            return inputs
+
+        def _template_query(self, question: str) -> Query | None:
+            if self.template_engine is None:
+                return None
+            match = self.template_engine.match(question)
+            if match is None:
+                return None
+            print(f"Template hit ({match.name}: {match.params}), skipping Text2Cypher \n Stats: {self.template_engine.get_stats()}")
+            return Query(query=match.cypher)
+
+        def _load_template_values(self, db_manager: KuzuDatabaseManager) -> None:
+            # スロットの値（分野・国・機関）はグラフから取得し、DB が作り直されたら取り直す
+            if self.template_engine is not None:
+                self.template_engine.load_values(db_manager.db_version, db_manager.fetch_column)
+
+        def _generate_cypher(self, question: str, input_schema: str, attempt: dict | None = None) -> Query:
+            template_query = self._template_query(question)
+            if template_query is not None:
+                return template_query
+            schema = self._prune_schema(question, input_schema)
+            # 類似した例を取得
+            similar_examples = self.exemplar_store.get_similar_exemplars(question, k=3) if self.use_exemplars else []
+            if attempt is not None:
+                # 再試行で使い回せるように残しておく
+                attempt.update(schema=schema, similar_examples=similar_examples)
+            text2cypher_result = self.text2cypher(**self._text2cypher_inputs(question, schema, similar_examples))
+            return text2cypher_result.query
+
+        async def _agenerate_cypher(
+            self, question: str, input_schema: str, exemplars_task, attempt: dict | None = None
+        ) -> Query:
+            template_query = self._template_query(question)
+            if template_query is not None:
+                return template_query
+            # prune（LLM）と類似例の検索（エンコーダー）は独立しているので並行して待つ
+            if exemplars_task is None:
+                schema = await self._aprune_schema(question, input_schema)
+                similar_examples = []
+            else:
+                schema, similar_examples = await asyncio.gather(
+                    self._aprune_schema(question, input_schema), exemplars_task
+                )
+            if attempt is not None:
+                attempt.update(schema=schema, similar_examples=similar_examples)
+            text2cypher_result = await self.text2cypher.acall(
+                **self._text2cypher_inputs(question, schema, similar_examples)
+            )
+            return text2cypher_result.query
+
+        def _regenerate_cypher(self, question: str, input_schema: str, attempt: dict) -> Query:
+            """
+            Retry only the Text2Cypher step, reusing the pruned schema and exemplars of the
+            first attempt (the refinement memory adds the new failure to the prompt).
+            """
+            if "schema" not in attempt:
+                # 1回目がキャッシュから返った場合は、ここで一度だけ prune する
+                attempt["schema"] = self._prune_schema(question, input_schema)
+                attempt["similar_examples"] = (
+                    self.exemplar_store.get_similar_exemplars(question, k=3) if self.use_exemplars else []
+                )
+            text2cypher_result = self.text2cypher(
+                **self._text2cypher_inputs(question, attempt["schema"], attempt["similar_examples"])
+            )
+            return text2cypher_result.query
+
+        async def _aregenerate_cypher(self, question: str, input_schema: str, attempt: dict) -> Query:
+            if "schema" not in attempt:
+                if self.use_exemplars:
+                    attempt["schema"], attempt["similar_examples"] = await asyncio.gather(
+                        self._aprune_schema(question, input_schema),
+                        asyncio.to_thread(self.exemplar_store.get_similar_exemplars, question, 3),
                     )
                 else:
-                    text2cypher_result = self.text2cypher(
-                        question=question,
-                        input_schema=schema,
-                        exemplars=exemplars_text
-                    )
+                    attempt["schema"] = await self._aprune_schema(question, input_schema)
+                    attempt["similar_examples"] = []
+            text2cypher_result = await self.text2cypher.acall(
+                **self._text2cypher_inputs(question, attempt["schema"], attempt["similar_examples"])
+            )
+            return text2cypher_result.query
+
+        def get_cypher_query(self, question: str, input_schema: str, attempt: dict | None = None) -> Query:
+            create_query_start = time.perf_counter()
+            if self.cache is None:
+                cypher_query = self._generate_cypher(question, input_schema, attempt)
+                computed = True
             else:
-                text2cypher_result = self.text2cypher(question=question, input_schema=schema)
-            cypher_query = text2cypher_result.query
-            
-            # キャッシュに追加
-            if hasattr(self, 'cache') and self.cache:
-                self.cache.set(question, str(schema), cypher_query)
+                # キャッシュをチェック（prune の前に、正規化した質問と完全なスキーマで引く）
+                # ミスした場合は生成してキャッシュに追加。同じ質問が同時に来ても LLM 呼び出しは1回
+                cache_result, computed = self.cache.get_or_compute(
+                    question, input_schema, lambda: self._generate_cypher(question, input_schema, attempt).query
+                )
+                cypher_query = Query(query=cache_result['query'])
+                if not computed:
+                    if 'similarity' in cache_result:
+                        print(f"Semantic cache hit (similarity: {cache_result['similarity']:.2f})")
+                    print(f"Cache hit \n Stats: {self.cache.get_stats()}")
 
             create_query_end = time.perf_counter()
             create_query_time = (create_query_end - create_query_start) * 1000
-            print(f"Time taken for creating query without cache: {create_query_time:.2f} milliseconds")
+            if computed:
+                print(f"Time taken for creating query without cache: {create_query_time:.2f} milliseconds")
+            else:
+                print(f"Time taken for creating query with cache: {create_query_time:.2f} milliseconds")
             return cypher_query
 
+        async def aget_cypher_query(
+            self, question: str, input_schema: str, attempt: dict | None = None
+        ) -> Query:
+            create_query_start = time.perf_counter()
+            # 類似例の検索はキャッシュの確認と並行して先に始めておく（ヒットしたら使わない）
+            exemplars_task = None
+            if self.use_exemplars:
+                exemplars_task = asyncio.ensure_future(
+                    asyncio.to_thread(self.exemplar_store.get_similar_exemplars, question, 3)
+                )
+            try:
+                if self.cache is None:
+                    cypher_query = await self._agenerate_cypher(question, input_schema, exemplars_task, attempt)
+                    computed = True
+                else:
+                    cache_result, computed = await self.cache.aget_or_compute(
+                        question,
+                        input_schema,
+                        lambda: self._aquery_text(question, input_schema, exemplars_task, attempt),
+                    )
+                    cypher_query = Query(query=cache_result['query'])
+                    if not computed:
+                        if 'similarity' in cache_result:
+                            print(f"Semantic cache hit (similarity: {cache_result['similarity']:.2f})")
+                        print(f"Cache hit \n Stats: {self.cache.get_stats()}")
+            finally:
+                if exemplars_task is not None and not exemplars_task.done():
+                    exemplars_task.cancel()
+
+            create_query_end = time.perf_counter()
+            create_query_time = (create_query_end - create_query_start) * 1000
+            if computed:
+                print(f"Time taken for creating query without cache: {create_query_time:.2f} milliseconds")
+            else:
+                print(f"Time taken for creating query with cache: {create_query_time:.2f} milliseconds")
+            return cypher_query
+
+        async def _aquery_text(self, question: str, input_schema: str, exemplars_task, attempt: dict) -> str:
+            return (await self._agenerate_cypher(question, input_schema, exemplars_task, attempt)).query
+
+        def _execute(self, db_manager: KuzuDatabaseManager, query: str) -> Any:
+            # 同じ Cypher・同じ DB バージョンなら前回の結果を返す（DB は ETL 以外では更新されない）
+            db_version = db_manager.db_version
+            cached_results = db_manager.result_cache.get(query, db_version)
+            if cached_results is not None:
+                print("Result cache hit, skipping query execution")
+                return cached_results
+            # 実行する前にスキーマと照合する（問題があれば自己修正ループへ）。コンパイルに失敗した場合も実行前に RuntimeError
+            db_manager.validate(query, db_version)
+            # Run the query on the database (プールから接続を借りるので並行して実行できる)
+            # リテラルをパラメータにしたテンプレートでプランを再利用する
+            # 行ごとに Python のリストを作らず、Arrow の列形式のまま受け取る
+            with db_manager.query(query) as result:
+                results = fetch_table(result)
+            db_manager.result_cache.set(query, db_version, results)
+            return results
+
+        def _record_failure(self, question: str, query: str, input_schema: str, error: Exception) -> None:
+            newTriple = self.refinement_memory.add(question, query, str(error))
+            print(f"Error running query, new triple added: {newTriple}")
+            # 失敗したクエリがキャッシュから返され続けないように削除
+            if self.cache is not None:
+                self.cache.invalidate(question, input_schema)
+
+        def _cache_refined(self, question: str, input_schema: str, query: str, tries: int) -> None:
+            # 再生成したクエリは実行に成功してからキャッシュする（失敗するクエリを返さない）
+            if self.cache is not None and tries > 1:
+                self.cache.set(question, input_schema, query)
+
+        def _mine_exemplar(self, question: str, query: str, results: Any, attempt: dict, tries: int) -> None:
+            # Text2Cypher（LLM）を呼んだときだけ（テンプレート・キャッシュのクエリは対象外）
+            if self.exemplar_miner is None or results is None or "schema" not in attempt:
+                return
+            rows = results.num_rows if hasattr(results, "num_rows") else len(results)
+            if self.exemplar_miner.record(question, query, rows, tries):
+                print(f"New exemplar mined \n Stats: {self.exemplar_miner.get_stats()}")
+
         def run_query(
             self, db_manager: KuzuDatabaseManager, question: str, input_schema: str
-        ) -> tuple[str, list[Any] | None]:
+        ) -> tuple[str, Any | None]:
             """
             Run a query synchronously on the database.
             """
@@ -398,80 +761,230 @@ def _(
             
             max_tries = 5 if self.use_loop else 1
             tries = 0
+            attempt = {}
+
+            query_start = time.perf_counter()
+            while True:
+                try:
+                    tries += 1
+                    if tries == 1:
+                        result = self.get_cypher_query(question=question, input_schema=input_schema, attempt=attempt)
+                    else:
+                        # 再試行では Text2Cypher だけ呼び直す（prune と類似例は1回目のものを使う）
+                        result = self._regenerate_cypher(question, input_schema, attempt)
+                    query = result.query
+                    results = self._execute(db_manager, query)
+                    self._cache_refined(question, input_schema, query, tries)
+                    break
+                except RuntimeError as e:
+                    if tries >= max_tries:
+                        print(f"Maximum number of error running query passed, giving up")
+                        results = None
+                        break
+                    self._record_failure(question, query, input_schema, e)
+            self._mine_exemplar(question, query, results, attempt, tries)
+
+            query_end = time.perf_counter()
+            query_time = (query_end - query_start) * 1000
+            print(f"Time taken for running query: {query_time:.2f} milliseconds")
+            print(f"Plan cache stats: {db_manager.plan_cache_stats.get_stats()}")
+            return query, results
+
+        async def arun_query(
+            self, db_manager: KuzuDatabaseManager, question: str, input_schema: str
+        ) -> tuple[str, Any | None]:
+            """
+            Run a query on the database without blocking the event loop.
+            """
+            query = ""
+            max_tries = 5 if self.use_loop else 1
+            tries = 0
+            attempt = {}
 
             query_start = time.perf_counter()
             while True:
                 try:
                     tries += 1
-                    result = self.get_cypher_query(question=question, input_schema=input_schema)
+                    if tries == 1:
+                        result = await self.aget_cypher_query(
+                            question=question, input_schema=input_schema, attempt=attempt
+                        )
+                    else:
+                        result = await self._aregenerate_cypher(question, input_schema, attempt)
                     query = result.query
-                    # Run the query on the database
-                    result = db_manager.conn.execute(query)
-                    results = [item for row in result for item in row]
+                    # Kuzu の execute はブロッキングなのでスレッドプールで実行
+                    results = await asyncio.to_thread(self._execute, db_manager, query)
+                    await asyncio.to_thread(self._cache_refined, question, input_schema, query, tries)
                     break
                 except RuntimeError as e:
                     if tries >= max_tries:
                         print(f"Maximum number of error running query passed, giving up")
                         results = None
                         break
-                    newTriple = {
-                        "question": question,
-                        "query": query,
-                        "errorMessage": str(e)
-                    }
-                    print(f"Error running query, new triple added: {newTriple}")
-                    self.triples.append(newTriple)
+                    # 失敗の記録（エンコード）とキャッシュの削除（SQLite）はイベントループの外で
+                    await asyncio.to_thread(self._record_failure, question, query, input_schema, e)
+            await asyncio.to_thread(self._mine_exemplar, question, query, results, attempt, tries)
 
             query_end = time.perf_counter()
             query_time = (query_end - query_start) * 1000
             print(f"Time taken for running query: {query_time:.2f} milliseconds")
+            print(f"Plan cache stats: {db_manager.plan_cache_stats.get_stats()}")
             return query, results
 
+        def _answer(self, question: str, cypher_query: str, context: str):
+            if self.answer_cache is None:
+                return self.generate_answer(question=question, cypher_query=cypher_query, context=context)
+            answer_start = time.perf_counter()
+            cache_result, computed = self.answer_cache.get_or_compute_answer(
+                question,
+                cypher_query,
+                context,
+                lambda: self.generate_answer(
+                    question=question, cypher_query=cypher_query, context=context
+                ).toDict(),
+            )
+            if not computed:
+                answer_time = (time.perf_counter() - answer_start) * 1000
+                print(f"Answer cache hit, time taken: {answer_time:.2f} milliseconds")
+            return dspy.Prediction(**cache_result['answer'])
+
+        async def _aanswer(self, question: str, cypher_query: str, context: str):
+            if self.answer_cache is None:
+                return await self.generate_answer.acall(question=question, cypher_query=cypher_query, context=context)
+
+            async def generate():
+                answer = await self.generate_answer.acall(
+                    question=question, cypher_query=cypher_query, context=context
+                )
+                return answer.toDict()
+
+            answer_start = time.perf_counter()
+            cache_result, computed = await self.answer_cache.aget_or_compute_answer(
+                question, cypher_query, context, generate
+            )
+            if not computed:
+                answer_time = (time.perf_counter() - answer_start) * 1000
+                print(f"Answer cache hit, time taken: {answer_time:.2f} milliseconds")
+            return dspy.Prediction(**cache_result['answer'])
+
+        def _compact_context(self, results: Any) -> tuple[str, dict]:
+            # 大きな結果をそのまま渡すとプロンプトが膨らむので、予算内に圧縮する
+            context, context_metadata = compact_context(results, self.context_token_budget)
+            if context_metadata['truncated']:
+                print(
+                    f"Context truncated to {context_metadata['rows_kept']} of "
+                    f"{context_metadata['unique_rows']} unique rows "
+                    f"(~{context_metadata['estimated_tokens']} tokens)"
+                )
+            return context, context_metadata
+
         def forward(self, db_manager: KuzuDatabaseManager, question: str, input_schema: str):
+            self._load_template_values(db_manager)
             final_query, final_context = self.run_query(db_manager, question, input_schema)
             if final_context is None:
                 print("Empty results obtained from the graph database. Please retry with a different question.")
                 return {}
             else:
-                answer = self.generate_answer(
-                    question=question, cypher_query=final_query, context=str(final_context)
-                )
+                context, context_metadata = self._compact_context(final_context)
+                answer = self._answer(question, final_query, context)
                 response = {
                     "question": question,
                     "query": final_query,
                     "answer": answer,
+                    "context_metadata": context_metadata,
                 }
                 return response
 
         async def aforward(self, db_manager: KuzuDatabaseManager, question: str, input_schema: str):
-            final_query, final_context = self.run_query(db_manager, question, input_schema)
+            await asyncio.to_thread(self._load_template_values, db_manager)
+            final_query, final_context = await self.arun_query(db_manager, question, input_schema)
             if final_context is None:
                 print("Empty results obtained from the graph database. Please retry with a different question.")
                 return {}
             else:
-                answer = self.generate_answer(
-                    question=question, cypher_query=final_query, context=str(final_context)
-                )
+                context, context_metadata = self._compact_context(final_context)
+                answer = await self._aanswer(question, final_query, context)
                 response = {
                     "question": question,
                     "query": final_query,
                     "answer": answer,
+                    "context_metadata": context_metadata,
                 }
                 return response
 
     graph_rag_instance = GraphRAG()
-    def run_graph_rag(questions: list[str], db_manager: KuzuDatabaseManager) -> list[Any]:
-        schema = str(db_manager.get_schema_dict)
+
+    async def arun_graph_rag(
+        questions: list[str],
+        db_manager: KuzuDatabaseManager,
+        max_concurrency: int = 8,
+        rag: GraphRAG | None = None,
+    ) -> list[Any]:
+        """
+        Run a batch of questions concurrently (at most max_concurrency at a time).
+        Identical questions are answered once; results are returned in input order,
+        each with its own `elapsed_ms`.
+        """
+        schema = db_manager.get_schema_str
+        rag = rag or graph_rag_instance
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 同じ質問は1回だけ処理する
+        unique_questions: dict[str, str] = {}
+        for question in questions:
+            unique_questions.setdefault(normalize_question(question), question)
+
+        async def answer(question: str) -> dict:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await rag.acall(db_manager=db_manager, question=question, input_schema=schema)
+                except Exception as e:
+                    print(f"Error answering question {question!r}: {e}")
+                    response = {"question": question, "error": str(e)}
+                return {**response, "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+        batch_start = time.perf_counter()
+        # 埋め込みはバッチ全体で1回の forward にまとめる
+        await asyncio.to_thread(rag.prefetch_embeddings, list(unique_questions))
+        responses = await asyncio.gather(*[answer(q) for q in unique_questions.values()])
+        by_question = dict(zip(unique_questions, responses))
+        batch_time = (time.perf_counter() - batch_start) * 1000
+        print(
+            f"Time taken for batch of {len(questions)} questions "
+            f"({len(unique_questions)} unique): {batch_time:.2f} milliseconds"
+        )
+        return [dict(by_question[normalize_question(q)]) for q in questions]
+
+    def run_graph_rag(
+        questions: list[str],
+        db_manager: KuzuDatabaseManager,
+        max_concurrency: int = 8,
+        rag: GraphRAG | None = None,
+    ) -> list[Any]:
+        if len(questions) > 1:
+            return _run_coroutine(arun_graph_rag(questions, db_manager, max_concurrency, rag))
+        schema = db_manager.get_schema_str
         # rag = GraphRAG()
-        rag = graph_rag_instance
+        rag = rag or graph_rag_instance
         # Run pipeline
         results = []
         for question in questions:
+            start = time.perf_counter()
             response = rag(db_manager=db_manager, question=question, input_schema=schema)
-            results.append(response)
+            results.append({**response, "elapsed_ms": (time.perf_counter() - start) * 1000})
         return results
 
-    return (run_graph_rag, graph_rag_instance)
+    def _run_coroutine(coro):
+        # marimo などですでにイベントループが動いているスレッドからは asyncio.run できないので別スレッドで実行
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+    return (run_graph_rag, arun_graph_rag, graph_rag_instance)
 
 
 
@@ -483,7 +996,12 @@ def _():
 @app.cell
 def _():
     import marimo as mo
+    import asyncio
+    import copy
     import os
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import contextmanager
     from textwrap import dedent
     from typing import Any
     import time
@@ -494,23 +1012,59 @@ def _():
     from dspy.adapters.baml_adapter import BAMLAdapter
     from pydantic import BaseModel, Field
 
+    from cache_backends import DEFAULT_CACHE_PATH, SQLiteCacheBackend
+    from cypher_templates import CypherTemplateEngine
+    from cypher_validator import CypherValidator
+    from context_format import compact_context, fetch_table
+    from exemplar_miner import DEFAULT_MINED_PATH, ExemplarMiner
     from exemplar_store import ExemplarStore
-    from lru_cache import Text2CypherCache
+    from kuzu_pool import KuzuConnectionPool
+    from prepared_statements import PlanCacheStats, PreparedStatementCache
+    from refinement_memory import RefinementMemory
+    from schema_pruner import RuleBasedSchemaPruner, pruned_schema_dict
+    from result_cache import QueryResultCache
+    from lru_cache import AnswerCache, PrunedSchemaCache, Text2CypherCache, normalize_question
+    from schema_cache import SchemaSnapshotCache, database_version
     
     load_dotenv()
 
     OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
     return (
+        AnswerCache,
         Any,
         BAMLAdapter,
+        asyncio,
         BaseModel,
+        CypherTemplateEngine,
+        CypherValidator,
+        DEFAULT_CACHE_PATH,
+        DEFAULT_MINED_PATH,
         Field,
         OPENROUTER_API_KEY,
         dspy,
         kuzu,
         mo,
+        ExemplarMiner,
         ExemplarStore,
+        KuzuConnectionPool,
+        PlanCacheStats,
+        PreparedStatementCache,
+        PrunedSchemaCache,
+        QueryResultCache,
+        RefinementMemory,
+        RuleBasedSchemaPruner,
+        SQLiteCacheBackend,
+        SchemaSnapshotCache,
         Text2CypherCache,
+        ThreadPoolExecutor,
+        contextmanager,
+        copy,
+        database_version,
+        compact_context,
+        fetch_table,
+        normalize_question,
+        pruned_schema_dict,
+        threading,
         time
     )
 
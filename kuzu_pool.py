@@ -0,0 +1,164 @@
+# 仕様
+#1. 1つの kuzu.Database に対して複数の Connection をプールし、クエリごとに貸し出す
+#2. 接続は必要になった時点で size 個まで作成し、空きがなければ返却されるまで待つ（timeout 秒）
+#3. 貸し出し時、最後の確認から health_check_interval 秒以上経っていれば "RETURN 1" で死活確認し、
+#    失敗した接続は作り直す
+#4. get_stats で貸し出し回数・待ち時間・作り直した回数などを返す
+#5. タイムアウトは PoolTimeoutError（TimeoutError）。Cypher のエラー（RuntimeError）とは区別する
+#6. close() の後に返却された接続はプールに戻さず閉じる
+#   - close() の後の貸し出しは PoolClosedError（ConnectionError）。タイムアウトと同じく Cypher のエラーとは区別する
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+
+class PoolTimeoutError(TimeoutError):
+    # RuntimeError にすると自己修正ループが Cypher の失敗として扱ってしまう
+    pass
+
+
+class PoolClosedError(ConnectionError):
+    # シャットダウン中に Text2Cypher の再試行やキャッシュの削除が走らないように RuntimeError にはしない
+    pass
+
+
+class _PooledConnection:
+    def __init__(self, conn: Any):
+        self.conn = conn
+        self.last_checked = time.monotonic()
+        # 接続ごとの付加情報（プリペアドステートメントなど）
+        self.state: Dict[str, Any] = {}
+
+
+class KuzuConnectionPool:
+    def __init__(
+        self,
+        connection_factory: Callable[[], Any],
+        size: int = 4,
+        timeout: float = 30.0,
+        health_check_interval: float = 30.0,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.connection_factory = connection_factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._all: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_ms = 0.0
+        self.created = 0
+        self.replaced = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _create(self) -> _PooledConnection:
+        pooled = _PooledConnection(self.connection_factory())
+        self.created += 1
+        return pooled
+
+    def _acquire(self) -> _PooledConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            # まだ size に達していなければ新しく作る
+            if len(self._all) < self.size:
+                pooled = self._create()
+                self._all.append(pooled)
+                return pooled
+        wait_start = time.perf_counter()
+        try:
+            pooled = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeoutError(f"No Kuzu connection available within {self.timeout} seconds") from None
+        with self._lock:
+            self.waits += 1
+            self.wait_time_ms += (time.perf_counter() - wait_start) * 1000
+        return pooled
+
+    def _ensure_healthy(self, pooled: _PooledConnection) -> _PooledConnection:
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return pooled
+        try:
+            pooled.conn.execute("RETURN 1;")
+            pooled.last_checked = time.monotonic()
+            return pooled
+        except Exception:
+            # 壊れた接続は作り直す
+            replacement = self._create()
+            with self._lock:
+                self._all[self._all.index(pooled)] = replacement
+                self.replaced += 1
+            try:
+                pooled.conn.close()
+            except Exception:
+                pass
+            return replacement
+
+    @contextmanager
+    def checkout(self) -> Iterator[_PooledConnection]:
+        if self._closed:
+            raise PoolClosedError("Connection pool is closed")
+        pooled = self._ensure_healthy(self._acquire())
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            yield pooled
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                closed = self._closed
+            if closed:
+                self._close_connection(pooled)
+            else:
+                self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        with self.checkout() as pooled:
+            yield pooled.conn
+
+    @staticmethod
+    def _close_connection(pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            for pooled in self._all:
+                self._close_connection(pooled)
+            self._all.clear()
+        # 空いている接続も捨てる（貸し出し中のものは返却時に閉じる）
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': len(self._all),
+                'in_use': self.in_use,
+                'idle': len(self._all) - self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'avg_wait_ms': self.wait_time_ms / self.waits if self.waits else 0.0,
+                'created': self.created,
+                'replaced': self.replaced,
+            }
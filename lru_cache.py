@@ -2,67 +2,558 @@
 #1. 同じ質問とスキーマの組み合わせ → 同じハッシュキー → キャッシュヒット
 #2. 異なる質問またはスキーマ → 異なるハッシュキー → キャッシュミス
 #3. キャッシュが満杯（100エントリ）になると、最も古いエントリを自動削除
+#4. 質問は正規化（大文字小文字・空白・末尾の記号）してからキーにする
+#5. スキーマはフィンガープリント（SHA-256）でキーに含める
+#6. semantic_encoder を渡すと、完全一致しない言い換えもコサイン類似度で引ける（近似ティア）
+#   - 質問のリテラル（数字・年、文中の大文字で始まる固有名詞、分野の単語）が同じエントリだけを返す
+#     （"... in 1903?" と "... in 1921?" は類似度が高くても別のクエリなのでミスにする）
+#7. backend を渡すとメモリでミスしたときにディスク（SQLite など）を引き、起動時に上位 warm_start 件を読み込む
+#   - メモリでのヒット数は hit_flush_every 件・hit_flush_interval 秒ごと、またはメモリから削除するときにバックエンドへ反映する
+#8. 削除ポリシー（lru / lfu / arc）、エントリごとの TTL、メモリ使用量（バイト）の上限を設定できる
+#9. スレッドセーフ。get_or_compute / aget_or_compute は同じキーの同時ミスを1回の生成にまとめる
+#   - ロックはメモリ上の構造だけを守り、近似ティアのエンコードとバックエンドの I/O はロックの外で行う
+#10. AnswerCache は同じ仕組みで (質問, Cypher, コンテキストのハッシュ) → 回答 をキャッシュする
+import asyncio
+import functools
 import hashlib
+import re
+import sys
+import threading
 import time
 from collections import OrderedDict
-from typing import Dict, Tuple, Optional, Any, List
+from typing import Dict, Tuple, Optional, Any, Awaitable, Callable, List
 import json
 
+import numpy as np
+
+from cache_policies import make_policy
+from result_cache import normalize_cypher
+from single_flight import SingleFlight
+
+
+def normalize_question(question: str) -> str:
+    normalized = re.sub(r"\s+", " ", question).strip().lower()
+    return normalized.rstrip("?!. ")
+
+
+def schema_fingerprint(schema: str) -> str:
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+
+
+def context_fingerprint(context: str) -> str:
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()[:16]
+
+
+# リテラルとして扱う分野の単語（小文字で書かれても値として比べる）
+LITERAL_WORDS = {"physics", "chemistry", "medicine", "physiology", "literature", "peace", "economics", "economic"}
+# 文中で大文字で書かれることが多いが、値ではない単語
+NON_LITERAL_WORDS = {"nobel", "prize", "prizes", "laureate", "laureates", "i"}
+
+
+def question_literals(question: str) -> frozenset:
+    """Values a Cypher query is bound to: numbers, mid-sentence capitalized tokens and category words."""
+    literals = set()
+    for i, token in enumerate(re.findall(r"[A-Za-z][A-Za-z'\-]*|\d+", question)):
+        word = token.lower()
+        if word.endswith("'s"):
+            word = word[:-2]
+        if token.isdigit() or word in LITERAL_WORDS or (i > 0 and token[0].isupper() and word not in NON_LITERAL_WORDS):
+            literals.add(word)
+    return frozenset(literals)
+
+
+def is_expired(entry: Dict[str, Any]) -> bool:
+    expires_at = entry.get('expires_at')
+    return expires_at is not None and expires_at <= time.time()
+
+
+def _synchronized(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SemanticCacheTier:
+    """
+    Approximate tier of Text2CypherCache. Questions are embedded with the given encoder
+    (e.g. the EmbeddingMemo shared with ExemplarStore) and a cached entry is returned when
+    the cosine similarity to a stored question with the same schema fingerprint is at
+    least `threshold` and both questions have the same literals (years, names, categories).
+    Has its own LRU eviction; entries past their `expires_at` are dropped.
+    """
+
+    def __init__(self, encoder: Any, threshold: float = 0.9, maxsize: int = 100):
+        self.encoder = encoder
+        self.threshold = threshold
+        self.maxsize = maxsize
+        # スロット・行列・エントリを守る（エンコードはロックの外）
+        self._lock = threading.Lock()
+        self.clear()
+
+    def _embed(self, question: str) -> np.ndarray:
+        # 同じ質問の2回目以降のエンコードは EmbeddingMemo が省く
+        vector = np.asarray(self.encoder.encode([normalize_question(question)]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector
+
+    def _best_match(
+        self, query_vector: np.ndarray, fingerprint: str, literals: frozenset
+    ) -> Optional[Tuple[str, float]]:
+        if not self.slots:
+            return None
+        similarities = self.matrix @ query_vector
+        best_key, best_similarity = None, self.threshold
+        expired = []
+        for key, slot in self.slots.items():
+            if self.fingerprints[slot] != fingerprint or similarities[slot] < best_similarity:
+                continue
+            if is_expired(self.entries[slot]):
+                expired.append(key)
+                continue
+            if self.literals[slot] != literals:
+                # 年や名前だけが違う質問のクエリは使い回さない
+                self.literal_mismatches += 1
+                continue
+            best_key, best_similarity = key, float(similarities[slot])
+        # TTL が切れたエントリは見つけた時点で削除
+        for key in expired:
+            self._discard(key)
+        self.expirations += len(expired)
+        if best_key is None:
+            return None
+        return best_key, best_similarity
+
+    def lookup(self, question: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        query_vector = self._embed(question) if self.slots else None
+        literals = question_literals(question)
+        with self._lock:
+            match = self._best_match(query_vector, fingerprint, literals) if query_vector is not None else None
+            if match is None:
+                self.misses += 1
+                return None
+            key, similarity = match
+            self.slots.move_to_end(key)
+            self.hits += 1
+            return {**self.entries[self.slots[key]], 'similarity': similarity}
+
+    def add(self, key: str, question: str, fingerprint: str, entry: Dict[str, Any]) -> None:
+        vector = self._embed(question)
+        literals = question_literals(question)
+        with self._lock:
+            self._add(key, vector, fingerprint, literals, entry)
+
+    def _add(
+        self, key: str, vector: np.ndarray, fingerprint: str, literals: frozenset, entry: Dict[str, Any]
+    ) -> None:
+        if self.matrix is None:
+            self.matrix = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+        if key in self.slots:
+            slot = self.slots[key]
+            self.slots.move_to_end(key)
+        elif len(self.slots) >= self.maxsize:
+            # 最も古いエントリのスロットを再利用
+            _, slot = self.slots.popitem(last=False)
+            self.slots[key] = slot
+        else:
+            slot = len(self.slots)
+            self.slots[key] = slot
+        self.matrix[slot] = vector
+        self.entries[slot] = entry
+        self.fingerprints[slot] = fingerprint
+        self.literals[slot] = literals
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        # 空いたスロットに最後のスロットを詰める
+        last_key = next((k for k, s in self.slots.items() if s == len(self.slots)), None)
+        if last_key is not None:
+            self.matrix[slot] = self.matrix[len(self.slots)]
+            self.entries[slot] = self.entries[len(self.slots)]
+            self.fingerprints[slot] = self.fingerprints[len(self.slots)]
+            self.literals[slot] = self.literals[len(self.slots)]
+            self.slots[last_key] = slot
+        self.entries[len(self.slots)] = None
+        self.fingerprints[len(self.slots)] = None
+        self.literals[len(self.slots)] = None
+
+    def discard_similar(self, question: str, fingerprint: str) -> None:
+        if not self.slots:
+            return
+        query_vector = self._embed(question)
+        literals = question_literals(question)
+        with self._lock:
+            # 削除するのは、この質問で返されるエントリ（リテラルも同じもの）だけ
+            match = self._best_match(query_vector, fingerprint, literals)
+            while match is not None:
+                self._discard(match[0])
+                match = self._best_match(query_vector, fingerprint, literals)
+
+    def clear(self) -> None:
+        with self._lock:
+            # key -> slot index in the embedding matrix (LRU order)
+            self.slots: OrderedDict[str, int] = OrderedDict()
+            self.entries: List[Optional[Dict[str, Any]]] = [None] * self.maxsize
+            self.fingerprints: List[Optional[str]] = [None] * self.maxsize
+            self.literals: List[Optional[frozenset]] = [None] * self.maxsize
+            # 次の add でエンコーダーの次元に合わせて作り直す
+            self.matrix: Optional[np.ndarray] = None
+            self.hits = 0
+            self.misses = 0
+            self.expirations = 0
+            self.literal_mismatches = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.slots),
+            'maxsize': self.maxsize,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'literal_mismatches': self.literal_mismatches,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0,
+        }
+
+
 class Text2CypherCache:
-    def __init__(self, maxsize: int = 100):
+    # エントリ内で値を保持するフィールド名
+    value_field = 'query'
+
+    def __init__(
+        self,
+        maxsize: int = 100,
+        semantic_encoder: Any = None,
+        similarity_threshold: float = 0.9,
+        semantic_maxsize: Optional[int] = None,
+        backend: Any = None,
+        warm_start: int = 0,
+        policy: str = 'lru',
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        hit_flush_every: int = 32,
+        hit_flush_interval: float = 5.0,
+    ):
         self.maxsize = maxsize
-        self.cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # メモリ上の構造（エントリ・ポリシー・統計）だけを守る。エンコードや SQLite の I/O はロックの外
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.policy = make_policy(policy, maxsize)
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.current_bytes = 0
         self.hits = 0
         self.misses = 0
         self.total_requests = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend = backend
+        self.backend_hits = 0
+        # バックエンドにまだ反映していないメモリでのヒット: key -> (回数, 最後に使った時刻)
+        self.hit_flush_every = hit_flush_every
+        self.hit_flush_interval = hit_flush_interval
+        self._pending_hits: Dict[str, Tuple[int, float]] = {}
+        self._pending_hit_count = 0
+        self._last_hit_flush = time.monotonic()
+        self._flush_due = False
+        self.semantic = None
+        if semantic_encoder is not None:
+            self.semantic = SemanticCacheTier(
+                semantic_encoder,
+                threshold=similarity_threshold,
+                maxsize=semantic_maxsize or maxsize,
+            )
+        if backend is not None and warm_start > 0:
+            self.warm_start(warm_start)
+
+    def warm_start(self, n: int) -> int:
+        """Load the hottest n entries of the backend into the in-memory tier."""
+        entries = self.backend.hottest(min(n, self.maxsize))
+        # 最もホットなエントリが最後（最近使用）になるように逆順で入れる
+        loaded = 0
+        with self._lock:
+            for key, entry in reversed(entries):
+                if not self._is_expired(entry):
+                    self._store(key, entry)
+                    loaded += 1
+        return loaded
     
     def _generate_key(self, question: str, schema: str) -> str:
-        combined = f"{question}{schema}"
+        combined = f"{normalize_question(question)}|{schema_fingerprint(schema)}"
         # consistent hash
         return hashlib.sha256(combined.encode('utf-8')).hexdigest()
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return is_expired(entry)
+
+    def _entry_size(self, key: str, entry: Dict[str, Any]) -> int:
+        # 厳密なサイズではなく、キーと値の文字列表現からの概算
+        return sys.getsizeof(key) + sys.getsizeof(str(entry[self.value_field])) + sys.getsizeof(entry)
     
     def get(self, question: str, schema: str) -> Optional[Dict[str, Any]]:
-        self.total_requests += 1
         key = self._generate_key(question, schema)
+        with self._lock:
+            self.total_requests += 1
+            entry = self.cache.get(key)
+            if entry is not None:
+                if not self._is_expired(entry):
+                    self.policy.access(key)
+                    self.hits += 1
+                    self._record_hit(key)
+                else:
+                    # 期限切れ
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+        if entry is not None:
+            self._maybe_flush_hits()
+            return entry
 
-        if key in self.cache:
-            # Move to end to mark as recently used
-            self.cache.move_to_end(key)
-            self.hits += 1
-            return self.cache[key]
-        
-        self.misses += 1
+        # メモリになければ永続バックエンドを引く
+        if self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and not self._is_expired(entry):
+                with self._lock:
+                    self._store(key, entry)
+                    self.hits += 1
+                    self.backend_hits += 1
+                self._maybe_flush_hits()
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        # 完全一致しなければ近似ティアを引く
+        if self.semantic is not None:
+            return self.semantic.lookup(question, schema_fingerprint(schema))
         return None
+
+    def _record_hit(self, key: str) -> None:
+        if self.backend is None:
+            return
+        count, _ = self._pending_hits.get(key, (0, 0.0))
+        self._pending_hits[key] = (count + 1, time.time())
+        self._pending_hit_count += 1
+        if (
+            self._pending_hit_count >= self.hit_flush_every
+            or time.monotonic() - self._last_hit_flush >= self.hit_flush_interval
+        ):
+            self._flush_due = True
+
+    def _maybe_flush_hits(self) -> None:
+        # ロックを離してから呼ぶ
+        if self._flush_due:
+            self.flush_hits()
+
+    def flush_hits(self) -> int:
+        """Write the hits served from memory to the backend. Returns how many keys were updated."""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+            self._pending_hit_count = 0
+            self._last_hit_flush = time.monotonic()
+            self._flush_due = False
+        if self.backend is not None and pending:
+            self.backend.record_hits(pending)
+        return len(pending)
+
+    def _remove(self, key: str) -> None:
+        if self.cache.pop(key, None) is not None:
+            self.policy.remove(key)
+            self.current_bytes -= self.sizes.pop(key, 0)
     
-    def set(self, question: str, schema: str, query: Any) -> None:
-        key = self._generate_key(question, schema)
+    def _evict_while(self, over_budget: Callable[[], bool], incoming_key: str) -> None:
+        # 上限に収まるまでポリシーに従って削除
+        while self.cache and over_budget():
+            victim = self.policy.evict(incoming_key)
+            if victim is None:
+                break
+            if victim in self._pending_hits:
+                # ディスク上ではホットなまま残るように、ロックを離したらヒット数を反映
+                self._flush_due = True
+            self.cache.pop(victim, None)
+            self.current_bytes -= self.sizes.pop(victim, 0)
+            self.evictions += 1
 
-        if len(self.cache) >= self.maxsize:
-            # Remove
-            self.cache.popitem(last=False)
-        self.cache[key] = {
-            'query': query,
-            'timestamp': time.time()
+    def _store(self, key: str, entry: Dict[str, Any]) -> None:
+        size = self._entry_size(key, entry)
+        if key in self.cache:
+            # 既存のキーの更新は使用として扱う（remove + insert だと ARC の T2 から T1 に戻り、LFU の回数も 1 に戻る）
+            self.current_bytes += size - self.sizes[key]
+            self.cache[key] = entry
+            self.sizes[key] = size
+            self.policy.access(key)
+            self._evict_while(
+                lambda: self.max_bytes is not None and self.current_bytes > self.max_bytes and len(self.cache) > 1,
+                key,
+            )
+            return
+        # 件数とバイト数の両方が上限に収まるまで削除
+        self._evict_while(
+            lambda: len(self.cache) >= self.maxsize
+            or (self.max_bytes is not None and self.current_bytes + size > self.max_bytes),
+            key,
+        )
+        self.cache[key] = entry
+        self.sizes[key] = size
+        self.current_bytes += size
+        self.policy.insert(key)
+
+    def set(self, question: str, schema: str, query: Any, ttl: Optional[float] = None) -> Dict[str, Any]:
+        key = self._generate_key(question, schema)
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        entry = {
+            self.value_field: query,
+            'timestamp': now
         }
+        if ttl is not None:
+            entry['expires_at'] = now + ttl
+        with self._lock:
+            self._store(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, entry)
+        if self.semantic is not None:
+            self.semantic.add(key, question, schema_fingerprint(schema), entry)
+        self._maybe_flush_hits()
+        return entry
+
+    def get_or_compute(
+        self, question: str, schema: str, compute: Callable[[], Any]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Return (entry, computed). On a miss, compute() is called once even if several
+        threads miss the same key at the same time; the others wait for its result.
+        """
+        entry = self.get(question, schema)
+        if entry is not None:
+            return entry, False
+        key = self._generate_key(question, schema)
+
+        def compute_and_set():
+            # 直前に別の leader が書き込んでいれば再計算しない
+            cached = self._peek(key)
+            if cached is not None:
+                return cached
+            return self.set(question, schema, compute())
+
+        entry, leader = self._flights.do(key, compute_and_set)
+        return entry, leader
+
+    async def aget_or_compute(
+        self, question: str, schema: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Async version of get_or_compute. compute is a coroutine function."""
+        # 近似ティアのエンコードやバックエンドの I/O でイベントループを止めないようにスレッドで引く
+        entry = await asyncio.to_thread(self.get, question, schema)
+        if entry is not None:
+            return entry, False
+        key = self._generate_key(question, schema)
+
+        async def compute_and_set():
+            cached = self._peek(key)
+            if cached is not None:
+                return cached
+            value = await compute()
+            return await asyncio.to_thread(self.set, question, schema, value)
+
+        entry, leader = await self._flights.ado(key, compute_and_set)
+        return entry, leader
+
+    @_synchronized
+    def _peek(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.cache.get(key)
+        if entry is None or self._is_expired(entry):
+            return None
+        return entry
+
+    def invalidate(self, question: str, schema: str) -> None:
+        key = self._generate_key(question, schema)
+        with self._lock:
+            self._remove(key)
+        if self.backend is not None:
+            self.backend.delete(key)
+        if self.semantic is not None:
+            # 近似ティアから返された可能性のあるエントリも削除
+            self.semantic.discard(key)
+            self.semantic.discard_similar(question, schema_fingerprint(schema))
+
+    @_synchronized
+    def purge_expired(self) -> int:
+        expired = [key for key, entry in self.cache.items() if self._is_expired(entry)]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
     
     def clear(self) -> None:
-        self.cache.clear()
-        self.hits = 0
-        self.misses = 0
-        self.total_requests = 0
-    
+        with self._lock:
+            self.cache.clear()
+            self.sizes.clear()
+            self.policy.clear()
+            self.current_bytes = 0
+            self._pending_hits = {}
+            self._pending_hit_count = 0
+            self._flush_due = False
+            self.backend_hits = 0
+            self.hits = 0
+            self.misses = 0
+            self.total_requests = 0
+            self.evictions = 0
+            self.expirations = 0
+        if self.semantic is not None:
+            self.semantic.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
     def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = self._stats()
+        if self.semantic is not None:
+            stats['semantic'] = self.semantic.get_stats()
+        if self.backend is not None:
+            stats['backend'] = self.backend.get_stats()
+        return stats
+
+    def _stats(self) -> Dict[str, Any]:
         hit_rate = self.hits / self.total_requests if self.total_requests > 0 else 0
-        return {
+        stats = {
             'size': len(self.cache),
             'maxsize': self.maxsize,
+            'policy': self.policy.name,
+            'ttl': self.ttl,
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
             'hits': self.hits,
             'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'coalesced': self._flights.followers,
+            'coalesce_fallbacks': self._flights.fallbacks,
             'total_requests': self.total_requests,
             'hit_rate': hit_rate,
             'miss_rate': 1 - hit_rate
         }
+        if self.backend is not None:
+            stats['backend_hits'] = self.backend_hits
+            stats['pending_hits'] = self._pending_hit_count
+        return stats
     
+    @_synchronized
     def get_cached_entries(self) -> List[Dict[str, Any]]:
         entries = []
         for key, value in self.cache.items():
@@ -70,4 +561,39 @@ class Text2CypherCache:
                 'key': key[:16] + '...',
                 'timestamp': value['timestamp'],
                 'age_seconds': time.time() - value['timestamp']
-            })
\ No newline at end of file
+            })
+        return entries
+
+
+class PrunedSchemaCache(Text2CypherCache):
+    """Caches PruneSchema output per (question, full schema) so hits skip the prune LLM call."""
+    value_field = 'pruned_schema'
+
+
+class AnswerCache(Text2CypherCache):
+    """
+    Caches AnswerQuestion output per (question, Cypher, hash of the context). The Cypher
+    and context fingerprint take the place of the schema in the Text2CypherCache key.
+    """
+    value_field = 'answer'
+
+    def _scope(self, cypher: str, context: str) -> str:
+        return f"{normalize_cypher(cypher)}|{context_fingerprint(context)}"
+
+    def get_answer(self, question: str, cypher: str, context: str) -> Optional[Dict[str, Any]]:
+        return self.get(question, self._scope(cypher, context))
+
+    def set_answer(
+        self, question: str, cypher: str, context: str, answer: Any, ttl: Optional[float] = None
+    ) -> Dict[str, Any]:
+        return self.set(question, self._scope(cypher, context), answer, ttl=ttl)
+
+    def get_or_compute_answer(
+        self, question: str, cypher: str, context: str, compute: Callable[[], Any]
+    ) -> Tuple[Dict[str, Any], bool]:
+        return self.get_or_compute(question, self._scope(cypher, context), compute)
+
+    async def aget_or_compute_answer(
+        self, question: str, cypher: str, context: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        return await self.aget_or_compute(question, self._scope(cypher, context), compute)
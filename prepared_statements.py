@@ -0,0 +1,169 @@
+# 仕様
+#1. LLM が生成した Cypher のリテラル（文字列・数値）をパラメータ（$__p0, $__p1, ...）に置き換える
+#   → 値だけが違う質問でも同じテンプレートになり、コンパイル済みのプランを再利用できる
+#2. 接続ごとにテンプレート → PreparedStatement の LRU を持つ（PreparedStatement は接続に紐づくため）
+#3. LIMIT / SKIP の値と可変長パターン（*1..3）はパラメータにしない
+#4. パラメータ化したテンプレートの prepare に失敗したら、元のクエリをそのまま prepare する
+#5. prepare 自体が失敗したら RuntimeError（conn.execute と同じ）を投げる → 自己修正ループでそのまま扱える
+import re
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+PARAM_PREFIX = "__p"
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_IDENT_CHAR = re.compile(r"[\w$]")
+_NO_PARAM_KEYWORDS = {"LIMIT", "SKIP"}
+
+
+def _previous_word(query: str, pos: int) -> str:
+    match = re.search(r"(\w+)\s*$", query[:pos])
+    return match.group(1).upper() if match else ""
+
+
+def parameterize(query: str) -> Tuple[str, Dict[str, Any]]:
+    """Replace string and numeric literals with parameters. Returns (template, parameters)."""
+    out = []
+    params: Dict[str, Any] = {}
+    i = 0
+    n = len(query)
+    while i < n:
+        ch = query[i]
+        if ch in ("'", '"'):
+            # 文字列リテラル（バックスラッシュエスケープと '' の連続に対応）
+            j = i + 1
+            chars = []
+            while j < n:
+                if query[j] == "\\" and j + 1 < n:
+                    chars.append({"n": "\n", "t": "\t"}.get(query[j + 1], query[j + 1]))
+                    j += 2
+                    continue
+                if query[j] == ch:
+                    if j + 1 < n and query[j + 1] == ch:
+                        chars.append(ch)
+                        j += 2
+                        continue
+                    break
+                chars.append(query[j])
+                j += 1
+            if j >= n:
+                # 閉じていない文字列はそのまま（Kuzu にエラーを出させる）
+                out.append(query[i:])
+                break
+            name = f"{PARAM_PREFIX}{len(params)}"
+            params[name] = "".join(chars)
+            out.append(f"${name}")
+            i = j + 1
+            continue
+        if ch == "`":
+            # バッククォートで囲まれた識別子はそのまま
+            j = query.find("`", i + 1)
+            j = n - 1 if j == -1 else j
+            out.append(query[i:j + 1])
+            i = j + 1
+            continue
+        if ch.isdigit() and (i == 0 or not _IDENT_CHAR.match(query[i - 1])):
+            match = _NUMBER.match(query, i)
+            end = match.end()
+            in_range = query[i - 1:i] in ("*", ".") or query[end:end + 2] == ".."
+            keep_literal = (
+                in_range
+                or _previous_word(query, i) in _NO_PARAM_KEYWORDS
+                or (end < n and _IDENT_CHAR.match(query[end]))
+            )
+            if keep_literal:
+                out.append(query[i:end])
+            else:
+                text = match.group(0)
+                name = f"{PARAM_PREFIX}{len(params)}"
+                params[name] = float(text) if any(c in text for c in ".eE") else int(text)
+                out.append(f"${name}")
+            i = end
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out), params
+
+
+class PlanCacheStats:
+    """Counters shared by the prepared-statement caches of every pooled connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.evictions = 0
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fallbacks': self.fallbacks,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0,
+            }
+
+
+class PreparedStatementCache:
+    def __init__(self, conn: Any, maxsize: int = 128, stats: PlanCacheStats | None = None):
+        self.conn = conn
+        self.maxsize = maxsize
+        self.stats = stats or PlanCacheStats()
+        # template（または元のクエリ）-> (prepared statement, パラメータ化したかどうか)
+        self.statements: OrderedDict[str, Tuple[Any, bool]] = OrderedDict()
+
+    def _prepare(self, query: str) -> Any:
+        with warnings.catch_warnings():
+            # Kuzu の Python API では prepare が非推奨扱いだが、プランを再利用できるのはこの経路だけ
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return self.conn.prepare(query)
+
+    def _lookup(self, query: str) -> Tuple[Any, Dict[str, Any]]:
+        """Return (prepared statement, parameters to execute it with)."""
+        template, params = parameterize(query)
+        if params and template in self.statements:
+            self.statements.move_to_end(template)
+            self.stats.record('hits')
+            return self.statements[template][0], params
+        if query in self.statements:
+            # パラメータ化できなかったクエリは元の文字列で保存している
+            self.statements.move_to_end(query)
+            self.stats.record('hits')
+            return self.statements[query][0], {}
+        self.stats.record('misses')
+
+        prepared = self._prepare(template) if params else None
+        if prepared is not None and prepared.is_success():
+            key = template
+        else:
+            if prepared is not None:
+                self.stats.record('fallbacks')
+            prepared = self._prepare(query)
+            if not prepared.is_success():
+                raise RuntimeError(prepared.get_error_message())
+            key, params = query, {}
+
+        if len(self.statements) >= self.maxsize:
+            self.statements.popitem(last=False)
+            self.stats.record('evictions')
+        self.statements[key] = (prepared, bool(params))
+        return prepared, params
+
+    def prepare(self, query: str) -> None:
+        """Compile query without executing it (the plan stays cached for execute)."""
+        self._lookup(query)
+
+    def execute(self, query: str) -> Any:
+        prepared, params = self._lookup(query)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return self.conn.execute(prepared, params)
@@ -0,0 +1,129 @@
+# 仕様
+#1. 自己修正ループで失敗したクエリ（質問, クエリ, エラーメッセージ）を質問ごとに保存する
+#   → 以前はインスタンス全体で1つのリストだったので、関係ない質問の失敗もすべてプロンプトに入っていた
+#2. 質問は正規化してからキーにする。1つの質問あたり max_triples_per_question 件まで（古いものから削除）
+#3. 質問の数は max_questions まで。超えたら最も長く使われていない質問の記録を削除（LRU）
+#4. relevant は同じ質問の失敗（新しい順）→ encoder があれば類似した質問の失敗（類似度順）を返す
+#   返す件数は max_triples 件、合計トークン数（概算）は max_tokens まで
+#5. エラーメッセージは max_error_chars 文字で切る（Kuzu のエラーは長いことがある）
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from context_format import estimate_tokens
+from lru_cache import normalize_question
+
+
+class RefinementMemory:
+    def __init__(
+        self,
+        encoder: Any = None,
+        max_triples_per_question: int = 3,
+        max_questions: int = 256,
+        max_triples: int = 5,
+        max_tokens: int = 600,
+        similarity_threshold: float = 0.8,
+        max_error_chars: int = 300,
+    ):
+        self.encoder = encoder
+        self.max_triples_per_question = max_triples_per_question
+        self.max_questions = max_questions
+        self.max_triples = max_triples
+        self.max_tokens = max_tokens
+        self.similarity_threshold = similarity_threshold
+        self.max_error_chars = max_error_chars
+        # 正規化した質問 -> 失敗の記録（LRU 順）
+        self.triples: OrderedDict[str, Deque[Dict[str, str]]] = OrderedDict()
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.evicted_questions = 0
+        self.retrievals = 0
+        self.similar_hits = 0
+
+    def _embed(self, key: str) -> np.ndarray:
+        vector = np.asarray(self.encoder.encode([key]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def add(self, question: str, query: str, error: str) -> Dict[str, str]:
+        key = normalize_question(question)
+        triple = {"question": question, "query": query, "error": error[:self.max_error_chars]}
+        # エンコードはロックの外で行う
+        vector = self._embed(key) if self.encoder is not None and key not in self.embeddings else None
+        with self._lock:
+            if key not in self.triples:
+                self.triples[key] = deque(maxlen=self.max_triples_per_question)
+                if vector is not None:
+                    self.embeddings[key] = vector
+            self.triples.move_to_end(key)
+            entries = self.triples[key]
+            # 同じクエリで失敗し直した場合は最新のエラーだけ残す
+            for existing in list(entries):
+                if existing["query"] == query:
+                    entries.remove(existing)
+            entries.append(triple)
+            while len(self.triples) > self.max_questions:
+                old_key, _ = self.triples.popitem(last=False)
+                self.embeddings.pop(old_key, None)
+                self.evicted_questions += 1
+        return triple
+
+    def _similar_keys(self, key: str) -> List[str]:
+        with self._lock:
+            candidates = [k for k in self.triples if k != key and k in self.embeddings]
+            if not candidates:
+                return []
+            matrix = np.stack([self.embeddings[k] for k in candidates])
+        similarities = matrix @ self._embed(key)
+        order = np.argsort(similarities)[::-1]
+        return [candidates[i] for i in order if similarities[i] >= self.similarity_threshold]
+
+    def relevant(self, question: str) -> List[Dict[str, str]]:
+        """Failures recorded for this question, then for similar questions, within the budget."""
+        key = normalize_question(question)
+        similar = self._similar_keys(key) if self.encoder is not None else []
+        with self._lock:
+            self.retrievals += 1
+            groups = []
+            if key in self.triples:
+                self.triples.move_to_end(key)
+                groups.append(reversed(self.triples[key]))
+            groups.extend(reversed(self.triples[k]) for k in similar if k in self.triples)
+            selected: List[Dict[str, str]] = []
+            tokens = 0
+            for triple in (triple for group in groups for triple in group):
+                cost = estimate_tokens(triple["question"] + triple["query"] + triple["error"])
+                if len(selected) >= self.max_triples or tokens + cost > self.max_tokens:
+                    break
+                selected.append(triple)
+                tokens += cost
+            if any(normalize_question(t["question"]) != key for t in selected):
+                self.similar_hits += 1
+            return selected
+
+    def clear(self, question: Optional[str] = None) -> None:
+        with self._lock:
+            if question is None:
+                self.triples.clear()
+                self.embeddings.clear()
+                return
+            key = normalize_question(question)
+            self.triples.pop(key, None)
+            self.embeddings.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self.triples.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'questions': len(self.triples),
+                'triples': sum(len(entries) for entries in self.triples.values()),
+                'max_questions': self.max_questions,
+                'evicted_questions': self.evicted_questions,
+                'retrievals': self.retrievals,
+                'similar_hits': self.similar_hits,
+            }
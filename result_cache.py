@@ -0,0 +1,128 @@
+# 仕様
+#1. Cypher を実行した結果（行）を、正規化した Cypher と DB のバージョンをキーにキャッシュする
+#2. DB のバージョンは schema_cache.database_version（DB ファイルのサイズ / mtime）を使う
+#   → create_nobel_api_graph.py で DB を作り直すとバージョンが変わり、古い結果はすべて破棄される
+#3. 件数とおおよそのバイト数の上限を超えたら削除ポリシー（既定は LRU）に従って削除
+import hashlib
+import re
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+from cache_policies import make_policy
+
+_STRING_LITERAL = re.compile(r"'(?:\\.|''|[^'\\])*'|\"(?:\\.|\"\"|[^\"\\])*\"")
+
+
+def normalize_cypher(query: str) -> str:
+    """Collapse whitespace outside string literals and drop a trailing semicolon."""
+    parts = []
+    last = 0
+    for match in _STRING_LITERAL.finditer(query):
+        parts.append(re.sub(r"\s+", " ", query[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(re.sub(r"\s+", " ", query[last:]))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _estimate_size(value: Any) -> int:
+    if hasattr(value, 'nbytes'):
+        # Arrow のテーブル（get_as_arrow の結果）
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class QueryResultCache:
+    def __init__(self, maxsize: int = 256, max_bytes: Optional[int] = 64 * 1024 * 1024, policy: str = 'lru'):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.policy = make_policy(policy, maxsize)
+        self.results: Dict[str, Any] = {}
+        self.sizes: Dict[str, int] = {}
+        self.current_bytes = 0
+        self.db_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(normalize_cypher(query).encode('utf-8')).hexdigest()
+
+    def _check_version(self, db_version: str) -> None:
+        if db_version != self.db_version:
+            # DB が作り直された → すべて破棄
+            if self.results:
+                self.invalidations += 1
+            self.results.clear()
+            self.sizes.clear()
+            self.policy.clear()
+            self.current_bytes = 0
+            self.db_version = db_version
+
+    def get(self, query: str, db_version: str) -> Optional[Any]:
+        with self._lock:
+            self._check_version(db_version)
+            key = self._key(query)
+            if key in self.results:
+                self.policy.access(key)
+                self.hits += 1
+                return self.results[key]
+            self.misses += 1
+            return None
+
+    def set(self, query: str, db_version: str, result: Any) -> None:
+        size = _estimate_size(result)
+        with self._lock:
+            self._check_version(db_version)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # 1件で上限を超える結果はキャッシュしない
+                return
+            key = self._key(query)
+            if key in self.results:
+                self.policy.remove(key)
+                self.current_bytes -= self.sizes.pop(key)
+                del self.results[key]
+            while self.results and (
+                len(self.results) >= self.maxsize
+                or (self.max_bytes is not None and self.current_bytes + size > self.max_bytes)
+            ):
+                victim = self.policy.evict(key)
+                if victim is None:
+                    break
+                del self.results[victim]
+                self.current_bytes -= self.sizes.pop(victim)
+                self.evictions += 1
+            self.results[key] = result
+            self.sizes[key] = size
+            self.current_bytes += size
+            self.policy.insert(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.results.clear()
+            self.sizes.clear()
+            self.policy.clear()
+            self.current_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.results),
+                'maxsize': self.maxsize,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'db_version': self.db_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0,
+            }
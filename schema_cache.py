@@ -0,0 +1,146 @@
+# 仕様
+#1. スキーマは一度だけイントロスペクトし、dict と文字列表現の両方をキャッシュする
+#2. スナップショットは DB ファイルの隣 (例: nobel.kuzu.schema.json) に保存する
+#3. DB ファイル (サイズ / mtime) が変わらない限り、カタログクエリは一切実行しない
+#4. DB ファイルが変わっても DDL フィンガープリントが同じならスキーマを再利用する
+#   - フィンガープリントはテーブル一覧と各テーブルの列 (TABLE_INFO) から作る（ALTER TABLE ... ADD も検出する）
+#5. キャッシュしたスキーマは共有されるので、呼び出し側は読み取り専用として扱う
+#6. 再検証・イントロスペクトはロックの中で1スレッドだけが行う（管理用の接続を同時に使わない）
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+def database_files(db_path: str) -> List[str]:
+    """Files whose size/mtime define the on-disk state of a Kuzu database."""
+    if os.path.isdir(db_path):
+        # 旧バージョンの Kuzu はディレクトリ形式
+        return sorted(
+            os.path.join(db_path, name)
+            for name in os.listdir(db_path)
+            if os.path.isfile(os.path.join(db_path, name))
+        )
+    return [path for path in (db_path, db_path + ".wal") if os.path.exists(path)]
+
+
+def database_version(db_path: str) -> str:
+    """Cheap version stamp of the database files (no catalog queries)."""
+    parts = []
+    for path in database_files(db_path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def ddl_fingerprint(conn: Any) -> str:
+    """Hash of the table catalog and the columns of every table (SHOW_TABLES + TABLE_INFO)."""
+    response = conn.execute("CALL SHOW_TABLES() RETURN *;")
+    tables = sorted((str(row[0]), str(row[1]), str(row[2])) for row in response)  # type: ignore
+    parts = []
+    for table_id, name, table_type in tables:
+        columns = conn.execute(f"CALL TABLE_INFO('{name}') RETURN *;")
+        # 列の番号・名前・型・主キーかどうか
+        parts.append(f"{table_id}:{name}:{table_type}(" + ",".join(":".join(map(str, row)) for row in columns) + ")")  # type: ignore
+    return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class SchemaSnapshot:
+    schema: Dict[str, List[Dict]]
+    schema_str: str
+    db_version: str
+    ddl_fingerprint: str
+    created_at: float
+
+
+class SchemaSnapshotCache:
+    def __init__(self, db_path: str, snapshot_path: Optional[str] = None):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path or f"{db_path}.schema.json"
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.introspections = 0
+
+    def get(self, conn: Any, introspect: Callable[[], Dict[str, List[Dict]]]) -> SchemaSnapshot:
+        version = database_version(self.db_path)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.db_version == version:
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            return self._refresh(conn, introspect, version)
+
+    def _refresh(self, conn: Any, introspect: Callable[[], Dict[str, List[Dict]]], version: str) -> SchemaSnapshot:
+        # 待っている間に他のスレッドが更新していればそれを使う
+        snapshot = self._snapshot or self._load()
+        if snapshot is not None and snapshot.db_version == version:
+            # ディスク上のスナップショットがそのまま使える
+            self.hits += 1
+            self._snapshot = snapshot
+            return snapshot
+
+        fingerprint = ddl_fingerprint(conn)
+        if snapshot is not None and snapshot.ddl_fingerprint == fingerprint:
+            # データだけ変わった場合: DDL は同じなのでスキーマを再利用
+            # 共有中のスナップショットは書き換えずに新しく作る
+            self.revalidations += 1
+            snapshot = SchemaSnapshot(**{**asdict(snapshot), 'db_version': version})
+        else:
+            self.introspections += 1
+            schema = introspect()
+            snapshot = SchemaSnapshot(
+                schema=schema,
+                schema_str=str(schema),
+                db_version=version,
+                ddl_fingerprint=fingerprint,
+                created_at=time.time(),
+            )
+        self._snapshot = snapshot
+        self._save(snapshot)
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            try:
+                os.remove(self.snapshot_path)
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'introspections': self.introspections,
+            'snapshot_path': self.snapshot_path,
+            'db_version': self._snapshot.db_version if self._snapshot else None,
+        }
+
+    def _load(self) -> Optional[SchemaSnapshot]:
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                return SchemaSnapshot(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save(self, snapshot: SchemaSnapshot) -> None:
+        # 読み取り専用マウントなどで書けない場合はメモリ上のキャッシュだけ使う
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(asdict(snapshot), f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,314 @@
+# 仕様
+#1. PruneSchema（LLM）の代わりに、質問の単語とスキーマのラベル・プロパティ名を照合してスキーマを絞り込む
+#   - ラベル / プロパティ名は camelCase と _ で分割して単語にする（knownName → known, name / BORN_IN → born）
+#   - SYNONYMS で言い換え（laureate → Scholar, born → BORN_IN など）を補う
+#   - 1つのテーブルにしかないプロパティ（awardYear など）に一致したら、そのテーブルも選ぶ
+#   - 4桁の数字は year、国籍を表す単語（Japanese など）は country として扱う
+#   - 国籍は出身国のことなので、リレーションの照合では born（BORN_IN）が出てきたものとして扱う
+#     （同じノードの組をつなぐ DIED_IN などが質問に出ていればそちらを使う）
+#2. 選んだノード同士をスキーマ上の最短経路でつなぐ（Scholar → BORN_IN → City → IS_CITY_IN → Country）
+#   同じ長さの経路が複数あるときは、質問に出てきたリレーションを含む経路を優先し、残った候補はすべて含める
+#3. 確信度 = 質問の内容語のうちスキーマに対応付けられた割合
+#   固有名詞（値）は、人を表すノードを選んでいれば人名とみなして 0.5、そうでなければ 0 として数える
+#   選べたノードがない、または選んだノードをつなげない場合は 0
+#   → threshold 未満なら呼び出し側で LLM の PruneSchema にフォールバックする
+#4. LLM で prune したときの時間を record_llm_latency で記録し、get_stats で削減できた時間の見積もりを返す
+#5. 絞り込んだスキーマは KuzuDatabaseManager.get_schema_dict と同じ dict の形で返す
+#   - LLM（PruneSchema）の GraphSchema も pruned_schema_dict で同じ形にする（SQLite から戻したキャッシュも dict なので）
+import ast
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "from", "by", "with", "and", "or", "is", "are",
+    "was", "were", "be", "been", "did", "do", "does", "has", "have", "had", "what", "which", "how", "many",
+    "much", "list", "show", "give", "find", "tell", "me", "all", "any", "their", "his", "her", "its", "that",
+    "this", "these", "those", "there", "than", "more", "most", "least", "number", "count", "total", "same",
+    "each", "per", "as", "not", "also", "only", "ever", "both", "who's", "it", "they", "them", "one", "two",
+    "three", "first", "last", "between", "after", "before", "during", "since", "name", "names", "get", "id",
+}
+
+SYNONYMS = {
+    # ラベル
+    "scholar": ["laureate", "winner", "person", "people", "who", "whom", "scientist", "physicist", "chemist",
+                "economist", "writer", "author", "man", "men", "woman", "women", "recipient"],
+    "prize": ["nobel", "award", "physics", "chemistry", "medicine", "physiology", "literature", "peace",
+              "economics", "economic"],
+    "institution": ["university", "college", "institute", "lab", "laboratory", "school", "organization"],
+    "city": ["town", "where", "birthplace"],
+    "country": ["nation", "nationality", "where"],
+    "continent": ["europe", "asia", "africa", "oceania", "america", "european", "asian", "african"],
+    "won": ["win", "winner", "winning", "awarded", "receive", "received", "laureate", "recipient"],
+    "born_in": ["born", "birth", "birthplace", "native"],
+    "died_in": ["died", "die", "death"],
+    "affiliated_with": ["affiliation", "work", "worked", "working", "university", "institute"],
+    "is_located_in": ["located", "location", "based"],
+    # プロパティ
+    "awardyear": ["year", "when"],
+    "category": ["field", "physics", "chemistry", "medicine", "physiology", "literature", "peace", "economics"],
+    "gender": ["female", "male", "woman", "women", "man", "men", "gender"],
+    "prizeamount": ["money", "amount"],
+    "birthdate": ["born", "birth", "age", "old"],
+    "deathdate": ["died", "death"],
+    "motivation": ["why", "reason", "motivation"],
+}
+
+_DEMONYM = re.compile(r"(?:ese|ian|ish|ch|an)$")
+_YEAR = re.compile(r"^(1[89]|20)\d\d$")
+# 国籍を表す単語があるときにリレーションの照合だけに加える単語
+NATIONALITY_IMPLIES = {"born"}
+
+
+def _stem(word: str) -> str:
+    word = word.lower()
+    if word.endswith("'s"):
+        word = word[:-2]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _split_name(name: str) -> Set[str]:
+    words = re.sub(r"([a-z])([A-Z])", r"\1 \2", name).replace("_", " ").split()
+    return {_stem(w) for w in words} - STOPWORDS
+
+
+def pruned_schema_dict(schema: Any) -> Dict[str, List[Dict]]:
+    """
+    Normalize a pruned schema (a GraphSchema model from PruneSchema, its model_dump, or a dict)
+    to the introspected shape: nodes with label/properties, edges with label/from/to/properties.
+    """
+    if hasattr(schema, "model_dump"):
+        schema = schema.model_dump()
+
+    def label(value: Any) -> Any:
+        # GraphSchema の Edge は from / to が Node
+        return value.get("label") if isinstance(value, dict) else value
+
+    return {
+        "nodes": [
+            {"label": node["label"], "properties": node.get("properties") or []}
+            for node in schema.get("nodes") or []
+        ],
+        "edges": [
+            {
+                "label": edge["label"],
+                "from": label(edge["from"] if "from" in edge else edge.get("from_")),
+                "to": label(edge.get("to")),
+                "properties": edge.get("properties") or [],
+            }
+            for edge in schema.get("edges") or []
+        ],
+    }
+
+
+@dataclass
+class PruneResult:
+    schema: Dict[str, List[Dict]]
+    confidence: float
+    accepted: bool
+    matched: Dict[str, List[str]] = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+
+
+class RuleBasedSchemaPruner:
+    def __init__(self, threshold: float = 0.6, synonyms: Optional[Dict[str, List[str]]] = None):
+        self.threshold = threshold
+        self.synonyms = {k: {_stem(w) for w in v} for k, v in (synonyms or SYNONYMS).items()}
+        self._parsed: Tuple[Optional[str], Optional[Dict[str, List[Dict]]]] = (None, None)
+        self._lock = threading.Lock()
+        self.prunes = 0
+        self.accepted = 0
+        self.fallbacks = 0
+        self.rule_time_ms = 0.0
+        self.llm_prunes = 0
+        self.llm_time_ms = 0.0
+
+    def _schema_dict(self, schema: Dict[str, List[Dict]] | str) -> Dict[str, List[Dict]]:
+        if not isinstance(schema, str):
+            return schema
+        # KuzuDatabaseManager.get_schema_str は str(dict) なので、同じ文字列なら前回の解析結果を使う
+        if self._parsed[0] != schema:
+            self._parsed = (schema, ast.literal_eval(schema))
+        return self._parsed[1]
+
+    def _vocabulary(self, name: str) -> Set[str]:
+        return _split_name(name) | self.synonyms.get(name.lower(), set())
+
+    def _paths(
+        self, edges: List[Dict], sources: Set[str], target: str, preferred: Set[int]
+    ) -> List[List[int]]:
+        """All shortest paths (as edge indexes) from any of sources to target, ignoring direction."""
+        adjacency: Dict[str, List[Tuple[int, str]]] = {}
+        for i, edge in enumerate(edges):
+            adjacency.setdefault(edge["from"], []).append((i, edge["to"]))
+            adjacency.setdefault(edge["to"], []).append((i, edge["from"]))
+        distance = {s: 0 for s in sources}
+        queue = deque(sources)
+        while queue:
+            node = queue.popleft()
+            for _, neighbour in adjacency.get(node, []):
+                if neighbour not in distance:
+                    distance[neighbour] = distance[node] + 1
+                    queue.append(neighbour)
+        if target not in distance:
+            return []
+        # target から距離が1ずつ減る方向にたどって、最短経路をすべて列挙する
+        paths: List[List[int]] = []
+
+        def walk(node: str, path: List[int]) -> None:
+            if distance[node] == 0:
+                paths.append(path)
+                return
+            for i, neighbour in adjacency.get(node, []):
+                if distance.get(neighbour) == distance[node] - 1:
+                    walk(neighbour, path + [i])
+
+        walk(target, [])
+        best = max(len(preferred.intersection(p)) for p in paths)
+        return [p for p in paths if len(preferred.intersection(p)) == best]
+
+    def prune(self, question: str, schema: Dict[str, List[Dict]] | str) -> PruneResult:
+        start = time.perf_counter()
+        schema = self._schema_dict(schema)
+        nodes, edges = schema.get("nodes", []), schema.get("edges", [])
+
+        raw_words = re.findall(r"[A-Za-z][A-Za-z']*|\d+", question)
+        content: List[Tuple[str, bool]] = []  # (語幹, 固有名詞 / 値らしいか)
+        nationality = False
+        for i, word in enumerate(raw_words):
+            stem = _stem(word)
+            if stem in STOPWORDS:
+                continue
+            if _YEAR.match(word):
+                content.append(("year", False))
+            elif word.isdigit():
+                continue
+            elif i > 0 and word[0].isupper() and _DEMONYM.search(stem):
+                content.append(("country", True))
+                nationality = True
+            else:
+                content.append((stem, i > 0 and word[0].isupper()))
+        words = {stem for stem, _ in content}
+
+        matched: Dict[str, List[str]] = {}
+        selected: List[str] = []
+        for node in nodes:
+            hits = words & self._vocabulary(node["label"])
+            if hits:
+                matched[node["label"]] = sorted(hits)
+                selected.append(node["label"])
+        matched_edges: Set[int] = set()
+        node_words = {_stem(n["label"]) for n in nodes}
+        # IS_CITY_IN の city などノード名の単語はノード側で照合する（経路探索で自然に選ばれる）
+        edge_vocab = [self._vocabulary(edge["label"]) - node_words for edge in edges]
+        implied: Set[int] = set()
+        for i, edge in enumerate(edges):
+            hits = words & edge_vocab[i]
+            if hits:
+                matched[edge["label"]] = sorted(hits)
+                matched_edges.add(i)
+        if nationality:
+            # 同じノードの組をつなぐリレーション（died など）が質問に出ていなければ、出身として扱う
+            mentioned_pairs = {(edges[i]["from"], edges[i]["to"]) for i in matched_edges}
+            for i, edge in enumerate(edges):
+                hits = NATIONALITY_IMPLIES & edge_vocab[i]
+                if hits and i not in matched_edges and (edge["from"], edge["to"]) not in mentioned_pairs:
+                    matched[edge["label"]] = sorted(hits)
+                    implied.add(i)
+            matched_edges.update(implied)
+        for i in sorted(matched_edges):
+            selected.extend(l for l in (edges[i]["from"], edges[i]["to"]) if l not in selected)
+        # どのテーブルにあるプロパティか
+        owners: Dict[str, List[str]] = {}
+        for item in nodes:
+            for prop in item.get("properties") or []:
+                owners.setdefault(prop["name"], []).append(item["label"])
+        matched_props: Set[str] = set()
+        for prop, labels in owners.items():
+            hits = words & self._vocabulary(prop)
+            if hits:
+                matched_props.add(prop)
+                matched[prop] = sorted(hits)
+                if len(labels) == 1 and labels[0] not in selected:
+                    selected.append(labels[0])
+
+        # 選んだノードを最短経路でつなぐ
+        chosen_edges = set(i for i in matched_edges)
+        connected = set(selected[:1])
+        reachable = True
+        for label in selected[1:]:
+            if label in connected:
+                continue
+            paths = self._paths(edges, connected, label, matched_edges)
+            if not paths:
+                reachable = False
+                continue
+            for path in paths:
+                chosen_edges.update(path)
+                for i in path:
+                    connected.update((edges[i]["from"], edges[i]["to"]))
+        for i in chosen_edges:
+            connected.update((edges[i]["from"], edges[i]["to"]))
+
+        # 確信度: スキーマに対応付けられた内容語の割合
+        # 固有名詞は人名なら Scholar で扱えるので 0.5、人を選んでいなければ（国名など種類が分からない）0
+        vocab = set()
+        for name in [n["label"] for n in nodes] + [e["label"] for e in edges] + list(owners):
+            vocab |= self._vocabulary(name)
+        value_weight = 0.5 if any("person" in self._vocabulary(label) for label in connected) else 0.0
+        score = sum(1.0 if stem in vocab else value_weight if is_value else 0.0 for stem, is_value in content)
+        confidence = score / len(content) if content else 0.0
+        if not selected or not reachable:
+            confidence = 0.0
+
+        pruned = {"nodes": [], "edges": []}
+        for node in nodes:
+            if node["label"] not in connected:
+                continue
+            props = node.get("properties") or []
+            # 名前のプロパティと質問に出てきたプロパティだけ残す（名前がないテーブルはすべて）
+            keep = [p for p in props if "name" in p["name"].lower() or p["name"] in matched_props]
+            if not any("name" in p["name"].lower() for p in props):
+                keep = props
+            pruned["nodes"].append({**node, "properties": keep})
+        pruned["edges"] = [edge for i, edge in enumerate(edges) if i in chosen_edges]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        accepted = confidence >= self.threshold
+        with self._lock:
+            self.prunes += 1
+            self.rule_time_ms += elapsed_ms
+            if accepted:
+                self.accepted += 1
+            else:
+                self.fallbacks += 1
+        return PruneResult(pruned, confidence, accepted, matched, elapsed_ms)
+
+    def record_llm_latency(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.llm_prunes += 1
+            self.llm_time_ms += elapsed_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            avg_llm_ms = self.llm_time_ms / self.llm_prunes if self.llm_prunes else None
+            avg_rule_ms = self.rule_time_ms / self.prunes if self.prunes else 0.0
+            return {
+                'prunes': self.prunes,
+                'accepted': self.accepted,
+                'fallbacks': self.fallbacks,
+                'accept_rate': self.accepted / self.prunes if self.prunes else 0,
+                'avg_rule_ms': avg_rule_ms,
+                'avg_llm_ms': avg_llm_ms,
+                # LLM を呼ばずに済んだ回数 × LLM の平均時間（LLM の記録がまだなければ None）
+                'estimated_saved_ms': (
+                    self.accepted * (avg_llm_ms - avg_rule_ms) if avg_llm_ms is not None else None
+                ),
+            }
@@ -0,0 +1,90 @@
+# 仕様
+#1. 同じキーに対する同時呼び出しを1回の計算にまとめる（single-flight）
+#2. 最初の呼び出し（leader）だけが計算し、同時に来た呼び出し（follower）はその結果を待つ
+#3. スレッド（do）と asyncio（ado）のどちらからでも使え、同じキーなら両者で結果を共有する
+#4. 計算が例外を投げた場合は follower にも同じ例外が伝わる
+#5. イベントループのスレッドから do を呼んだとき、同じループ上の async の leader を待つとループが止まる（デッドロック）
+#   ので、その場合は待たずに自分で計算する（fallbacks で数える）
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        # async の leader が動いているイベントループ
+        self._loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+
+    def _join(self, key: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Tuple[Optional[Future], bool]:
+        """Returns (future, is_leader), or (None, False) when a sync caller must not wait."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                if loop is None and self._loops.get(key) is not None and self._loops[key] is _running_loop():
+                    self.fallbacks += 1
+                    return None, False
+                self.followers += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            if loop is not None:
+                self._loops[key] = loop
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+            self._loops.pop(key, None)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per concurrent key. Returns (result, is_leader)."""
+        future, leader = self._join(key)
+        if future is None:
+            # leader は同じイベントループ上で await 中。ここで待つとループごと止まるので自分で計算する
+            return fn(), True
+        if not leader:
+            return future.result(), False
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            self._finish(key)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async version of do. fn is a coroutine function."""
+        future, leader = self._join(key, asyncio.get_running_loop())
+        if not leader:
+            return await asyncio.wrap_future(future), False
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            self._finish(key)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,125 @@
+# 実行コマンド:uv run python test_context_format.py
+#!/usr/bin/env python3
+import pyarrow as pa
+
+from context_format import compact_context, estimate_tokens, format_context, iter_row_batches
+
+
+def test_format_keeps_column_names():
+    table = pa.table({"s.knownName": ["Marie Curie", "Pierre Curie"], "p.awardYear": [1903, 1903]})
+    assert format_context(table) == "s.knownName|p.awardYear\nMarie Curie|1903\nPierre Curie|1903"
+    assert format_context(table.slice(0, 0)) == ""
+    assert format_context(None) == ""
+
+
+def test_format_nested_and_special_values():
+    table = pa.table({
+        "category": ["physics", 'say "hi" | bye\nnow'],
+        "names": pa.array([["A", "B"], None], pa.list_(pa.string())),
+        "years": pa.array([[1901, 1902], []], pa.list_(pa.int64())),
+        "s": pa.array([{"_ID": {"offset": 0, "table": 0}, "knownName": "A"}, None]),
+    })
+    lines = format_context(table).split("\n")
+    assert lines[0] == "category|names|years|s"
+    assert lines[1] == "physics|A, B|1901, 1902|{knownName: A}"
+    # 区切り文字・改行・ダブルクォートは置き換えられ、1行 = 1レコードが保たれる
+    assert lines[2] == "say 'hi' / bye now|||"
+    assert len(lines) == 3
+
+
+def test_format_map_columns():
+    table = pa.table({
+        "name": ["Marie Curie", "Niels Bohr"],
+        "prizes": pa.array([[("physics", 1903), ("chemistry", 1911)], None], pa.map_(pa.string(), pa.int64())),
+        "ids": pa.array([[(1, "_hidden")], []], pa.map_(pa.int64(), pa.string())),
+    })
+    lines = format_context(table).split("\n")
+    # map は (key, value) のリストとして返るので、struct と違ってすべてのキーを書く
+    assert lines[1] == "Marie Curie|{physics: 1903, chemistry: 1911}|{1: _hidden}"
+    assert lines[2] == "Niels Bohr||{}"
+    context, _ = compact_context(table)
+    assert "{physics: 1903, chemistry: 1911}" in context
+
+
+def test_format_path_columns():
+    scholar = {"_ID": {"offset": 0, "table": 0}, "_LABEL": "Scholar", "knownName": "Marie Curie", "category": None}
+    prize = {"_ID": {"offset": 3, "table": 1}, "_LABEL": "Prize", "knownName": None, "category": "physics"}
+    won = {"_SRC": scholar["_ID"], "_DST": prize["_ID"], "_LABEL": "WON", "_ID": {"offset": 0, "table": 2}}
+    table = pa.table({"p": [
+        {"_NODES": [scholar, prize], "_RELS": [won]},
+        {"_NODES": [prize, scholar], "_RELS": [won]},
+    ]})
+    lines = format_context(table).split("\n")
+    # RETURN p でもノードとリレーションが残る（値のないプロパティは書かない）
+    assert lines[1] == "(Scholar {knownName: Marie Curie})-[WON]->(Prize {category: physics})"
+    assert lines[2] == "(Prize {category: physics})<-[WON]-(Scholar {knownName: Marie Curie})"
+
+
+def test_batches_match_single_batch():
+    table = pa.table({"n": list(range(25)), "label": [f"row {i}" for i in range(25)]})
+    assert sum(batch.num_rows for batch in iter_row_batches(table, batch_size=10)) == 25
+    assert format_context(table, batch_size=10) == format_context(table)
+
+
+def test_compact_dedupes_and_hoists_constant_columns():
+    table = pa.table({
+        "p.category": ["physics"] * 4,
+        "s.knownName": ["Marie Curie", "Pierre Curie", "Marie Curie", "Niels Bohr"],
+    })
+    context, metadata = compact_context(table)
+    assert context == "p.category: physics\ns.knownName\nMarie Curie\nPierre Curie\nNiels Bohr"
+    assert metadata['rows'] == 4 and metadata['unique_rows'] == 3 and metadata['rows_kept'] == 3
+    assert metadata['constant_columns'] == ["p.category"] and not metadata['truncated']
+
+
+def test_compact_truncates_to_token_budget():
+    table = pa.table({"s.knownName": [f"Laureate number {i}" for i in range(500)], "n": list(range(500))})
+    context, metadata = compact_context(table, max_tokens=100)
+    assert estimate_tokens(context) <= 100 and metadata['estimated_tokens'] <= 100
+    assert metadata['truncated'] and metadata['rows_kept'] + metadata['omitted_rows'] == 500
+    assert context.endswith(f"... and {metadata['omitted_rows']} more rows")
+    assert context.split("\n")[1] == "Laureate number 0|0"
+
+    # 1行だけで予算を超える場合も予算内に収める
+    context, metadata = compact_context(pa.table({"bio": ["x" * 1000]}), max_tokens=20)
+    assert estimate_tokens(context) <= 20 and metadata['truncated'] and metadata['rows_kept'] == 1
+
+
+def test_trailing_null_rows_are_kept():
+    table = pa.table({"d": ["2000-01-01", "1990-02-02", None]})
+    assert format_context(table) == "d\n2000-01-01\n1990-02-02\n"
+    context, metadata = compact_context(table)
+    assert metadata['rows_kept'] == 3 and metadata['omitted_rows'] == 0 and not metadata['truncated']
+    assert "more rows" not in context
+
+
+def test_compact_counts_hoisted_lines_toward_budget():
+    table = pa.table({
+        "p.motivation": ["for the discovery of " + "radioactivity " * 100] * 3,
+        "p.category": ["physics"] * 3,
+        "s.knownName": ["Marie Curie", "Pierre Curie", "Henri Becquerel"],
+    })
+    context, metadata = compact_context(table, max_tokens=30)
+    lines = context.split("\n")
+    # 長い固定値は途中で切り、列名の行と1行目は必ず残す
+    assert estimate_tokens(context) <= 30 and metadata['truncated']
+    assert lines[0].startswith("p.motivation: for the discovery of") and lines[0].endswith(" ...")
+    assert "s.knownName" in lines and metadata['rows_kept'] >= 1
+
+    # 切っても入らない固定値の列は省く
+    context, metadata = compact_context(table, max_tokens=8)
+    assert estimate_tokens(context) <= 8
+    assert "p.motivation" in metadata['dropped_constant_columns'] and "radioactivity" not in context
+    assert context.split("\n")[-1].startswith("... and") or "Marie Curie" in context
+
+
+if __name__ == "__main__":
+    test_format_keeps_column_names()
+    test_format_nested_and_special_values()
+    test_format_map_columns()
+    test_format_path_columns()
+    test_batches_match_single_batch()
+    test_compact_dedupes_and_hoists_constant_columns()
+    test_compact_truncates_to_token_budget()
+    test_trailing_null_rows_are_kept()
+    test_compact_counts_hoisted_lines_toward_budget()
@@ -0,0 +1,80 @@
+# 実行コマンド:uv run python test_cypher_templates.py
+#!/usr/bin/env python3
+from cypher_templates import SLOT_QUERIES, CypherTemplateEngine
+
+VALUES = {
+    SLOT_QUERIES["category"]: ["physics", "chemistry", "medicine", "peace", "economics"],
+    SLOT_QUERIES["country"]: ["Japan", "Germany", "United Kingdom", "the Netherlands", "USA"],
+    SLOT_QUERIES["institution"]: [
+        "Harvard University", "University of Tokyo", "Massachusetts Institute of Technology (MIT)",
+        "Max-Planck-Institut für Physik", "Niels Bohr Institute", "Enrico Fermi Institute, University of Chicago",
+    ],
+    SLOT_QUERIES["scholar"]: ["Max Planck", "Niels Bohr", "Enrico Fermi", "Marie Curie"],
+}
+
+
+def _engine():
+    engine = CypherTemplateEngine()
+    engine.load_values("v1", lambda query: VALUES[query])
+    return engine
+
+
+def test_slots_from_graph_values():
+    engine = _engine()
+    match = engine.match("Which scholars won prizes in Physics?")
+    assert match.name == "category" and match.params == {"category": "physics"}
+    assert "CONTAINS 'physics'" in match.cypher
+    assert engine.match("Who won the Nobel Prize in Chemistry in 1911?").params == {"category": "chemistry", "year": 1911}
+    assert engine.match("Which Japanese scholars won Nobel prizes?").params == {"country": "japan"}
+    assert engine.match("Which laureates were born in the United Kingdom?").params == {"country": "united kingdom"}
+    assert engine.match("Find scholars affiliated with Harvard who won prizes").params == {"institution": "harvard"}
+    assert engine.match("Who won multiple Nobel prizes?").name == "multiple_prizes"
+    # 所属を表す単語があれば、人名と同じ単語でも機関として扱う
+    assert engine.match("Which scholars affiliated with Niels Bohr won prizes?").params == {"institution": "niels bohr"}
+
+
+def test_person_names_are_not_institutions():
+    engine = _engine()
+    # 人名が機関名に含まれていても、人についての質問は Text2Cypher に任せる
+    for question in [
+        "Which prizes did Max Planck win?",
+        "What prize did Niels Bohr win?",
+        "Which prize did Enrico Fermi receive?",
+        "Did Fermi win a Nobel prize?",
+    ]:
+        assert engine.extract_slots(question)[0] == {}, question
+        assert engine.match(question) is None, question
+
+
+def test_falls_back_when_not_fully_explained():
+    engine = _engine()
+    # グラフにない分野・説明できない単語・2つ目の分野があればテンプレートは使わない
+    assert engine.match("Who won the prize in literature?") is None
+    assert engine.match("Who won the physics prize after 1950?") is None
+    assert engine.match("Which scholars won prizes in physics or chemistry?") is None
+    assert engine.match("Where was Marie Curie born?") is None
+    stats = engine.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['hits'] == 0 and stats['misses'] == 4
+
+
+def test_reload_only_on_version_change():
+    loads = []
+    engine = CypherTemplateEngine()
+
+    def fetch(query):
+        loads.append(query)
+        return VALUES[query]
+
+    engine.load_values("v1", fetch)
+    engine.load_values("v1", fetch)
+    assert len(loads) == 4
+    engine.load_values("v2", fetch)
+    assert len(loads) == 8
+
+
+if __name__ == "__main__":
+    test_slots_from_graph_values()
+    test_person_names_are_not_institutions()
+    test_falls_back_when_not_fully_explained()
+    test_reload_only_on_version_change()
@@ -0,0 +1,62 @@
+# 実行コマンド:uv run python test_cypher_validator.py
+#!/usr/bin/env python3
+from cypher_validator import CypherValidationError, CypherValidator
+
+SCHEMA = {
+    "nodes": [
+        {"label": "Scholar", "properties": [{"name": "knownName", "type": "STRING"}, {"name": "gender", "type": "STRING"}]},
+        {"label": "Prize", "properties": [{"name": "category", "type": "STRING"}, {"name": "awardYear", "type": "INT64"}]},
+        {"label": "City", "properties": [{"name": "name", "type": "STRING"}]},
+        {"label": "Country", "properties": [{"name": "name", "type": "STRING"}]},
+    ],
+    "edges": [
+        {"label": "WON", "from": "Scholar", "to": "Prize", "properties": [{"name": "portion", "type": "STRING"}]},
+        {"label": "BORN_IN", "from": "Scholar", "to": "City", "properties": []},
+        {"label": "IS_CITY_IN", "from": "City", "to": "Country", "properties": []},
+    ],
+}
+
+
+def test_valid_queries():
+    validator = CypherValidator(SCHEMA)
+    for query in [
+        "MATCH (s:Scholar)-[:WON]->(p:Prize) WHERE LOWER(p.category) CONTAINS 'physics' RETURN s.knownName, p.awardYear",
+        "MATCH (p:Prize)<-[w:won]-(s:scholar) RETURN s.KNOWNNAME, w.portion",
+        "MATCH (s:Scholar)-[:BORN_IN]->(c:City)-[:IS_CITY_IN]->(co:Country {name: 'Japan'}) RETURN count(s)",
+        "MATCH (s:Scholar)-[:WON]->(p:Prize) WITH s, COUNT(p) AS n WHERE n > 1 MATCH (s)-[:WON]->(p2) RETURN s.knownName, n",
+        "MATCH (s:Scholar) WHERE s.knownName = 'x.unknownName' RETURN s",
+    ]:
+        assert validator.check(query) == [], query
+
+
+def test_unknown_labels_and_properties():
+    validator = CypherValidator(SCHEMA)
+    assert validator.check("MATCH (s:Scolar) RETURN s")[0].startswith("Node label 'Scolar' does not exist")
+    assert validator.check("MATCH (s:Scholar)-[:WINS]->(p:Prize) RETURN s")[0].startswith("Relationship type 'WINS'")
+    problems = validator.check("MATCH (s:Scholar {name: 'Curie'})-[w:WON]->(p:Prize) RETURN p.year, w.amount")
+    assert [p.split(" (")[0] for p in problems] == [
+        "Property 'name' does not exist on Scholar",
+        "Property 'year' does not exist on Prize",
+        "Property 'amount' does not exist on WON",
+    ]
+
+
+def test_relationship_direction():
+    validator = CypherValidator(SCHEMA)
+    assert validator.check("MATCH (p:Prize)-[:WON]->(s:Scholar) RETURN s") == [
+        "Relationship direction is reversed; use (:Scholar)-[:WON]->(:Prize)"
+    ]
+    assert validator.check("MATCH (s:Scholar)-[:WON]-(p:Prize) RETURN s") == []
+    assert "does not connect these nodes" in validator.check("MATCH (s:Scholar)-[:BORN_IN]->(c:Country) RETURN s")[0]
+    try:
+        validator.validate("MATCH (p:Prize)-[:WON]->(s:Scholar) RETURN s")
+        assert False, "reversed relationship should fail validation"
+    except CypherValidationError as e:
+        # 自己修正ループは RuntimeError を捕まえる
+        assert isinstance(e, RuntimeError)
+
+
+if __name__ == "__main__":
+    test_valid_queries()
+    test_unknown_labels_and_properties()
+    test_relationship_direction()
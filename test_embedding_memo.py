@@ -0,0 +1,76 @@
+# 実行コマンド:uv run python test_embedding_memo.py
+#!/usr/bin/env python3
+import threading
+import time
+import numpy as np
+from embedding_memo import EmbeddingMemo
+from exemplar_store import ExemplarStore
+from lru_cache import normalize_question
+from refinement_memory import RefinementMemory
+
+
+class RecordingEncoder:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        out = np.zeros((len(texts), 8), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.split():
+                out[i, len(word) % 8] += 1
+        return out
+
+
+def test_memoize_and_batch():
+    encoder = RecordingEncoder()
+    memo = EmbeddingMemo(encoder, "model-a")
+    first = memo.encode(["who won", "which scholars"])
+    again = memo.encode("who won")
+    assert np.array_equal(first[0], again[0]) and again.shape == (1, 8)
+    # 未計算の文字列だけをまとめてエンコードする
+    memo.encode(["which scholars", "new question", "another one", "new question"])
+    assert encoder.calls == [["who won", "which scholars"], ["new question", "another one"]]
+    assert memo.prefetch(["who won", "batch a", "batch b"]) == 2
+    assert encoder.calls[-1] == ["batch a", "batch b"]
+    stats = memo.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['encode_calls'] == 3 and stats['hits'] == 2
+
+
+def test_lru_eviction_and_single_flight():
+    memo = EmbeddingMemo(RecordingEncoder(), "model-a", maxsize=2)
+    memo.encode(["a"])
+    memo.encode(["b"])
+    memo.encode(["a"])
+    memo.encode(["c"])
+    # b が最も古いので追い出される
+    assert memo.prefetch(["a", "b", "c"]) == 1 and memo.get_stats()['evictions'] == 2
+
+    encoder = RecordingEncoder(delay=0.05)
+    memo = EmbeddingMemo(encoder, "model-a")
+    threads = [threading.Thread(target=memo.encode, args=(["same question"],)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert encoder.calls == [["same question"]]
+
+
+def test_shared_between_stages():
+    encoder = RecordingEncoder()
+    store = ExemplarStore(cache_dir=None, encoder=encoder)
+    memory = RefinementMemory(encoder=store.memo)
+    question = "Which scholars won prizes in Chemistry?"
+    store.get_similar_exemplars(question, k=1)
+    memory.add(question, "MATCH (s:Scolar) RETURN s", "Table Scolar does not exist")
+    memory.relevant(question)
+    # 既定の例の1回と、質問の1回だけ
+    assert encoder.calls[1:] == [[normalize_question(question)]]
+
+
+if __name__ == "__main__":
+    test_memoize_and_batch()
+    test_lru_eviction_and_single_flight()
+    test_shared_between_stages()
@@ -0,0 +1,132 @@
+# 実行コマンド:uv run python test_exemplar_miner.py
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+import zlib
+import numpy as np
+import exemplar_store
+import vector_index
+from exemplar_miner import DEFAULT_MINED_PATH, ExemplarMiner
+from exemplar_store import ExemplarStore
+from vector_index import IVFIndex
+
+
+class WordEncoder:
+    """One dimension per word, so questions with the same words have similarity 1."""
+    def __init__(self):
+        self.calls = 0
+    def encode(self, texts):
+        self.calls += 1
+        out = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.split():
+                out[i, zlib.crc32(word.encode()) % 64] += 1
+        return out
+
+
+def test_record_dedupe_and_skip_empty():
+    store = ExemplarStore(cache_dir=None, encoder=WordEncoder())
+    miner = ExemplarMiner(store, path=None)
+    assert miner.record("Who was born in Kyoto?", "MATCH (s:Scholar) RETURN s", rows=3)
+    # 同じ質問・ほぼ同じ質問・既定の例と同じ質問・結果が空のものは追加しない
+    assert not miner.record("who was born in kyoto", "MATCH (s) RETURN s", rows=3)
+    assert not miner.record("Kyoto born in was who?", "MATCH (s) RETURN s", rows=3)
+    assert not miner.record("Who won multiple Nobel prizes?", "MATCH (s) RETURN s", rows=2)
+    assert not miner.record("Who died in Paris?", "MATCH (s) RETURN s", rows=0)
+    stats = miner.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['mined'] == 1 and stats['duplicates'] == 3 and stats['skipped_empty'] == 1
+    assert store.get_similar_exemplars("Who was born in Kyoto", k=1)[0]["cypher"] == "MATCH (s:Scholar) RETURN s"
+
+
+def test_persist_and_reload_without_encoding():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, "mined.jsonl")
+        store = ExemplarStore(cache_dir=cache_dir, encoder=WordEncoder())
+        miner = ExemplarMiner(store, path=path)
+        miner.record("Who was born in Kyoto?", "RETURN 1", rows=1)
+        miner.record("Which prizes were awarded in 1950?", "RETURN 2", rows=5)
+
+        encoder = WordEncoder()
+        reloaded = ExemplarStore(cache_dir=cache_dir, encoder=encoder)
+        ExemplarMiner(reloaded, path=path)
+        assert [ex["cypher"] for ex in reloaded.exemplars[-2:]] == ["RETURN 1", "RETURN 2"]
+        # 埋め込みはディスクキャッシュから読むのでエンコードしない
+        assert encoder.calls == 0
+
+
+def test_diversity_aware_eviction():
+    store = ExemplarStore(cache_dir=None, encoder=WordEncoder())
+    miner = ExemplarMiner(store, path=None, max_mined=4, evict_fraction=0.25, dedupe_threshold=0.99)
+    questions = [
+        "alpha beta gamma", "alpha beta delta", "alpha beta gamma epsilon",
+        "zeta eta theta", "iota kappa lambda",
+    ]
+    for i, question in enumerate(questions):
+        assert miner.record(question, f"RETURN {i}", rows=1)
+    # 5件目で上限を超え、似ている alpha beta の例から消える
+    mined = [ex["question"] for ex in store.exemplars[5:]]
+    assert len(mined) == 3 and "zeta eta theta" in mined and "iota kappa lambda" in mined
+    assert sum(q.startswith("alpha beta") for q in mined) == 1
+    assert len(store.exemplars) == 8 and store.embeddings.shape[0] == 8
+    assert miner.get_stats()['evicted'] == 2
+
+
+def test_disk_writes_outside_lock():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, "mined.jsonl")
+        store = ExemplarStore(cache_dir=cache_dir, encoder=WordEncoder())
+        miner = ExemplarMiner(store, path=path, max_mined=2, evict_fraction=0.5, dedupe_threshold=0.99)
+        writes = []
+        cache_vectors = store.cache_vectors
+
+        def recording_cache_vectors(questions, vectors):
+            # 埋め込みの保存中も他の record はブロックされない
+            writes.append((list(questions), miner._lock.locked()))
+            cache_vectors(questions, vectors)
+
+        store.cache_vectors = recording_cache_vectors
+        for i, question in enumerate(["alpha beta gamma", "alpha beta delta", "zeta eta theta"]):
+            assert miner.record(question, f"RETURN {i}", rows=1)
+        assert [q for q, _ in writes] == [["alpha beta gamma"], ["alpha beta delta"], ["zeta eta theta"]]
+        assert not any(locked for _, locked in writes)
+        # 削除のあとは JSON Lines を残った例だけで書き直す
+        with open(path, encoding="utf-8") as f:
+            saved = [json.loads(line)["question"] for line in f]
+        assert saved == [record["question"] for record in miner.mined.values()] and len(saved) == 1
+        assert store.disk_cache.get_stats()['entries'] == 8
+
+
+def test_index_training_outside_lock():
+    # 既定の5件 + 1件で IVF の学習が始まる
+    store = ExemplarStore(cache_dir=None, encoder=WordEncoder(), index=IVFIndex(min_train_size=6))
+    miner = ExemplarMiner(store, path=None)
+    locked = []
+    kmeans = vector_index._kmeans
+
+    def recording_kmeans(*args):
+        # 学習中も record と検索はブロックされない
+        locked.append((miner._lock.locked(), store._lock.locked()))
+        return kmeans(*args)
+
+    vector_index._kmeans = recording_kmeans
+    try:
+        assert miner.record("Who was born in Kyoto?", "RETURN 1", rows=1)
+    finally:
+        vector_index._kmeans = kmeans
+    assert locked == [(False, False)] and store.index.get_stats()['trained']
+
+
+def test_default_path_is_module_relative():
+    assert DEFAULT_MINED_PATH == os.path.join(exemplar_store.DEFAULT_CACHE_DIR, "mined_exemplars.jsonl")
+    assert os.path.isabs(DEFAULT_MINED_PATH)
+
+
+if __name__ == "__main__":
+    test_record_dedupe_and_skip_empty()
+    test_persist_and_reload_without_encoding()
+    test_diversity_aware_eviction()
+    test_disk_writes_outside_lock()
+    test_index_training_outside_lock()
+    test_default_path_is_module_relative()
@@ -1,6 +1,15 @@
 # 実行コマンド:uv run python test_exemplar_store.py
 #!/usr/bin/env python3
-from exemplar_store import ExemplarStore
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import exemplar_store
+import vector_index
+from exemplar_store import DEFAULT_CACHE_DIR, EmbeddingDiskCache, ExemplarStore, LazyEncoder
+from lru_cache import normalize_question
+from vector_index import IVFIndex, normalize
 def test_exemplar_store():
     store = ExemplarStore()
     test_questions = [
@@ -13,5 +22,144 @@ def test_exemplar_store():
         print(f"\nQuestion: {question}")
         for ex in similar:
             print(f"  - Similar ({ex['similarity']:.3f}): {ex['question']}")
+
+
+class CountingEncoder:
+    """Deterministic stand-in for SentenceTransformer that counts encoded texts."""
+    def __init__(self):
+        self.batches = []
+    def encode(self, texts):
+        self.batches.append(len(texts))
+        out = np.zeros((len(texts), 16), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, sum(map(ord, word)) % 16] += 1
+        return out
+
+
+def test_incremental_embeddings():
+    store = ExemplarStore(initial_capacity=4, cache_dir=None, encoder=CountingEncoder())
+    # 既定の例は1回の呼び出しでまとめて埋め込む
+    assert store.encoder.batches == [5]
+    for i in range(3):
+        store.add_exemplar(f"question number {i}", f"RETURN {i}")
+    # 追加した質問だけを埋め込む
+    assert store.encoder.batches == [5, 1, 1, 1]
+    store.add_exemplars([{"question": f"bulk question {i}", "cypher": f"RETURN {i}"} for i in range(100)])
+    assert store.encoder.batches == [5, 1, 1, 1, 100]
+    assert store.embeddings.shape == (108, 16) and store.embeddings.dtype == np.float32
+    expected = store.encoder.encode([normalize_question(ex["question"]) for ex in store.exemplars])
+    assert np.allclose(store.embeddings, normalize(expected))
+    assert store.get_similar_exemplars("question number 1", k=1)[0]["question"].startswith("question number")
+
+
+def test_persistent_embeddings():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first = ExemplarStore(cache_dir=cache_dir, encoder=CountingEncoder())
+        first.add_exemplar("Who was born in Kyoto?", "RETURN 1")
+        assert first.encoder.batches == [5, 1]
+        # 2回目の起動ではディスクから読み込むだけで、エンコーダーを呼ばない
+        second = ExemplarStore(cache_dir=cache_dir, encoder=CountingEncoder())
+        second.add_exemplars([{"question": "Who was born in Kyoto?", "cypher": "RETURN 1"},
+                              {"question": "Who died in Paris?", "cypher": "RETURN 2"}])
+        assert second.encoder.batches == [1]
+        expected = normalize(first.encoder.encode([normalize_question(ex["question"]) for ex in second.exemplars]))
+        assert np.allclose(second.embeddings, expected)
+        assert second.disk_cache.get_stats() == {'entries': 7, 'hits': 6, 'misses': 1}
+        # 既定のエンコーダーはモデルを最初の encode まで読み込まない
+        lazy = ExemplarStore(cache_dir=cache_dir)
+        assert isinstance(lazy.encoder, LazyEncoder) and not lazy.encoder.loaded
+        assert lazy.embeddings.shape == (5, 16)
+
+
+def test_disk_cache_appends():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingDiskCache(cache_dir, "model")
+        cache.put(["a"], np.ones((1, 4)))
+        with open(cache.path, "rb") as f:
+            before = f.read()
+        cache.put(["b", "a"], np.full((2, 4), 2.0))
+        with open(cache.path, "rb") as f:
+            after = f.read()
+        # 既存のレコードは書き直さず、新しいキーの分だけ追記する
+        assert after.startswith(before) and len(after) - len(before) == 32 + 4 * 4
+        # 別のプロセスとして同じファイルに追記しても、キーとベクトルの組はずれない
+        other = EmbeddingDiskCache(cache_dir, "model")
+        cache.put(["c"], np.full((1, 4), 3.0))
+        other.put(["d"], np.full((1, 4), 4.0))
+        vectors, missing = EmbeddingDiskCache(cache_dir, "model").get(["a", "b", "c", "d", "e"])
+        assert missing == [4]
+        assert [float(v[0]) for v in vectors[:4]] == [1.0, 2.0, 3.0, 4.0]
+        vectors, missing = other.get(["d"])
+        assert missing == [] and float(vectors[0][0]) == 4.0
+        # 書き込み途中の末尾は読み飛ばす
+        with open(cache.path, "ab") as f:
+            f.write(b"partial")
+        assert EmbeddingDiskCache(cache_dir, "model").get_stats()['entries'] == 4
+
+
+def test_default_cache_dir_is_module_relative():
+    # カレントディレクトリに関係なく、モジュールの隣の .exemplar_cache を使う
+    assert DEFAULT_CACHE_DIR == os.path.join(os.path.dirname(os.path.abspath(exemplar_store.__file__)), ".exemplar_cache")
+
+
+def test_cosine_similarity_and_quantization():
+    stores = {
+        dtype: ExemplarStore(cache_dir=None, encoder=CountingEncoder(), embedding_dtype=dtype)
+        for dtype in ("float32", "float16", "int8")
+    }
+    for store in stores.values():
+        # 長い質問ほどノルムが大きいが、スコアはコサイン類似度になる
+        store.add_exemplar("prize prize prize prize prize winners winners in physics", "RETURN 1")
+    for dtype, store in stores.items():
+        best = store.get_similar_exemplars("Which scholars won prizes in Physics?", k=1)[0]
+        assert best["question"] == "Which scholars won prizes in Physics?", dtype
+        assert abs(best["similarity"] - 1.0) < 0.01, (dtype, best["similarity"])
+        assert all(-1.0 <= ex["similarity"] <= 1.01 for ex in store.get_similar_exemplars("prize", k=6))
+    # float16 は 1/2、int8 は 1/4 のメモリ
+    nbytes = {dtype: store.index.nbytes for dtype, store in stores.items()}
+    assert nbytes["float16"] * 2 == nbytes["float32"] and nbytes["int8"] * 4 == nbytes["float32"]
+
+
+def test_search_during_index_training():
+    # 既定の5件 + 3件で IVF の学習が始まる
+    store = ExemplarStore(cache_dir=None, encoder=CountingEncoder(), index=IVFIndex(min_train_size=8))
+    started, release = threading.Event(), threading.Event()
+    locked = []
+    kmeans = vector_index._kmeans
+
+    def slow_kmeans(*args):
+        locked.append(store._lock.locked())
+        started.set()
+        release.wait(10)
+        return kmeans(*args)
+
+    vector_index._kmeans = slow_kmeans
+    try:
+        trainer = threading.Thread(
+            target=store.add_exemplars,
+            args=([{"question": f"question number {i}", "cypher": f"RETURN {i}"} for i in range(3)],),
+        )
+        trainer.start()
+        assert started.wait(10)
+        # k-means の途中でも検索と追加はすぐに返る
+        begin = time.perf_counter()
+        assert store.get_similar_exemplars("question number 1", k=1)[0]["cypher"] == "RETURN 1"
+        store.add_exemplar("Who was born in Kyoto?", "RETURN 9")
+        assert time.perf_counter() - begin < 1.0 and not store.index.get_stats()['trained']
+        release.set()
+        trainer.join(10)
+    finally:
+        vector_index._kmeans = kmeans
+    assert locked == [False] and store.index.get_stats()['trained']
+    assert store.get_similar_exemplars("Who was born in Kyoto?", k=1)[0]["cypher"] == "RETURN 9"
+
+
 if __name__ == "__main__":
-    test_exemplar_store()
\ No newline at end of file
+    test_exemplar_store()
+    test_incremental_embeddings()
+    test_persistent_embeddings()
+    test_disk_cache_appends()
+    test_default_cache_dir_is_module_relative()
+    test_cosine_similarity_and_quantization()
+    test_search_during_index_training()
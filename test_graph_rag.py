@@ -0,0 +1,277 @@
+# 実行コマンド:uv run python test_graph_rag.py
+#!/usr/bin/env python3
+import asyncio
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import dspy
+import numpy as np
+import pyarrow as pa
+
+from exemplar_store import ExemplarStore
+from graph_rag import graph_rag_pipeline
+from kuzu_pool import PoolClosedError
+from prepared_statements import PlanCacheStats
+from result_cache import QueryResultCache
+
+SCHEMA = "{'nodes': [{'label': 'Scholar'}, {'label': 'Prize'}], 'edges': []}"
+
+
+class WordEncoder:
+    def encode(self, texts):
+        out = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.split():
+                out[i, zlib.crc32(word.encode()) % 64] += 1
+        return out
+
+
+class FakeExemplarStore:
+    """ExemplarStore.shared の代わり（モデルを読み込まず、ディスクにも書かない）"""
+
+    @staticmethod
+    def shared():
+        return ExemplarStore(cache_dir=None, encoder=WordEncoder())
+
+
+# ノートブックのセルを関数として実行し、ExemplarStore と SQLite のパスだけ差し替える
+_, defs = graph_rag_pipeline.run(ExemplarStore=FakeExemplarStore, DEFAULT_CACHE_PATH=None)
+GraphRAG = defs["GraphRAG"]
+arun_graph_rag = defs["arun_graph_rag"]
+run_graph_rag = defs["run_graph_rag"]
+
+
+class FakeResult:
+    def __init__(self, table):
+        self.table = table
+
+    def get_as_arrow(self, chunk_size=None):
+        return self.table
+
+
+class FakeDatabase:
+    """KuzuDatabaseManager の代わり。BAD を含むクエリは Kuzu と同じく RuntimeError になる"""
+
+    db_version = "v1"
+    get_schema_str = SCHEMA
+
+    def __init__(self):
+        self.result_cache = QueryResultCache()
+        self.plan_cache_stats = PlanCacheStats()
+        self.executed = []
+
+    def validate(self, cypher, db_version=None):
+        if "BAD" in cypher:
+            raise RuntimeError("Binder exception: Table BAD does not exist.")
+
+    @contextmanager
+    def query(self, cypher):
+        self.executed.append(cypher)
+        yield FakeResult(pa.table({"s.knownName": ["Marie Curie"], "p.awardYear": [1903]}))
+
+    def fetch_column(self, cypher):
+        return []
+
+
+class AsyncStub:
+    """dspy.Predict / ChainOfThought の代わり。非同期のパイプラインからは acall だけが呼ばれる"""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        raise AssertionError("blocking call from the async pipeline")
+
+    async def acall(self, **kwargs):
+        self.calls.append(kwargs)
+        await asyncio.sleep(0)
+        return self.outputs[min(len(self.calls), len(self.outputs)) - 1]
+
+
+class SyncStub(AsyncStub):
+    """同期のパイプライン用"""
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.outputs[min(len(self.calls), len(self.outputs)) - 1]
+
+
+def cypher(query):
+    return dspy.Prediction(query=SimpleNamespace(query=query))
+
+
+def make_rag():
+    rag = GraphRAG(use_templates=False, use_rule_pruner=False, cache_path=None, mine_exemplars=False)
+    rag.prune = AsyncStub(dspy.Prediction(pruned_schema={"nodes": [], "edges": []}))
+    rag.generate_answer = AsyncStub(dspy.Prediction(response="Marie Curie won in 1903."))
+    return rag
+
+
+def test_aforward_refines_off_the_event_loop():
+    rag = make_rag()
+    rag.text2cypher = AsyncStub(cypher("MATCH (s:BAD) RETURN s"), cypher("MATCH (s:Scholar) RETURN s.knownName"))
+    invalidated_on = []
+    invalidate = rag.cache.invalidate
+
+    def recording_invalidate(*args):
+        invalidated_on.append(threading.current_thread())
+        invalidate(*args)
+
+    rag.cache.invalidate = recording_invalidate
+    db = FakeDatabase()
+
+    async def main():
+        return threading.current_thread(), await rag.aforward(db, "Who won in 1903?", SCHEMA)
+
+    loop_thread, response = asyncio.run(main())
+    assert response["query"] == "MATCH (s:Scholar) RETURN s.knownName"
+    assert response["answer"].response == "Marie Curie won in 1903."
+    assert db.executed == ["MATCH (s:Scholar) RETURN s.knownName"]
+    # 再試行では Text2Cypher だけを呼び直し、失敗は次のプロンプトに渡る
+    assert len(rag.prune.calls) == 1 and len(rag.text2cypher.calls) == 2
+    assert "MATCH (s:BAD) RETURN s" in rag.text2cypher.calls[1]["triples"]
+    # 失敗の記録とキャッシュの削除はイベントループのスレッドでは行わない
+    assert invalidated_on and loop_thread not in invalidated_on
+    # 実行に成功した再生成クエリだけがキャッシュに入る
+    assert rag.cache.get("Who won in 1903?", SCHEMA)["query"] == "MATCH (s:Scholar) RETURN s.knownName"
+
+
+def test_arun_query_gives_up_after_max_tries():
+    rag = make_rag()
+    rag.text2cypher = AsyncStub(cypher("MATCH (s:BAD) RETURN s"))
+    db = FakeDatabase()
+    response = asyncio.run(rag.aforward(db, "Who won in 1903?", SCHEMA))
+    assert response == {} and len(rag.text2cypher.calls) == 5 and db.executed == []
+    assert len(rag.generate_answer.calls) == 0
+    # 一度も実行できなかったクエリはキャッシュに残さない
+    assert rag.cache.get("Who won in 1903?", SCHEMA) is None
+
+
+def test_run_query_caches_refined_query_after_success():
+    rag = make_rag()
+    rag.prune = SyncStub(dspy.Prediction(pruned_schema={"nodes": [], "edges": []}))
+    rag.text2cypher = SyncStub(cypher("MATCH (s:BAD) RETURN s"), cypher("MATCH (s:Scholar) RETURN s.knownName"))
+    db = FakeDatabase()
+    cached_before_execution = []
+    execute = rag._execute
+
+    def recording_execute(db_manager, query):
+        cached_before_execution.append(rag.cache.get("Who won in 1903?", SCHEMA))
+        return execute(db_manager, query)
+
+    rag._execute = recording_execute
+    query, results = rag.run_query(db, "Who won in 1903?", SCHEMA)
+    assert query == "MATCH (s:Scholar) RETURN s.knownName" and results.num_rows == 1
+    # 失敗したクエリは削除され、再生成したクエリは実行前にはキャッシュされていない
+    assert cached_before_execution[1] is None
+    assert rag.cache.get("Who won in 1903?", SCHEMA)["query"] == query
+
+
+class ClosedDatabase(FakeDatabase):
+    """プールを閉じた後の KuzuDatabaseManager"""
+
+    def validate(self, cypher, db_version=None):
+        raise PoolClosedError("Connection pool is closed")
+
+
+def test_closed_pool_is_not_retried():
+    rag = make_rag()
+    rag.prune = SyncStub(dspy.Prediction(pruned_schema={"nodes": [], "edges": []}))
+    rag.text2cypher = SyncStub(cypher("MATCH (s:Scholar) RETURN s.knownName"))
+    failures = []
+    rag._record_failure = lambda *args: failures.append(args)
+    # シャットダウンは Cypher の失敗ではないので、再生成もキャッシュの削除もせずにそのまま上げる
+    for run in (
+        lambda: rag.run_query(ClosedDatabase(), "Who won in 1903?", SCHEMA),
+        lambda: asyncio.run(rag.arun_query(ClosedDatabase(), "Who won in 1903?", SCHEMA)),
+    ):
+        try:
+            run()
+            assert False, "a closed pool should propagate"
+        except PoolClosedError:
+            pass
+    # 2回目はキャッシュしたクエリがそのまま使われる（キャッシュから削除されていない）
+    assert len(rag.text2cypher.calls) == 1 and failures == []
+
+
+class RecordingRag:
+    """GraphRAG の代わり。同時に実行中の質問数の最大値を記録する"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.questions = []
+        self.prefetched = []
+        self.active = 0
+        self.peak = 0
+
+    def prefetch_embeddings(self, questions):
+        self.prefetched.append(list(questions))
+
+    def __call__(self, db_manager, question, input_schema):
+        self.questions.append(question)
+        time.sleep(self.delay)
+        return {"question": question, "answer": question.upper()}
+
+    async def acall(self, db_manager, question, input_schema):
+        self.questions.append(question)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        if question == "fail":
+            raise RuntimeError("LM unavailable")
+        return {"question": question, "answer": question.upper()}
+
+
+def test_batch_dedupes_and_keeps_order():
+    rag = RecordingRag()
+    questions = ["Who won in 1903?", "who won in 1903", "Who won in 1911?", "fail", "Who won in 1903?"]
+    results = asyncio.run(arun_graph_rag(questions, FakeDatabase(), rag=rag))
+    # 同じ質問（正規化して同じ）は1回だけ処理し、埋め込みはバッチで1回だけ計算する
+    assert rag.questions == ["Who won in 1903?", "Who won in 1911?", "fail"]
+    assert rag.prefetched == [["who won in 1903", "who won in 1911", "fail"]]
+    assert [r.get("answer") for r in results] == ["WHO WON IN 1903?"] * 2 + ["WHO WON IN 1911?", None, "WHO WON IN 1903?"]
+    # 失敗した質問はエラーとして返し、他の質問は止めない
+    assert results[3]["error"] == "LM unavailable"
+    assert all(r["elapsed_ms"] >= 50 for r in results)
+    # 重複した質問の結果は別の dict（呼び出し側で書き換えても影響しない）
+    assert results[0] is not results[1]
+
+
+def test_batch_respects_max_concurrency():
+    rag = RecordingRag()
+    questions = [f"Who won in {year}?" for year in range(1901, 1909)]
+    start = time.perf_counter()
+    results = asyncio.run(arun_graph_rag(questions, FakeDatabase(), max_concurrency=3, rag=rag))
+    assert len(results) == 8 and rag.peak == 3
+    # 3件ずつ並行して3回分の時間
+    assert time.perf_counter() - start < 0.05 * 8
+
+
+def test_run_graph_rag_inside_running_loop():
+    rag = RecordingRag()
+
+    async def notebook_cell():
+        # marimo のようにイベントループが動いているスレッドから同期版を呼ぶ
+        return run_graph_rag(["Who won in 1903?", "Who won in 1911?"], FakeDatabase(), rag=rag)
+
+    results = asyncio.run(notebook_cell())
+    assert [r["answer"] for r in results] == ["WHO WON IN 1903?", "WHO WON IN 1911?"]
+    assert rag.peak == 2
+    # 1件だけなら同期のパイプラインをそのまま使う
+    single = run_graph_rag(["Who won in 1903?"], FakeDatabase(), rag=rag)
+    assert single[0]["answer"] == "WHO WON IN 1903?" and single[0]["elapsed_ms"] >= 50
+
+
+if __name__ == "__main__":
+    test_aforward_refines_off_the_event_loop()
+    test_arun_query_gives_up_after_max_tries()
+    test_run_query_caches_refined_query_after_success()
+    test_closed_pool_is_not_retried()
+    test_batch_dedupes_and_keeps_order()
+    test_batch_respects_max_concurrency()
+    test_run_graph_rag_inside_running_loop()
@@ -0,0 +1,99 @@
+# 実行コマンド:uv run python test_kuzu_pool.py
+#!/usr/bin/env python3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kuzu_pool import KuzuConnectionPool, PoolClosedError, PoolTimeoutError
+
+
+class FakeConnection:
+    """kuzu.Connection の代わり"""
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+
+    def execute(self, query):
+        if self.broken:
+            raise RuntimeError("connection is broken")
+        time.sleep(0.05)
+        return [[1]]
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_connections():
+    pool = KuzuConnectionPool(FakeConnection, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert pool.get_stats()['created'] == 1
+
+
+def test_pool_bounds_concurrency():
+    pool = KuzuConnectionPool(FakeConnection, size=3)
+    active = []
+    lock = threading.Lock()
+
+    def run(_):
+        with pool.connection() as conn:
+            with lock:
+                active.append(conn)
+            conn.execute("RETURN 1;")
+        return True
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(run, range(16)))
+    stats = pool.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['created'] == 3 and stats['peak_in_use'] == 3 and stats['checkouts'] == 16
+    assert len(set(map(id, active))) == 3
+
+
+def test_pool_timeout():
+    pool = KuzuConnectionPool(FakeConnection, size=1, timeout=0.05)
+    with pool.connection():
+        try:
+            with pool.connection():
+                assert False, "second checkout should time out"
+        except PoolTimeoutError:
+            pass
+    # Cypher のエラー（RuntimeError）として自己修正ループに拾われないこと
+    assert not issubclass(PoolTimeoutError, RuntimeError)
+
+
+def test_pool_close_discards_returned_connections():
+    pool = KuzuConnectionPool(FakeConnection, size=2)
+    with pool.connection() as conn:
+        with pool.connection() as idle:
+            pass
+        pool.close()
+        assert idle is not conn and idle.closed and conn.closed
+    # 貸し出し中だった接続が返却されても空きリストには戻らない
+    assert pool._idle.empty() and pool.get_stats()['open'] == 0
+    try:
+        with pool.connection():
+            assert False, "checkout after close should fail"
+    except PoolClosedError:
+        pass
+    assert not issubclass(PoolClosedError, RuntimeError)
+
+
+def test_pool_replaces_unhealthy_connections():
+    pool = KuzuConnectionPool(FakeConnection, size=1, health_check_interval=0)
+    with pool.connection() as conn:
+        conn.broken = True
+    with pool.connection() as replacement:
+        assert replacement is not conn and not replacement.broken
+    assert conn.closed and pool.get_stats()['replaced'] == 1
+
+
+if __name__ == "__main__":
+    test_pool_reuses_connections()
+    test_pool_bounds_concurrency()
+    test_pool_timeout()
+    test_pool_close_discards_returned_connections()
+    test_pool_replaces_unhealthy_connections()
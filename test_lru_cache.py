@@ -0,0 +1,299 @@
+# 実行コマンド:uv run python test_lru_cache.py
+#!/usr/bin/env python3
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cache_backends import SQLiteCacheBackend
+from lru_cache import AnswerCache, PrunedSchemaCache, Text2CypherCache
+
+SCHEMA = "{'nodes': [{'label': 'Scholar'}], 'edges': []}"
+
+
+class BagOfWordsEncoder:
+    """SentenceTransformer の代わりに使う軽量エンコーダー"""
+    vocabulary = ["who", "which", "scholars", "won", "physics", "chemistry", "prize", "prizes"]
+
+    def encode(self, texts):
+        return np.array([[t.count(w) for w in self.vocabulary] for t in texts], dtype=np.float32)
+
+
+def test_normalized_question_hits():
+    cache = Text2CypherCache()
+    cache.set("Who won physics prizes?", SCHEMA, "MATCH (s:Scholar) RETURN s")
+    assert cache.get("  who won Physics   prizes", SCHEMA)['query'] == "MATCH (s:Scholar) RETURN s"
+    assert cache.get("Who won physics prizes?", SCHEMA + " ") is None
+    print(f"Stats: {cache.get_stats()}")
+
+
+def test_invalidate():
+    cache = Text2CypherCache()
+    cache.set("q", SCHEMA, "bad query")
+    cache.invalidate("q", SCHEMA)
+    assert cache.get("q", SCHEMA) is None
+
+
+def test_pruned_schema_cache():
+    cache = PrunedSchemaCache()
+    cache.set("Who won physics prizes?", SCHEMA, {"nodes": [], "edges": []})
+    assert cache.get("who won physics prizes", SCHEMA)['pruned_schema'] == {"nodes": [], "edges": []}
+
+
+def test_semantic_tier():
+    cache = Text2CypherCache(semantic_encoder=BagOfWordsEncoder(), similarity_threshold=0.55, semantic_maxsize=2)
+    cache.set("Who won physics prizes?", SCHEMA, "physics query")
+    result = cache.get("Which scholars won the Physics prize?", SCHEMA)
+    assert result['query'] == "physics query" and result['similarity'] >= 0.55
+    assert cache.get("Who won chemistry?", SCHEMA) is None
+    # 別スキーマのエントリは返さない
+    assert cache.get("Which scholars won the Physics prize?", SCHEMA + " ") is None
+    stats = cache.get_stats()
+    assert stats['hits'] == 0 and stats['semantic']['hits'] == 1 and stats['semantic']['misses'] == 2
+
+    # 近似ティアは独自に LRU で削除される
+    cache.set("Who won chemistry prizes?", SCHEMA, "chemistry query")
+    cache.set("Which scholars won?", SCHEMA, "scholars query")
+    assert cache.get_stats()['semantic']['size'] == 2
+    result = cache.get("Which scholars won the Physics prize?", SCHEMA)
+    assert result is None or result['query'] != "physics query"
+
+
+def test_semantic_invalidate():
+    cache = Text2CypherCache(semantic_encoder=BagOfWordsEncoder(), similarity_threshold=0.55)
+    cache.set("Who won physics prizes?", SCHEMA, "bad query")
+    assert cache.get("Which scholars won the Physics prize?", SCHEMA) is not None
+    cache.invalidate("Which scholars won the Physics prize?", SCHEMA)
+    assert cache.get("Which scholars won the Physics prize?", SCHEMA) is None
+
+
+def test_semantic_ttl_and_clear():
+    cache = Text2CypherCache(semantic_encoder=BagOfWordsEncoder(), similarity_threshold=0.55)
+    cache.set("Who won physics prizes?", SCHEMA, "expired query", ttl=-1)
+    # 近似ティアでも TTL が切れたエントリは返さずに削除する
+    assert cache.get("Which scholars won the Physics prize?", SCHEMA) is None
+    semantic = cache.semantic.get_stats()
+    assert semantic['expirations'] == 1 and semantic['size'] == 0
+
+    cache.set("Who won physics prizes?", SCHEMA, "physics query")
+    cache.clear()
+    assert cache.semantic.matrix is None and not cache.semantic.slots
+    assert all(fp is None for fp in cache.semantic.fingerprints)
+    assert cache.get("Which scholars won the Physics prize?", SCHEMA) is None
+
+
+def test_semantic_requires_same_literals():
+    cache = Text2CypherCache(semantic_encoder=BagOfWordsEncoder(), similarity_threshold=0.55)
+    cache.set("Who won the Nobel Prize in Physics in 1903?", SCHEMA, "1903 query")
+    # 年だけが違う質問は類似度が高くてもミスにする（エンコーダーは数字を見ない）
+    assert cache.get("Who won the Nobel Prize in Physics in 1921?", SCHEMA) is None
+    assert cache.get("Who won the Nobel Prize in Chemistry in 1903?", SCHEMA) is None
+    semantic = cache.semantic.get_stats()
+    assert semantic['hits'] == 0 and semantic['literal_mismatches'] == 2
+    # リテラルが同じ言い換えはヒットする
+    result = cache.get("Which scholars won the physics prize in 1903?", SCHEMA)
+    assert result is not None and result['query'] == "1903 query"
+    # 削除も同じリテラルのエントリだけ
+    cache.invalidate("Who won the Nobel Prize in Physics in 1921?", SCHEMA)
+    assert cache.semantic.get_stats()['size'] == 1
+
+
+def test_sqlite_backend_warm_start():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        first = Text2CypherCache(backend=SQLiteCacheBackend(path), hit_flush_every=2)
+        first.set("Who won physics prizes?", SCHEMA, "physics query")
+        first.set("Who won chemistry prizes?", SCHEMA, "chemistry query")
+        # メモリでのヒットも2件たまったらディスクのヒット数に反映される
+        first.get("Who won physics prizes?", SCHEMA)
+        first.get("Who won physics prizes?", SCHEMA)
+        assert first.get_stats()['pending_hits'] == 0
+
+        # 別プロセス相当: 新しいインスタンスは起動時にディスクから最もホットなエントリを読み込む
+        second = Text2CypherCache(backend=SQLiteCacheBackend(path), warm_start=1)
+        assert list(second.cache) == [second._generate_key("Who won physics prizes?", SCHEMA)]
+        assert second.get("who won physics prizes", SCHEMA)['query'] == "physics query"
+        assert second.get("Who won chemistry prizes?", SCHEMA)['query'] == "chemistry query"
+        assert second.get_stats()['backend_hits'] == 1
+
+
+def test_sqlite_backend_eviction_and_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteCacheBackend(os.path.join(tmp, "cache.sqlite"), maxsize=2, ttl=60)
+        backend.set("a", {'query': "A", 'timestamp': time.time()})
+        backend.set("b", {'query': "B", 'timestamp': time.time()})
+        backend.get("a")
+        backend.set("c", {'query': "C", 'timestamp': time.time()})
+        assert backend.get("b") is None and backend.get("a")['query'] == "A"
+        backend.set("old", {'query': "OLD", 'timestamp': time.time() - 120})
+        assert backend.get("old") is None
+        assert backend.get_stats()['evictions'] >= 1
+
+
+def test_eviction_policies_under_scan():
+    # ホットな質問を何度か使った後、1回きりの質問が大量に来ても LFU / ARC はホットな質問を残す
+    for policy, survives in (("lru", False), ("lfu", True), ("arc", True)):
+        cache = Text2CypherCache(maxsize=4, policy=policy)
+        cache.set("hot question", SCHEMA, "hot query")
+        cache.get("hot question", SCHEMA)
+        cache.get("hot question", SCHEMA)
+        for i in range(10):
+            cache.set(f"one-off question {i}", SCHEMA, f"query {i}")
+        assert (cache.get("hot question", SCHEMA) is not None) == survives, policy
+        assert cache.get_stats()['evictions'] >= 7
+
+
+def test_reset_keeps_policy_state():
+    # 既存のキーを set し直してもホットなまま（ARC の T2・LFU の回数を保つ）
+    cache = Text2CypherCache(maxsize=4, policy="arc")
+    cache.set("hot question", SCHEMA, "hot query")
+    cache.get("hot question", SCHEMA)
+    cache.set("hot question", SCHEMA, "regenerated query")
+    key = cache._generate_key("hot question", SCHEMA)
+    assert key in cache.policy.t2 and key not in cache.policy.t1
+    assert cache.get("hot question", SCHEMA)['query'] == "regenerated query"
+
+    cache = Text2CypherCache(maxsize=4, policy="lfu")
+    cache.set("hot question", SCHEMA, "hot query")
+    cache.get("hot question", SCHEMA)
+    cache.get("hot question", SCHEMA)
+    cache.set("hot question", SCHEMA, "regenerated query")
+    assert cache.policy.freq[cache._generate_key("hot question", SCHEMA)] == 4
+    assert cache.get_stats()['size'] == 1
+
+
+def test_ttl_and_max_bytes():
+    cache = Text2CypherCache(ttl=60)
+    cache.set("q1", SCHEMA, "query 1")
+    cache.set("q2", SCHEMA, "query 2", ttl=-1)
+    assert cache.get("q1", SCHEMA) is not None
+    assert cache.get("q2", SCHEMA) is None
+    assert cache.get_stats()['expirations'] == 1
+
+    cache = Text2CypherCache(max_bytes=2000)
+    for i in range(20):
+        cache.set(f"question {i}", SCHEMA, "x" * 100)
+    stats = cache.get_stats()
+    assert stats['bytes'] <= 2000 and stats['size'] < 20 and stats['evictions'] > 0
+
+
+def test_single_flight_threads():
+    cache = Text2CypherCache()
+    calls = []
+    lock = threading.Lock()
+
+    def compute():
+        with lock:
+            calls.append(1)
+        time.sleep(0.1)
+        return "generated query"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda _: cache.get_or_compute("Who won physics prizes?", SCHEMA, compute), range(8)
+        ))
+    assert len(calls) == 1
+    assert all(entry['query'] == "generated query" for entry, _ in results)
+    assert sum(computed for _, computed in results) == 1
+    assert cache.get_stats()['coalesced'] + 1 == 8 - cache.get_stats()['hits']
+
+
+def test_single_flight_async():
+    cache = Text2CypherCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "generated query"
+
+    async def main():
+        return await asyncio.gather(*[
+            cache.aget_or_compute("Who won physics prizes?", SCHEMA, compute) for _ in range(5)
+        ])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [entry['query'] for entry, _ in results] == ["generated query"] * 5
+
+
+def test_encode_outside_lock():
+    class SlowEncoder(BagOfWordsEncoder):
+        def encode(self, texts):
+            time.sleep(0.3)
+            return super().encode(texts)
+
+    cache = Text2CypherCache(semantic_encoder=SlowEncoder(), similarity_threshold=0.55)
+    cache.set("Who won physics prizes?", SCHEMA, "physics query")
+    paraphrase = threading.Thread(target=cache.get, args=("Which scholars won the Physics prize?", SCHEMA))
+    paraphrase.start()
+    time.sleep(0.05)
+    # 近似ティアのエンコード中でも、完全一致のヒットは待たされない
+    start = time.perf_counter()
+    assert cache.get("Who won physics prizes?", SCHEMA)['query'] == "physics query"
+    assert time.perf_counter() - start < 0.1
+    paraphrase.join()
+
+
+def test_sync_follower_on_event_loop():
+    cache = Text2CypherCache()
+    results = []
+
+    async def compute():
+        await asyncio.sleep(0.1)
+        return "async query"
+
+    async def main():
+        leader = asyncio.ensure_future(cache.aget_or_compute("Who won physics prizes?", SCHEMA, compute))
+        await asyncio.sleep(0.05)
+        # イベントループのスレッドから同期版を呼んでも、同じループの leader を待ってデッドロックしない
+        results.append(cache.get_or_compute("Who won physics prizes?", SCHEMA, lambda: "sync query"))
+        results.append(await leader)
+
+    runner = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+    runner.start()
+    runner.join(timeout=5)
+    assert not runner.is_alive(), "sync follower deadlocked the event loop"
+    assert results[0] == (results[0][0], True) and results[0][0]['query'] == "sync query"
+    assert cache.get_stats()['coalesce_fallbacks'] == 1
+
+
+def test_answer_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        cache = AnswerCache(backend=SQLiteCacheBackend(path, namespace="answer"), ttl=60)
+        query = "MATCH (p:Prize) RETURN count(p)"
+        cache.set_answer("How many prizes?", query, "[399]", {"response": "There are 399 prizes."})
+        assert cache.get_answer("how many prizes", query + " ;", "[399]")['answer']['response'] == "There are 399 prizes."
+        # コンテキストが変われば別のエントリ
+        assert cache.get_answer("How many prizes?", query, "[400]") is None
+
+        restarted = AnswerCache(backend=SQLiteCacheBackend(path, namespace="answer"), warm_start=10)
+        assert restarted.get_answer("How many prizes?", query, "[399]") is not None
+        assert restarted.get_stats()['hits'] == 1
+        # 同じファイルの Text2Cypher 名前空間とは混ざらない
+        assert len(SQLiteCacheBackend(path, namespace="text2cypher")) == 0
+
+
+if __name__ == "__main__":
+    test_normalized_question_hits()
+    test_invalidate()
+    test_pruned_schema_cache()
+    test_semantic_tier()
+    test_semantic_invalidate()
+    test_semantic_ttl_and_clear()
+    test_semantic_requires_same_literals()
+    test_sqlite_backend_warm_start()
+    test_sqlite_backend_eviction_and_ttl()
+    test_eviction_policies_under_scan()
+    test_reset_keeps_policy_state()
+    test_ttl_and_max_bytes()
+    test_single_flight_threads()
+    test_single_flight_async()
+    test_encode_outside_lock()
+    test_sync_follower_on_event_loop()
+    test_answer_cache()
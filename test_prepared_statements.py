@@ -0,0 +1,82 @@
+# 実行コマンド:uv run python test_prepared_statements.py
+#!/usr/bin/env python3
+from prepared_statements import PreparedStatementCache, parameterize
+
+
+class FakePrepared:
+    def __init__(self, query, error=None):
+        self.query = query
+        self.error = error
+
+    def is_success(self):
+        return self.error is None
+
+    def get_error_message(self):
+        return self.error
+
+
+class FakeConnection:
+    """kuzu.Connection の代わり: $ を含むテンプレートの prepare を失敗させることもできる"""
+
+    def __init__(self, reject_params=False):
+        self.reject_params = reject_params
+        self.prepared = []
+
+    def prepare(self, query):
+        self.prepared.append(query)
+        if "awardYea " in query:
+            return FakePrepared(query, "Binder exception: Cannot find property awardYea for p.")
+        if self.reject_params and "$" in query:
+            return FakePrepared(query, "Binder exception: parameter not allowed here")
+        return FakePrepared(query)
+
+    def execute(self, prepared, parameters):
+        return (prepared.query, parameters)
+
+
+def test_parameterize_literals():
+    template, params = parameterize(
+        "MATCH (s:Scholar)-[:WON]->(p:Prize) WHERE LOWER(p.category) CONTAINS 'physics' "
+        "AND p.awardYear = 2020 RETURN s.knownName LIMIT 10"
+    )
+    assert template == (
+        "MATCH (s:Scholar)-[:WON]->(p:Prize) WHERE LOWER(p.category) CONTAINS $__p0 "
+        "AND p.awardYear = $__p1 RETURN s.knownName LIMIT 10"
+    )
+    assert params == {"__p0": "physics", "__p1": 2020}
+
+
+def test_parameterize_keeps_structural_numbers():
+    template, params = parameterize("MATCH (a)-[*1..3]->(b) WHERE a.name = 'O\\'Brien' RETURN b.x2 SKIP 5")
+    assert template == "MATCH (a)-[*1..3]->(b) WHERE a.name = $__p0 RETURN b.x2 SKIP 5"
+    assert params == {"__p0": "O'Brien"}
+
+
+def test_plan_reused_across_literal_values():
+    conn = FakeConnection()
+    cache = PreparedStatementCache(conn)
+    assert cache.execute("MATCH (p:Prize) WHERE p.awardYear = 2020 RETURN p.category")[1] == {"__p0": 2020}
+    assert cache.execute("MATCH (p:Prize) WHERE p.awardYear = 1999 RETURN p.category")[1] == {"__p0": 1999}
+    assert len(conn.prepared) == 1
+    assert cache.stats.get_stats()['hits'] == 1
+
+
+def test_fallback_and_errors():
+    conn = FakeConnection(reject_params=True)
+    cache = PreparedStatementCache(conn)
+    assert cache.execute("MATCH (p:Prize) RETURN p.category LIMIT 2 + 1")[1] == {}
+    assert cache.execute("MATCH (p:Prize) RETURN p.category LIMIT 2 + 1")[1] == {}
+    stats = cache.stats.get_stats()
+    assert stats['fallbacks'] == 1 and stats['hits'] == 1
+    try:
+        cache.execute("MATCH (p:Prize) RETURN p.awardYea LIMIT 1")
+        assert False, "invalid query should raise"
+    except RuntimeError as e:
+        assert "awardYea" in str(e)
+
+
+if __name__ == "__main__":
+    test_parameterize_literals()
+    test_parameterize_keeps_structural_numbers()
+    test_plan_reused_across_literal_values()
+    test_fallback_and_errors()
@@ -0,0 +1,59 @@
+# 実行コマンド:uv run python test_refinement_memory.py
+#!/usr/bin/env python3
+import numpy as np
+
+from refinement_memory import RefinementMemory
+
+
+class BagOfWordsEncoder:
+    """SentenceTransformer の代わりに使う軽量エンコーダー"""
+    vocabulary = ["who", "which", "scholars", "won", "physics", "chemistry", "prize", "prizes", "born"]
+
+    def encode(self, texts):
+        return np.array([[t.count(w) for w in self.vocabulary] for t in texts], dtype=np.float32)
+
+
+def test_scoped_per_question():
+    memory = RefinementMemory()
+    memory.add("Who won physics prizes?", "MATCH (s:Scolar) RETURN s", "Binder exception: Table Scolar does not exist.")
+    memory.add("Where was Marie Curie born?", "MATCH (c:Cty) RETURN c", "Binder exception: Table Cty does not exist.")
+    triples = memory.relevant("who won physics prizes")
+    assert [t["query"] for t in triples] == ["MATCH (s:Scolar) RETURN s"]
+    assert set(triples[0]) == {"question", "query", "error"}
+    assert memory.relevant("Which country has the most laureates?") == []
+
+
+def test_bounded_and_evicted():
+    memory = RefinementMemory(max_triples_per_question=2, max_questions=2, max_error_chars=10)
+    for i in range(3):
+        memory.add("q1", f"query {i}", "x" * 100)
+    # 同じクエリでの失敗は最新のものだけ残す
+    memory.add("q1", "query 2", "retry error")
+    assert [t["query"] for t in memory.relevant("q1")] == ["query 2", "query 1"]
+    assert memory.relevant("q1")[1]["error"] == "x" * 10
+    memory.add("q2", "query", "error")
+    memory.relevant("q1")
+    memory.add("q3", "query", "error")
+    # q1 は最近使われたので残り、q2 が削除される
+    assert memory.relevant("q2") == [] and len(memory.relevant("q1")) == 2
+    assert memory.get_stats()['evicted_questions'] == 1
+
+
+def test_similar_questions_and_token_budget():
+    memory = RefinementMemory(encoder=BagOfWordsEncoder(), similarity_threshold=0.6, max_tokens=40)
+    memory.add("Which scholars won physics prizes?", "MATCH (s:Scolar) RETURN s", "Table Scolar does not exist")
+    memory.add("Where were scholars born?", "MATCH (c:Cty) RETURN c", "Table Cty does not exist")
+    triples = memory.relevant("Who won the physics prize?")
+    assert [t["query"] for t in triples] == ["MATCH (s:Scolar) RETURN s"]
+    assert memory.get_stats()['similar_hits'] == 1
+
+    for i in range(5):
+        memory.add("Who won the physics prize?", f"MATCH (p:Prize) RETURN p.wrong_{i}", "Cannot find property")
+    # トークン数の上限を超える分は返さない
+    assert 0 < len(memory.relevant("Who won the physics prize?")) < 4
+
+
+if __name__ == "__main__":
+    test_scoped_per_question()
+    test_bounded_and_evicted()
+    test_similar_questions_and_token_budget()
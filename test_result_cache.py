@@ -0,0 +1,39 @@
+# 実行コマンド:uv run python test_result_cache.py
+#!/usr/bin/env python3
+from result_cache import QueryResultCache, normalize_cypher
+
+
+def test_normalize_cypher():
+    assert normalize_cypher("MATCH (s:Scholar)\n   WHERE s.knownName CONTAINS 'Marie  Curie'\nRETURN s ;") == (
+        "MATCH (s:Scholar) WHERE s.knownName CONTAINS 'Marie  Curie' RETURN s"
+    )
+
+
+def test_hit_and_version_invalidation():
+    cache = QueryResultCache()
+    cache.set("MATCH (p:Prize) RETURN count(p)", "v1", [399])
+    assert cache.get("MATCH (p:Prize)   RETURN count(p);", "v1") == [399]
+    # DB が作り直されたらバージョンが変わり、古い結果は返さない
+    assert cache.get("MATCH (p:Prize) RETURN count(p)", "v2") is None
+    stats = cache.get_stats()
+    assert stats['hits'] == 1 and stats['invalidations'] == 1 and stats['size'] == 0
+
+
+def test_bounded_by_entries_and_bytes():
+    cache = QueryResultCache(maxsize=2)
+    for i in range(5):
+        cache.set(f"RETURN {i}", "v1", [i])
+    assert cache.get_stats()['size'] == 2 and cache.get_stats()['evictions'] == 3
+
+    cache = QueryResultCache(max_bytes=10_000)
+    cache.set("huge", "v1", ["x" * 20_000])
+    assert cache.get("huge", "v1") is None
+    for i in range(50):
+        cache.set(f"RETURN {i}", "v1", ["y" * 500])
+    assert cache.get_stats()['bytes'] <= 10_000
+
+
+if __name__ == "__main__":
+    test_normalize_cypher()
+    test_hit_and_version_invalidation()
+    test_bounded_by_entries_and_bytes()
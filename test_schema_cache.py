@@ -0,0 +1,119 @@
+# 実行コマンド:uv run python test_schema_cache.py
+#!/usr/bin/env python3
+import os
+import tempfile
+import threading
+
+import kuzu
+
+from schema_cache import SchemaSnapshotCache
+
+
+class CountingConnection:
+    """kuzu.Connection をラップしてカタログクエリの回数と同時実行数を数える"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def execute(self, query):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return self.conn.execute(query)
+        finally:
+            self.active -= 1
+
+
+def _setup(tmpdir):
+    db_path = os.path.join(tmpdir, "test.kuzu")
+    conn = kuzu.Connection(kuzu.Database(db_path))
+    conn.execute("CREATE NODE TABLE Scholar(id INT64 PRIMARY KEY, name STRING)")
+    counting = CountingConnection(conn)
+
+    def introspect():
+        tables = {}
+        for row in conn.execute("CALL SHOW_TABLES() RETURN *;"):
+            tables[row[1]] = [col[1] for col in conn.execute(f"CALL TABLE_INFO('{row[1]}') RETURN *;")]
+        return tables
+
+    return db_path, conn, counting, SchemaSnapshotCache(db_path), introspect
+
+
+def test_hit_without_catalog_queries():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path, _, counting, cache, introspect = _setup(tmpdir)
+        first = cache.get(counting, introspect)
+        calls = counting.calls
+        assert cache.get(counting, introspect) is first and counting.calls == calls
+        # 別プロセスはディスク上のスナップショットを使う
+        reloaded = SchemaSnapshotCache(db_path)
+        assert reloaded.get(counting, introspect).schema == first.schema and counting.calls == calls
+        assert cache.get_stats()['hits'] == 1 and reloaded.get_stats()['introspections'] == 0
+
+
+def test_data_only_change_revalidates():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _, conn, counting, cache, introspect = _setup(tmpdir)
+        first = cache.get(counting, introspect)
+        conn.execute("CREATE (:Scholar {id: 1, name: 'Marie Curie'})")
+        # DB のバージョンは変わるが DDL は同じなのでスキーマを再利用
+        assert cache.get(counting, introspect).schema == first.schema
+        stats = cache.get_stats()
+        assert stats['revalidations'] == 1 and stats['introspections'] == 1
+
+
+def test_ddl_change_reintrospects():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _, conn, counting, cache, introspect = _setup(tmpdir)
+        cache.get(counting, introspect)
+        conn.execute("CREATE NODE TABLE Prize(prize_id STRING PRIMARY KEY)")
+        assert "Prize" in cache.get(counting, introspect).schema
+        assert cache.get_stats()['introspections'] == 2
+
+
+def test_column_change_reintrospects():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _, conn, counting, cache, introspect = _setup(tmpdir)
+        first = cache.get(counting, introspect)
+        conn.execute("ALTER TABLE Scholar ADD gender STRING")
+        # テーブル一覧は同じでも列が増えたらスキーマを取り直す
+        snapshot = cache.get(counting, introspect)
+        assert snapshot.ddl_fingerprint != first.ddl_fingerprint
+        assert snapshot.schema["Scholar"] == ["id", "name", "gender"]
+        stats = cache.get_stats()
+        assert stats['introspections'] == 2 and stats['revalidations'] == 0
+
+
+def test_concurrent_revalidation_uses_connection_once():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _, conn, counting, cache, introspect = _setup(tmpdir)
+        cache.get(counting, introspect)
+        conn.execute("CREATE (:Scholar {id: 1, name: 'Marie Curie'})")
+        barrier = threading.Barrier(8)
+        snapshots = []
+
+        def worker():
+            barrier.wait()
+            snapshots.append(cache.get(counting, introspect))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 管理用の接続は同時に使わず、再検証は1回だけ
+        assert counting.peak == 1
+        assert len({id(snapshot) for snapshot in snapshots}) == 1
+        assert cache.get_stats()['revalidations'] == 1
+
+
+if __name__ == "__main__":
+    test_hit_without_catalog_queries()
+    test_data_only_change_revalidates()
+    test_ddl_change_reintrospects()
+    test_column_change_reintrospects()
+    test_concurrent_revalidation_uses_connection_once()
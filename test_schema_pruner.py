@@ -0,0 +1,122 @@
+# 実行コマンド:uv run python test_schema_pruner.py
+#!/usr/bin/env python3
+from pydantic import BaseModel, Field
+
+from schema_pruner import RuleBasedSchemaPruner, pruned_schema_dict
+
+
+def _props(*names):
+    return [{"name": name, "type": "STRING"} for name in names]
+
+
+SCHEMA = {
+    "nodes": [
+        {"label": "Scholar", "properties": _props("knownName", "gender", "birthDate")},
+        {"label": "Prize", "properties": _props("category", "awardYear", "motivation")},
+        {"label": "Institution", "properties": _props("name")},
+        {"label": "City", "properties": _props("name")},
+        {"label": "Country", "properties": _props("name")},
+        {"label": "Continent", "properties": _props("name")},
+    ],
+    "edges": [
+        {"label": "WON", "from": "Scholar", "to": "Prize", "properties": _props("portion")},
+        {"label": "AFFILIATED_WITH", "from": "Scholar", "to": "Institution", "properties": []},
+        {"label": "BORN_IN", "from": "Scholar", "to": "City", "properties": []},
+        {"label": "DIED_IN", "from": "Scholar", "to": "City", "properties": []},
+        {"label": "IS_LOCATED_IN", "from": "Institution", "to": "City", "properties": []},
+        {"label": "IS_CITY_IN", "from": "City", "to": "Country", "properties": []},
+        {"label": "IS_COUNTRY_IN", "from": "Country", "to": "Continent", "properties": []},
+    ],
+}
+
+
+def _labels(result):
+    return sorted(n["label"] for n in result.schema["nodes"]), sorted(e["label"] for e in result.schema["edges"])
+
+
+def test_keyword_match():
+    pruner = RuleBasedSchemaPruner()
+    result = pruner.prune("Which female laureates won the Nobel Prize in 2020?", SCHEMA)
+    assert result.accepted and _labels(result) == (["Prize", "Scholar"], ["WON"])
+    scholar = next(n for n in result.schema["nodes"] if n["label"] == "Scholar")
+    # 名前のプロパティと質問に出てきたプロパティだけ残る
+    assert [p["name"] for p in scholar["properties"]] == ["knownName", "gender"]
+
+
+def test_path_expansion_prefers_mentioned_relationships():
+    pruner = RuleBasedSchemaPruner()
+    result = pruner.prune("Which scholars were born in Europe?", SCHEMA)
+    assert result.accepted
+    assert _labels(result) == (
+        ["City", "Continent", "Country", "Scholar"],
+        ["BORN_IN", "IS_CITY_IN", "IS_COUNTRY_IN"],
+    )
+    # リレーションが分からなければ同じ長さの経路をすべて残す
+    result = pruner.prune("Which cities are linked to scholars?", str(SCHEMA))
+    assert _labels(result) == (["City", "Scholar"], ["BORN_IN", "DIED_IN"])
+
+
+def test_nationality_means_birth_country():
+    pruner = RuleBasedSchemaPruner()
+    result = pruner.prune("Which Japanese scholars won prizes?", SCHEMA)
+    assert result.accepted
+    assert _labels(result) == (["City", "Country", "Prize", "Scholar"], ["BORN_IN", "IS_CITY_IN", "WON"])
+    # 国籍から補った born はプロパティ（birthDate）には使わない
+    scholar = next(n for n in result.schema["nodes"] if n["label"] == "Scholar")
+    assert [p["name"] for p in scholar["properties"]] == ["knownName"]
+    # 質問に出てきたリレーションがあればそちらを使う
+    result = pruner.prune("Which scholars died in a French city?", SCHEMA)
+    assert _labels(result)[1] == ["DIED_IN", "IS_CITY_IN"]
+
+
+class Property(BaseModel):
+    name: str
+    type: str
+
+
+class Node(BaseModel):
+    label: str
+    properties: list[Property] | None
+
+
+class Edge(BaseModel):
+    label: str
+    from_: Node = Field(alias="from")
+    to: Node
+    properties: list[Property] | None
+
+
+class GraphSchema(BaseModel):
+    """PruneSchema（LLM）の出力と同じ形のモデル"""
+    nodes: list[Node]
+    edges: list[Edge]
+
+
+def test_llm_and_rule_schemas_have_the_same_shape():
+    rule = RuleBasedSchemaPruner().prune("Which female laureates won the Nobel Prize in 2020?", SCHEMA).schema
+    nodes = {node["label"]: node for node in rule["nodes"]}
+    llm = GraphSchema.model_validate({
+        "nodes": rule["nodes"],
+        "edges": [{**edge, "from": nodes[edge["from"]], "to": nodes[edge["to"]]} for edge in rule["edges"]],
+    })
+    # モデル・model_dump（SQLite から戻したもの）・ルールの dict がすべて同じ形になる
+    assert pruned_schema_dict(llm) == pruned_schema_dict(llm.model_dump()) == pruned_schema_dict(rule) == rule
+
+
+def test_low_confidence_falls_back():
+    pruner = RuleBasedSchemaPruner(threshold=0.6)
+    assert not pruner.prune("What is the capital of France?", SCHEMA).accepted
+    assert not pruner.prune("List institutions in Germany", SCHEMA).accepted
+    pruner.record_llm_latency(800.0)
+    pruner.prune("Who won the prize in 1921?", SCHEMA)
+    stats = pruner.get_stats()
+    print(f"Stats: {stats}")
+    assert stats['accepted'] == 1 and stats['fallbacks'] == 2 and stats['estimated_saved_ms'] > 700
+
+
+if __name__ == "__main__":
+    test_keyword_match()
+    test_path_expansion_prefers_mentioned_relationships()
+    test_nationality_means_birth_country()
+    test_llm_and_rule_schemas_have_the_same_shape()
+    test_low_confidence_falls_back()
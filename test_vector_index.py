@@ -0,0 +1,106 @@
+# 実行コマンド:uv run python test_vector_index.py
+#!/usr/bin/env python3
+import threading
+import time
+import numpy as np
+import vector_index
+from vector_index import ExactIndex, IVFIndex, VectorIndex, benchmark, make_index, top_k
+
+
+def _clustered(n, dim=32, clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim))
+    return (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_exact_top_k():
+    data = _clustered(1000)
+    index = ExactIndex(initial_capacity=4)
+    for chunk in np.array_split(data, 7):
+        index.add(chunk)
+    assert len(index) == 1000 and np.allclose(index.vectors, data)
+    query = data[123]
+    indexes, scores = index.search(query, 5)
+    expected = np.argsort(data @ query)[::-1][:5]
+    assert indexes.tolist() == expected.tolist() and indexes[0] == 123
+    assert np.all(np.diff(scores) <= 0)
+    # k が件数より多くても全件を返す
+    assert len(top_k(np.array([0.1, 0.3]), 5)) == 2
+
+
+def test_ivf_recall_and_incremental_insert():
+    data = _clustered(6000)
+    index = IVFIndex(min_train_size=1000, nprobe=8)
+    index.add(data[:500])
+    # 学習前は全件検索
+    assert not index.get_stats()['trained']
+    assert index.search(data[10], 1)[0].tolist() == [10]
+    for chunk in np.array_split(data[500:], 20):
+        index.add(chunk)
+    stats = index.get_stats()
+    assert stats['trained'] and stats['trainings'] == 2 and stats['size'] == 6000
+    # 学習後に追加した行も見つかる
+    assert index.search(data[5999], 1)[0].tolist() == [5999]
+    result = benchmark(index, data[::60] + 0.01, k=10)
+    print(f"Benchmark: {result}")
+    assert result['recall_at_k'] >= 0.9
+
+
+def test_training_does_not_block_search():
+    data = _clustered(3000)
+    index = IVFIndex(min_train_size=1000, nprobe=8)
+    index.add(data[:999])
+    started, release = threading.Event(), threading.Event()
+    kmeans = vector_index._kmeans
+
+    def slow_kmeans(*args):
+        started.set()
+        release.wait(10)
+        return kmeans(*args)
+
+    vector_index._kmeans = slow_kmeans
+    try:
+        trainer = threading.Thread(target=index.add, args=(data[999:1000],))
+        trainer.start()
+        assert started.wait(10)
+        # k-means の途中でも検索（全件検索）と追加はすぐに返る
+        begin = time.perf_counter()
+        assert index.search(data[10], 1)[0].tolist() == [10]
+        index.add(data[1000:1500])
+        assert time.perf_counter() - begin < 1.0 and not index.get_stats()['trained']
+        release.set()
+        trainer.join(10)
+    finally:
+        vector_index._kmeans = kmeans
+    stats = index.get_stats()
+    assert stats['trained'] and stats['trainings'] == 1
+    # 学習中に追加した行も差し替えたクラスタのリストに入っている
+    assert sorted(np.concatenate(index.lists).tolist()) == list(range(1500))
+    assert index.search(data[1499], 1)[0].tolist() == [1499]
+
+
+def test_base_class_is_abstract():
+    try:
+        VectorIndex()
+        assert False, "VectorIndex.search is abstract"
+    except TypeError:
+        pass
+
+
+def test_make_index():
+    assert isinstance(make_index("exact"), ExactIndex)
+    assert isinstance(make_index("auto", min_train_size=10), IVFIndex)
+    try:
+        make_index("hnsw")
+        assert False, "unknown index type should fail"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_exact_top_k()
+    test_ivf_recall_and_incremental_insert()
+    test_training_does_not_block_search()
+    test_base_class_is_abstract()
+    test_make_index()
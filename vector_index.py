@@ -0,0 +1,364 @@
+# 仕様
+#1. ExemplarStore の類似検索用のインデックス（add で追記、search で上位 k 件の (行番号, スコア) を返す）
+#2. ExactIndex: 全件との内積 + np.argpartition で上位 k 件だけを選ぶ（全件の argsort はしない）
+#3. IVFIndex: 近似検索（NumPy だけで実装した IVF）
+#   - 件数が min_train_size 以上になったら k-means（√N 個のクラスタ）で学習し、行をクラスタごとのリストに振り分ける
+#   - 検索は質問に近い nprobe 個のクラスタの行だけと内積を取る
+#   - 学習前は ExactIndex と同じ全件検索。学習後の追加は一番近いクラスタに入れ、件数が retrain_factor 倍になったら学習し直す
+#   - k-means はロックの外でその時点の行のスナップショットに対して行い、終わったらクラスタの中心とリストをまとめて差し替える
+#     （学習中も検索・追加はブロックされない。学習中に追加された行は差し替えるときに新しいクラスタに振り分ける）
+#   - add は append（行の追加だけ）+ maybe_train（必要なら学習）。自分のロックの中で追加する呼び出し側は
+#     append だけをロックの中で行い、maybe_train はロックの外で呼ぶ（学習が呼び出し側のロックを握らない）
+#4. ベクトルは L2 正規化して保存するので、スコア（内積）はそのままコサイン類似度になる
+#   - dtype="float16" / "int8" で量子化して保存できる（float32 の 1/2 / 1/4 のメモリ）
+#   - int8 は成分 × 127 を丸めた値（正規化済みなので成分は -1〜1）
+#5. benchmark で全件検索（ExactIndex）と比べた recall@k と検索時間を測る
+#   実行コマンド:uv run python vector_index.py
+import copy
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+INT8_SCALE = 127.0
+# 量子化した行列を float32 に戻して内積を取るときの行数（一時的なメモリを抑える）
+CHUNK_ROWS = 8192
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (or a single vector) as float32; zero vectors stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex(ABC):
+    """Growable matrix of L2-normalized vectors; subclasses implement search."""
+
+    def __init__(self, initial_capacity: int = 64, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype: {dtype}")
+        self.initial_capacity = initial_capacity
+        self.dtype = dtype
+        self._matrix = np.empty((0, 0), dtype=DTYPES[dtype])
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Stored rows (quantized when dtype is not float32)."""
+        return self._matrix[:self._size]
+
+    def as_float32(self) -> np.ndarray:
+        with self._lock:
+            vectors = self.vectors
+        return self._decode(vectors)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        return vectors.astype(DTYPES[self.dtype], copy=False)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        rows = rows.astype(np.float32, copy=False)
+        return rows / INT8_SCALE if self.dtype == "int8" else rows
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Inner products of stored rows with a float32 vector (or matrix of column vectors)."""
+        if self.dtype == "float32":
+            return rows @ query
+        if len(rows) <= CHUNK_ROWS:
+            return self._decode(rows) @ query
+        return np.concatenate(
+            [self._decode(rows[i:i + CHUNK_ROWS]) @ query for i in range(0, len(rows), CHUNK_ROWS)]
+        )
+
+    def add(self, vectors: np.ndarray) -> None:
+        self.append(vectors)
+        self.maybe_train()
+
+    def append(self, vectors: np.ndarray) -> None:
+        """Add rows without training; call maybe_train afterwards, outside the caller's own locks."""
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        with self._lock:
+            start = self._size
+            self._append(self._quantize(vectors))
+            self._on_add(start, vectors)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._matrix, self._size = np.empty((0, 0), dtype=DTYPES[self.dtype]), 0
+            self._on_reset()
+
+    def empty_like(self) -> "VectorIndex":
+        """A new, empty index with the same type and settings."""
+        index = copy.copy(self)
+        index._lock = threading.Lock()
+        index.reset()
+        return index
+
+    def _append(self, vectors: np.ndarray) -> None:
+        needed = self._size + len(vectors)
+        if self._matrix.shape[1] != vectors.shape[1] or needed > len(self._matrix):
+            capacity = max(self.initial_capacity, len(self._matrix))
+            while capacity < needed:
+                capacity *= 2
+            matrix = np.empty((capacity, vectors.shape[1]), dtype=self._matrix.dtype)
+            if self._size:
+                matrix[:self._size] = self._matrix[:self._size]
+            # 検索中のスレッドは古い行列をそのまま使える
+            self._matrix = matrix
+        self._matrix[self._size:needed] = vectors
+        self._size = needed
+
+    def maybe_train(self) -> None:
+        """Train the index if enough rows were appended (no-op for indexes without training)."""
+
+    def _on_add(self, start: int, vectors: np.ndarray) -> None:
+        pass
+
+    def _on_reset(self) -> None:
+        pass
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (row indexes, cosine similarities) for query, best first."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'type': type(self).__name__, 'size': self._size, 'dtype': self.dtype, 'bytes': self.nbytes}
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k largest scores, best first, without sorting the whole array."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+class ExactIndex(VectorIndex):
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            vectors = self.vectors
+        if not len(vectors):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self._scores(vectors, normalize(np.asarray(query).reshape(-1)))
+        indexes = top_k(scores, k)
+        return indexes, scores[indexes]
+
+
+def _kmeans(vectors: np.ndarray, n_clusters: int, iterations: int, seed: int) -> np.ndarray:
+    """Spherical k-means: centroids are unit vectors, assignment is by inner product."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        # 空になったクラスタは元のままにする
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+    return centroids
+
+
+class IVFIndex(VectorIndex):
+    def __init__(
+        self,
+        initial_capacity: int = 64,
+        dtype: str = "float32",
+        min_train_size: int = 10_000,
+        n_clusters: Optional[int] = None,
+        nprobe: int = 8,
+        retrain_factor: float = 4.0,
+        kmeans_iterations: int = 10,
+        train_sample: int = 50_000,
+        seed: int = 0,
+    ):
+        super().__init__(initial_capacity, dtype)
+        self.min_train_size = min_train_size
+        self.n_clusters = n_clusters
+        self.nprobe = nprobe
+        self.retrain_factor = retrain_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample = train_sample
+        self.seed = seed
+        self._on_reset()
+
+    def _on_reset(self) -> None:
+        self.centroids: Optional[np.ndarray] = None
+        # クラスタごとの行番号（追加のたびに新しいリストに置き換えるので、検索中のリストは変わらない）
+        self.lists: List[np.ndarray] = []
+        self.trained_size = 0
+        self.trainings = 0
+        # 学習中の結果は reset より前の行のものなので、世代が変わったら捨てる
+        self._generation = getattr(self, "_generation", 0) + 1
+        self._training = False
+
+    def _fit(self, vectors: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """k-means on (a sample of) vectors; returns centroids and the row lists of vectors."""
+        n_clusters = self.n_clusters or max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(self.seed)
+        sample = vectors
+        if len(vectors) > self.train_sample:
+            sample = vectors[rng.choice(len(vectors), self.train_sample, replace=False)]
+        centroids = _kmeans(self._decode(sample), min(n_clusters, len(sample)), self.kmeans_iterations, self.seed)
+        assignment = np.argmax(self._scores(vectors, centroids.T), axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+        return centroids, [order[bounds[c]:bounds[c + 1]] for c in range(len(centroids))]
+
+    @staticmethod
+    def _extend(lists: List[np.ndarray], start: int, assignment: np.ndarray) -> List[np.ndarray]:
+        lists = list(lists)
+        for cluster in np.unique(assignment):
+            rows = start + np.flatnonzero(assignment == cluster)
+            lists[cluster] = np.concatenate([lists[cluster], rows])
+        return lists
+
+    def _on_add(self, start: int, vectors: np.ndarray) -> None:
+        # 学習済みなら一番近いクラスタに追加するだけ（学習し直すかどうかは maybe_train がロックの外で決める）
+        if self.centroids is not None:
+            self.lists = self._extend(self.lists, start, np.argmax(vectors @ self.centroids.T, axis=1))
+
+    def maybe_train(self) -> None:
+        with self._lock:
+            if self._training or self._size < self.min_train_size:
+                return
+            if self.centroids is not None and self._size < self.trained_size * self.retrain_factor:
+                return
+            self._training = True
+            # 先頭 n 行は書き換えられない（追加は末尾、行列を広げるときは新しい行列を作る）
+            vectors, generation = self.vectors, self._generation
+        try:
+            centroids, lists = self._fit(vectors)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                # 学習中に追加された行を新しいクラスタに振り分けてから差し替える
+                n = len(vectors)
+                added = self._matrix[n:self._size]
+                if len(added):
+                    lists = self._extend(lists, n, np.argmax(self._scores(added, centroids.T), axis=1))
+                self.centroids, self.lists = centroids, lists
+                self.trained_size = n
+                self.trainings += 1
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._training = False
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            vectors, centroids, lists = self.vectors, self.centroids, self.lists
+        query = normalize(np.asarray(query).reshape(-1))
+        if centroids is None:
+            if not len(vectors):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            scores = self._scores(vectors, query)
+            indexes = top_k(scores, k)
+            return indexes, scores[indexes]
+        probes = top_k(centroids @ query, self.nprobe)
+        candidates = np.concatenate([lists[c] for c in probes])
+        if not len(candidates):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self._scores(vectors[candidates], query)
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [len(l) for l in self.lists]
+            return {
+                'type': type(self).__name__,
+                'size': self._size,
+                'dtype': self.dtype,
+                'bytes': self.nbytes,
+                'trained': self.centroids is not None,
+                'clusters': len(sizes),
+                'nprobe': self.nprobe,
+                'max_list_size': max(sizes) if sizes else 0,
+                'trainings': self.trainings,
+            }
+
+
+def make_index(kind: str = "auto", **kwargs) -> VectorIndex:
+    """'exact' → ExactIndex, 'ivf' → IVFIndex, 'auto' → IVFIndex that stays exact until min_train_size rows."""
+    if kind == "exact":
+        return ExactIndex(**kwargs)
+    if kind in ("ivf", "auto"):
+        return IVFIndex(**kwargs)
+    raise ValueError(f"Unknown index type: {kind}")
+
+
+def benchmark(index: VectorIndex, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """Recall@k and latency of index compared with exact search over the same vectors."""
+    exact = ExactIndex()
+    exact.add(index.as_float32())
+    recall, exact_ms, index_ms = 0.0, 0.0, 0.0
+    for query in queries:
+        start = time.perf_counter()
+        expected, _ = exact.search(query, k)
+        exact_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        found, _ = index.search(query, k)
+        index_ms += (time.perf_counter() - start) * 1000
+        recall += len(set(expected.tolist()) & set(found.tolist())) / max(len(expected), 1)
+    n = max(len(queries), 1)
+    return {
+        'recall_at_k': recall / n,
+        'exact_ms': exact_ms / n,
+        'index_ms': index_ms / n,
+        'speedup': exact_ms / index_ms if index_ms else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # 埋め込みに近い分布（クラスタのある単位ベクトル）で測る
+    rng = np.random.default_rng(0)
+    dim, n, n_queries = 384, 50_000, 200
+    centers = rng.normal(size=(500, dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), n)] + 1.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries = data[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+
+    start = time.perf_counter()
+    index = IVFIndex(min_train_size=1_000)
+    # 逐次追加（学習済みになってからはクラスタに振り分けるだけ）
+    for chunk in np.array_split(data, 50):
+        index.add(chunk)
+    print(f"Time taken for building IVFIndex: {(time.perf_counter() - start) * 1000:.2f} milliseconds")
+    print(index.get_stats())
+    for nprobe in (1, 4, 8, 16):
+        index.nprobe = nprobe
+        result = benchmark(index, queries, k=10)
+        print(
+            f"nprobe={nprobe}: recall@10={result['recall_at_k']:.3f}, "
+            f"exact {result['exact_ms']:.2f} milliseconds, ivf {result['index_ms']:.2f} milliseconds, "
+            f"speedup x{result['speedup']:.1f}"
+        )
+    # 量子化した全件検索（メモリと recall）
+    for dtype in ("float32", "float16", "int8"):
+        quantized = ExactIndex(dtype=dtype)
+        quantized.add(data)
+        result = benchmark(quantized, queries, k=10)
+        print(
+            f"{dtype}: {quantized.nbytes / len(quantized):.0f} bytes/vector, "
+            f"recall@10={result['recall_at_k']:.3f}, {result['index_ms']:.2f} milliseconds"
+        )